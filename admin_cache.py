@@ -0,0 +1,79 @@
+"""Кэш прав администраторов групп"""
+import asyncio
+import logging
+import time
+
+
+def can_manage_requests(member):
+    """Может ли участник принимать заявки: создатель или админ с правом приглашать"""
+    return member.is_chat_creator() or (member.is_chat_admin() and bool(getattr(member, "can_invite_users", False)))
+
+
+class AdminCache:
+    """Множество админов каждой группы с временем жизни ttl.
+
+    Проверка на горячем пути не ходит в Bot API: устаревшие данные
+    (но не старше max_stale) отдаются сразу, а обновление запускается в
+    фоне. Одновременные запросы к одной группе ждут одну общую загрузку.
+    Ожидание на горячем пути возможно только для группы без данных в кэше.
+    """
+
+    def __init__(self, fetch, ttl=300, max_stale=3600, clock=time.monotonic):
+        self.fetch = fetch          # async fetch(chat_id) -> список ChatMember
+        self.ttl = ttl
+        self.max_stale = max_stale
+        self._clock = clock
+        self._entries = {}          # chat_id -> (set user_id, время загрузки)
+        self._inflight = {}         # chat_id -> future текущей загрузки
+
+    async def is_admin(self, chat_id, user_id):
+        entry = self._entries.get(chat_id)
+        if entry is not None:
+            age = self._clock() - entry[1]
+            if age > self.ttl:
+                self.refresh_soon(chat_id)
+            if age <= self.max_stale:
+                return user_id in entry[0]
+
+        admins = await self.refresh(chat_id)
+        return user_id in admins
+
+    def refresh_soon(self, chat_id):
+        """Запустить фоновое обновление, если оно ещё не идёт"""
+        if chat_id not in self._inflight:
+            asyncio.create_task(self._refresh_quietly(chat_id))
+
+    async def _refresh_quietly(self, chat_id):
+        try:
+            await self.refresh(chat_id)
+        except Exception as e:
+            logging.warning(f"Не удалось обновить админов группы {chat_id}: {e}")
+
+    async def refresh(self, chat_id):
+        """Загрузить админов группы (одна загрузка на все одновременные вызовы)"""
+        future = self._inflight.get(chat_id)
+        if future is None:
+            future = self._inflight[chat_id] = asyncio.ensure_future(self._load(chat_id))
+            future.add_done_callback(lambda _: self._inflight.pop(chat_id, None))
+        return await asyncio.shield(future)
+
+    async def _load(self, chat_id):
+        members = await self.fetch(chat_id)
+        admins = {m.user.id for m in members if can_manage_requests(m)}
+        self._entries[chat_id] = (admins, self._clock())
+        return admins
+
+    def apply_member_update(self, chat_id, member):
+        """Учесть изменение прав участника из chat_member без повторной загрузки"""
+        entry = self._entries.get(chat_id)
+        if entry is None:
+            return
+        if can_manage_requests(member):
+            entry[0].add(member.user.id)
+        else:
+            entry[0].discard(member.user.id)
+
+    def invalidate(self, chat_id):
+        """Сбросить данные группы и загрузить их заново в фоне"""
+        self._entries.pop(chat_id, None)
+        self.refresh_soon(chat_id)
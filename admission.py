@@ -0,0 +1,223 @@
+"""Допуск заявок при наплыве: скользящие окна по группам и пользователям и режим рейда"""
+import asyncio
+import logging
+import time
+from collections import OrderedDict
+
+# Решения admit()
+ADMIT = "admit"         # Обычная заявка: в очередь и уведомление админам
+QUIET = "quiet"         # Рейд: в очередь без уведомления
+OVERFLOW = "overflow"   # Рейд и очередь группы полна: заявка отклоняется
+SHED = "shed"           # Пользователь шлёт заявки чаще user_limit: отбрасывается без ответа
+
+
+class SlidingWindow:
+    """Счётчик событий за последние window секунд в постоянной памяти.
+
+    Хранит только текущее и предыдущее окно; предыдущее учитывается с весом
+    той его доли, которая ещё попадает в скользящее окно.
+    """
+
+    __slots__ = ("window", "start", "current", "previous")
+
+    def __init__(self, window, now):
+        self.window = window
+        self.start = now
+        self.current = 0
+        self.previous = 0
+
+    def _advance(self, now):
+        elapsed = now - self.start
+        if elapsed >= self.window:
+            # Пропущено больше одного окна - предыдущее уже пустое
+            self.previous = self.current if elapsed < 2 * self.window else 0
+            self.current = 0
+            self.start = now - elapsed % self.window
+        return (now - self.start) / self.window
+
+    def add(self, now):
+        self._advance(now)
+        self.current += 1
+        return self.count(now)
+
+    def count(self, now):
+        fraction = self._advance(now)
+        return self.current + self.previous * (1 - fraction)
+
+
+class _GroupState:
+    """Окно заявок группы, режим рейда и счётчики"""
+
+    def __init__(self, window, now):
+        self.requests = SlidingWindow(window, now)
+        self.raid_since = None
+        self.calm_since = None
+        self.last_joinlist = None
+        self.counts = {ADMIT: 0, QUIET: 0, OVERFLOW: 0, SHED: 0}
+        self.raid_counts = None     # Счётчики текущего рейда (для отчёта по его окончании)
+
+
+class AdmissionControl:
+    """Что делать с очередной заявкой, пока группу заваливают заявками.
+
+    Заявки группы считаются скользящим окном window секунд. Больше
+    threshold заявок за окно - группа переходит в режим рейда: заявки
+    копятся без уведомлений (QUIET), а когда в очереди группы уже
+    max_pending заявок, новые отклоняются (OVERFLOW); /joinlist
+    отвечает не чаще раза в joinlist_cooldown секунд. Рейд заканчивается
+    сам, когда поток падает ниже половины threshold и держится так
+    recovery секунд (проверка раз в секунду, см. start()).
+
+    Пользователь, приславший больше user_limit заявок за окно (вступил -
+    отозвал - снова), отбрасывается (SHED) в любом режиме. Окна
+    пользователей хранятся не больше чем для max_users последних.
+
+    on_change(group_id, raid, counts) вызывается при входе в рейд и выходе
+    из него; counts - счётчики решений за рейд.
+    """
+
+    def __init__(self, threshold=100, window=60.0, user_limit=3, max_pending=1000, recovery=120.0,
+                 joinlist_cooldown=30.0, max_users=100000, on_change=None, clock=time.monotonic):
+        self.threshold = threshold
+        self.window = window
+        self.user_limit = user_limit
+        self.max_pending = max_pending
+        self.recovery = recovery
+        self.joinlist_cooldown = joinlist_cooldown
+        self.max_users = max_users
+        self.on_change = on_change
+        self._clock = clock
+        self._groups = {}               # group_id -> _GroupState
+        self._users = OrderedDict()     # (group_id, user_id) -> SlidingWindow, самые старые в начале
+        self._task = None
+        self._notifications = set()
+        self.raids = 0
+
+    def _group(self, group_id, now):
+        state = self._groups.get(group_id)
+        if state is None:
+            state = self._groups[group_id] = _GroupState(self.window, now)
+        return state
+
+    def _user_count(self, key, now):
+        users = self._users
+        counter = users.get(key)
+        if counter is None:
+            counter = users[key] = SlidingWindow(self.window, now)
+            # Сначала выбрасываем тех, кто молчит дольше двух окон, затем - самых старых сверх лимита
+            while users:
+                oldest_key, oldest = next(iter(users.items()))
+                if len(users) <= self.max_users and now - oldest.start < 2 * self.window:
+                    break
+                del users[oldest_key]
+        else:
+            users.move_to_end(key)
+        return counter.add(now)
+
+    def admit(self, group_id, user_id, pending):
+        """Решение по новой заявке; pending - заявок группы в очереди сейчас"""
+        if not self.threshold:
+            return ADMIT
+        now = self._clock()
+        state = self._group(group_id, now)
+        rate = state.requests.add(now)
+        if self.user_limit and self._user_count((group_id, user_id), now) > self.user_limit:
+            decision = SHED
+        else:
+            if state.raid_since is None and rate > self.threshold:
+                self._enter(group_id, state, now, rate)
+            if state.raid_since is None:
+                decision = ADMIT
+            elif self.max_pending and pending >= self.max_pending:
+                decision = OVERFLOW
+            else:
+                decision = QUIET
+        state.counts[decision] += 1
+        if state.raid_counts is not None:
+            state.raid_counts[decision] += 1
+        return decision
+
+    def in_raid(self, group_id):
+        state = self._groups.get(group_id)
+        return state is not None and state.raid_since is not None
+
+    def joinlist_allowed(self, group_id):
+        """Можно ли сейчас ответить на /joinlist (во время рейда - не чаще раза в joinlist_cooldown)"""
+        state = self._groups.get(group_id)
+        if state is None or state.raid_since is None:
+            return True
+        now = self._clock()
+        if state.last_joinlist is not None and now - state.last_joinlist < self.joinlist_cooldown:
+            return False
+        state.last_joinlist = now
+        return True
+
+    def _enter(self, group_id, state, now, rate):
+        state.raid_since = now
+        state.calm_since = None
+        state.raid_counts = {ADMIT: 0, QUIET: 0, OVERFLOW: 0, SHED: 0}
+        self.raids += 1
+        logging.warning(f"Рейд в группе {group_id}: {rate:.0f} заявок за {self.window:.0f} с")
+        self._notify(group_id, True, state.raid_counts)
+
+    def check(self):
+        """Завершить рейды, которые утихли (вызывается раз в секунду из start())"""
+        now = self._clock()
+        for group_id, state in self._groups.items():
+            if state.raid_since is None:
+                continue
+            if state.requests.count(now) >= self.threshold / 2:
+                state.calm_since = None
+                continue
+            if state.calm_since is None:
+                state.calm_since = now
+            elif now - state.calm_since >= self.recovery:
+                counts, state.raid_counts = state.raid_counts, None
+                state.raid_since = state.calm_since = state.last_joinlist = None
+                logging.info(f"Рейд в группе {group_id} закончился: {counts}")
+                self._notify(group_id, False, counts)
+
+    def _notify(self, group_id, raid, counts):
+        if self.on_change is None:
+            return
+        try:
+            result = self.on_change(group_id, raid, counts)
+            if asyncio.iscoroutine(result):
+                task = asyncio.create_task(result)
+                self._notifications.add(task)
+                task.add_done_callback(self._notifications.discard)
+        except Exception as e:
+            logging.error(f"Ошибка уведомления о рейде в группе {group_id}: {e}")
+
+    def start(self, interval=1.0):
+        if self._task is None and self.threshold:
+            self._task = asyncio.create_task(self._check_loop(interval))
+
+    async def _check_loop(self, interval):
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                self.check()
+            except Exception as e:
+                logging.error(f"Ошибка проверки рейдов: {e}")
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            self._task = None
+
+    def counts(self):
+        """Решения по всем группам: {решение: количество}"""
+        total = {ADMIT: 0, QUIET: 0, OVERFLOW: 0, SHED: 0}
+        for state in self._groups.values():
+            for decision, count in state.counts.items():
+                total[decision] += count
+        return total
+
+    def stats(self):
+        return {
+            **self.counts(),
+            "raids": self.raids,
+            "raid_groups": [str(group_id) for group_id, state in self._groups.items() if state.raid_since is not None],
+            "tracked_users": len(self._users),
+        }
@@ -0,0 +1,316 @@
+"""Журнал решений по заявкам (JSON Lines) и статистика модерации, которая ведётся по ходу записи"""
+import asyncio
+import glob
+import gzip
+import json
+import logging
+import os
+import shutil
+import time
+from bisect import bisect_left
+from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
+
+# События журнала
+EVENT_REQUEST = "request"
+EVENT_APPROVE = "approve"
+EVENT_IGNORE = "ignore"
+EVENT_EXPIRE = "expire"
+EVENT_EVICT = "evict"
+EVENT_AUTO_APPROVE = "auto_approve"
+EVENT_AUTO_DECLINE = "auto_decline"
+EVENT_RAID_SHED = "raid_shed"     # Сверх очереди рейда, а очередь отклонений полна: заявка оставлена без ответа
+DECISIONS = (EVENT_APPROVE, EVENT_IGNORE)
+
+# Границы корзин времени до решения, секунды (от 5 секунд до недели)
+WAIT_BUCKETS = (5, 10, 30, 60, 120, 300, 600, 900, 1800, 3600, 2 * 3600, 3 * 3600, 6 * 3600, 12 * 3600,
+                86400, 2 * 86400, 7 * 86400)
+HOURS = 24
+
+
+def _percentile(counts, total, q):
+    """Оценка перцентиля по корзинам (линейно внутри корзины)"""
+    rank = q * total
+    seen = 0
+    lower = 0
+    for index, count in enumerate(counts):
+        upper = WAIT_BUCKETS[index] if index < len(WAIT_BUCKETS) else lower * 2
+        if count and seen + count >= rank:
+            return round(lower + (upper - lower) * (rank - seen) / count)
+        seen += count
+        lower = upper
+    return round(lower)
+
+
+class GroupStats:
+    """Агрегаты одной группы. Каждое событие меняет несколько счётчиков,
+    чтение не зависит от длины истории."""
+
+    def __init__(self):
+        self.events = {}
+        self.admins = {}                        # admin_id -> {"username", "approve", "ignore"}
+        self.waits = [0] * (len(WAIT_BUCKETS) + 1)
+        self.wait_sum = 0.0
+        # Кольцо почасовых счётчиков заявок: слот - номер часа по модулю HOURS
+        self.hour_ids = [-1] * HOURS
+        self.hour_counts = [0] * HOURS
+
+    def apply(self, record):
+        event = record["event"]
+        self.events[event] = self.events.get(event, 0) + 1
+
+        if event == EVENT_REQUEST:
+            hour = int(record["ts"] // 3600)
+            slot = hour % HOURS
+            if self.hour_ids[slot] != hour:
+                self.hour_ids[slot] = hour
+                self.hour_counts[slot] = 0
+            self.hour_counts[slot] += 1
+        elif event in DECISIONS:
+            admin = self.admins.get(record["admin"])
+            if admin is None:
+                admin = self.admins[record["admin"]] = {"username": None, EVENT_APPROVE: 0, EVENT_IGNORE: 0}
+            admin["username"] = record.get("admin_username") or admin["username"]
+            admin[event] += 1
+            wait = max(record.get("wait", 0), 0)
+            self.waits[bisect_left(WAIT_BUCKETS, wait)] += 1
+            self.wait_sum += wait
+
+    def summary(self, now):
+        decided = sum(self.waits)
+        hour = int(now // 3600)
+        # Заявки за последние HOURS часов, от старых к новым
+        rates = [self.hour_counts[h % HOURS] if self.hour_ids[h % HOURS] == h else 0
+                 for h in range(hour - HOURS + 1, hour + 1)]
+        admins = sorted(self.admins.items(), key=lambda item: -(item[1][EVENT_APPROVE] + item[1][EVENT_IGNORE]))
+        return {
+            "events": dict(self.events),
+            "admins": [{"id": admin_id, **counts} for admin_id, counts in admins],
+            "decision_seconds": {
+                "count": decided,
+                "avg": round(self.wait_sum / decided) if decided else 0,
+                "p50": _percentile(self.waits, decided, 0.5) if decided else 0,
+                "p90": _percentile(self.waits, decided, 0.9) if decided else 0,
+                "p99": _percentile(self.waits, decided, 0.99) if decided else 0,
+            },
+            "requests_last_hour": rates[-1],
+            "requests_per_hour": rates,
+        }
+
+    def to_dict(self):
+        return {
+            "events": dict(self.events),
+            "admins": {str(admin_id): dict(counts) for admin_id, counts in self.admins.items()},
+            "waits": list(self.waits),
+            "wait_sum": self.wait_sum,
+            "hour_ids": list(self.hour_ids),
+            "hour_counts": list(self.hour_counts),
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        stats = cls()
+        stats.events = data["events"]
+        stats.admins = {int(admin_id): counts for admin_id, counts in data["admins"].items()}
+        if len(data["waits"]) == len(stats.waits):
+            stats.waits = data["waits"]
+            stats.wait_sum = data["wait_sum"]
+        stats.hour_ids = data["hour_ids"]
+        stats.hour_counts = data["hour_counts"]
+        return stats
+
+
+class AuditLog:
+    """Журнал заявок и решений в файле JSON Lines с ротацией и сжатием.
+
+    record() только добавляет строку в буфер и обновляет агрегаты (groups),
+    на диск буфер пишет фоновая задача раз в flush_interval секунд в
+    отдельном потоке. Файл больше max_bytes сжимается в path.<время>.gz,
+    хранятся последние backups таких архивов. Агрегаты сохраняются рядом
+    (path.stats.json) при каждой записи и загружаются при запуске; если
+    их нет, они один раз пересчитываются по журналу. path=None - журнал
+    не пишется, статистика ведётся только в памяти.
+    """
+
+    def __init__(self, path, max_bytes=10 * 1024 * 1024, backups=10, flush_interval=1.0, clock=time.time):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.backups = backups
+        self.flush_interval = flush_interval
+        self._clock = clock
+        self.groups = {}        # group_id -> GroupStats
+        self.records = 0
+        self._pending = []
+        self._dirty = asyncio.Event()
+        self._task = None
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="audit")
+        if path:
+            self._load()
+
+    @property
+    def stats_path(self):
+        return self.path + ".stats.json"
+
+    def _load(self):
+        try:
+            with open(self.stats_path, encoding="utf-8") as file:
+                data = json.load(file)
+            self.records = data["records"]
+            self.groups = {int(group_id): GroupStats.from_dict(stats) for group_id, stats in data["groups"].items()}
+            return
+        except FileNotFoundError:
+            pass
+        except Exception as e:
+            logging.warning(f"Не удалось загрузить статистику журнала, пересчитываю: {e}")
+            self.records = 0
+            self.groups = {}
+
+        # Снимка нет - один раз проходим по архивам и текущему файлу
+        for name in sorted(glob.glob(glob.escape(self.path) + ".*.gz")) + [self.path]:
+            try:
+                with (gzip.open(name, "rt", encoding="utf-8") if name.endswith(".gz")
+                      else open(name, encoding="utf-8")) as file:
+                    for line in file:
+                        if line.strip():
+                            self._apply(json.loads(line))
+            except FileNotFoundError:
+                pass
+            except Exception as e:
+                logging.warning(f"Ошибка чтения журнала {name}: {e}")
+
+    def _apply(self, record):
+        stats = self.groups.get(record["group"])
+        if stats is None:
+            stats = self.groups[record["group"]] = GroupStats()
+        stats.apply(record)
+        self.records += 1
+
+    def record(self, event, group_id, entry, admin=None, **fields):
+        """Записать событие по заявке entry (JoinRequest); admin - aiogram User, принявший решение,
+        fields - дополнительные поля записи (например, сработавшее правило автомодерации)"""
+        now = self._clock()
+        record = {
+            "ts": round(now, 3),
+            "event": event,
+            "group": group_id,
+            "user": entry.user_id,
+            "username": entry.username,
+            "requested_at": round(entry.created_at, 3),
+        }
+        if admin is not None:
+            record["admin"] = admin.id
+            record["admin_username"] = admin.username
+        if event != EVENT_REQUEST:
+            record["wait"] = round(now - entry.created_at, 3)
+        record.update(fields)
+        self._apply(record)
+        if self.path:
+            self._pending.append(json.dumps(record, ensure_ascii=False))
+            self._dirty.set()
+
+    def summary(self, group_id=None):
+        """Статистика группы (или всех групп) из готовых агрегатов"""
+        now = self._clock()
+        if group_id is not None:
+            stats = self.groups.get(group_id)
+            return (stats or GroupStats()).summary(now)
+        return {
+            "records": self.records,
+            "groups": {str(group_id): stats.summary(now) for group_id, stats in self.groups.items()},
+        }
+
+    def _write(self, lines, snapshot):
+        """Дописать строки, при необходимости сжать файл и сохранить агрегаты (в потоке записи)"""
+        with open(self.path, "a", encoding="utf-8") as file:
+            file.write("\n".join(lines) + "\n")
+            size = file.tell()
+        if size >= self.max_bytes:
+            self._rotate()
+        temp = self.stats_path + ".tmp"
+        with open(temp, "w", encoding="utf-8") as file:
+            json.dump(snapshot, file)
+        os.replace(temp, self.stats_path)
+
+    def _rotate(self):
+        # Микросекунды в имени: при всплеске записей файл может заполниться чаще раза в секунду
+        archive = f"{self.path}.{datetime.now().strftime('%Y%m%d-%H%M%S-%f')}.gz"
+        with open(self.path, "rb") as source, gzip.open(archive, "wb") as target:
+            shutil.copyfileobj(source, target)
+        os.remove(self.path)
+        archives = sorted(glob.glob(glob.escape(self.path) + ".*.gz"))
+        for name in archives[:-self.backups] if self.backups else archives:
+            os.remove(name)
+        logging.info(f"Журнал заявок сжат в {archive}")
+
+    async def start(self):
+        if self.path and self._task is None:
+            self._task = asyncio.create_task(self._flush_loop())
+
+    async def _flush_loop(self):
+        while True:
+            await self._dirty.wait()
+            await asyncio.sleep(self.flush_interval)
+            try:
+                await self.flush()
+            except Exception as e:
+                logging.error(f"Ошибка записи журнала заявок: {e}")
+
+    async def flush(self):
+        """Записать накопленные строки"""
+        if not self._pending:
+            return
+        lines, self._pending = self._pending, []
+        self._dirty.clear()
+        snapshot = {
+            "records": self.records,
+            "groups": {str(group_id): stats.to_dict() for group_id, stats in self.groups.items()},
+        }
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(self._executor, self._write, lines, snapshot)
+
+    async def close(self):
+        if self._task:
+            self._task.cancel()
+            self._task = None
+        await self.flush()
+        self._executor.shutdown(wait=True)
+
+
+def _duration(seconds):
+    if seconds < 60:
+        return f"{seconds} с"
+    if seconds < 3600:
+        return f"{seconds // 60} мин"
+    if seconds < 86400:
+        return f"{seconds / 3600:.1f} ч"
+    return f"{seconds / 86400:.1f} дн"
+
+
+def summary_text(summary, top_admins=10):
+    """Текст ответа на /stats по статистике группы (GroupStats.summary)"""
+    events = summary["events"]
+    waits = summary["decision_seconds"]
+    lines = [
+        "📊 <b>Статистика заявок</b>",
+        f"📥 Заявок: {events.get(EVENT_REQUEST, 0)} "
+        f"(за час: {summary['requests_last_hour']}, за сутки: {sum(summary['requests_per_hour'])})",
+        f"✅ Принято: {events.get(EVENT_APPROVE, 0)}, ❌ проигнорировано: {events.get(EVENT_IGNORE, 0)}, "
+        f"⌛ истекло: {events.get(EVENT_EXPIRE, 0)}, вытеснено: {events.get(EVENT_EVICT, 0)}",
+    ]
+    if events.get(EVENT_AUTO_APPROVE) or events.get(EVENT_AUTO_DECLINE):
+        lines.append(
+            f"🤖 Автоматически: ✅ {events.get(EVENT_AUTO_APPROVE, 0)}, ⛔ {events.get(EVENT_AUTO_DECLINE, 0)}"
+        )
+    if events.get(EVENT_RAID_SHED):
+        lines.append(f"🚨 Оставлено без ответа при наплыве: {events[EVENT_RAID_SHED]}")
+    if waits["count"]:
+        lines.append(
+            f"⏱ До решения: медиана {_duration(waits['p50'])}, "
+            f"p90 {_duration(waits['p90'])}, p99 {_duration(waits['p99'])}"
+        )
+    if summary["admins"]:
+        lines.append("👨‍💼 Админы:")
+        for admin in summary["admins"][:top_admins]:
+            name = f"@{admin['username']}" if admin["username"] else f"ID {admin['id']}"
+            lines.append(f"  {name}: ✅ {admin[EVENT_APPROVE]} / ❌ {admin[EVENT_IGNORE]}")
+    return "\n".join(lines)
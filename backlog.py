@@ -0,0 +1,128 @@
+"""Разбор обновлений, накопившихся пока бот был выключен (вместо skip_updates)"""
+import asyncio
+import logging
+import time
+
+from aiogram import Bot, Dispatcher
+
+
+class BacklogDrainer:
+    """Забирает очередь обновлений пачками через getUpdates и обрабатывает её сжато.
+
+    Заявки на вступление обрабатываются первыми и параллельно (повтор
+    заявки того же пользователя схлопывается). Затем изменения участников
+    (последнее на пользователя), прочие сообщения, нажатия кнопок (повторы
+    одной кнопки схлопываются, навигация - drop_callback - отбрасывается)
+    и в конце только последняя /joinlist в каждой группе - список
+    покажет уже итоговое состояние. С pipeline (см. update_pipeline.py)
+    внутри этапа обновления одного чата идут по порядку.
+    """
+
+    def __init__(self, dispatcher, allowed_updates=None, batch_size=100, concurrency=200, drop_callback=None,
+                 pipeline=None):
+        self.dispatcher = dispatcher
+        self.pipeline = pipeline
+        self.allowed_updates = allowed_updates
+        self.batch_size = batch_size
+        self.concurrency = concurrency
+        self.drop_callback = drop_callback
+        self.stats = {}
+
+    async def fetch(self):
+        """Все накопившиеся обновления. Каждый следующий запрос подтверждает предыдущую пачку."""
+        bot = self.dispatcher.bot
+        updates = []
+        offset = None
+        while True:
+            batch = await bot.get_updates(offset=offset, limit=self.batch_size, timeout=0,
+                                          allowed_updates=self.allowed_updates)
+            if not batch:
+                return updates
+            updates.extend(batch)
+            offset = batch[-1].update_id + 1
+
+    def plan(self, updates):
+        """Разложить обновления по этапам. Возвращает (этапы, схлопнуто, отброшено)."""
+        join_requests = {}
+        members = {}
+        messages = []
+        callbacks = {}
+        joinlists = {}
+        merged = dropped = 0
+
+        for update in updates:
+            if update.chat_join_request:
+                request = update.chat_join_request
+                key = (request.chat.id, request.from_user.id)
+                merged += key in join_requests
+                join_requests[key] = update
+            elif update.chat_member or update.my_chat_member:
+                member = update.chat_member or update.my_chat_member
+                key = (member.chat.id, member.new_chat_member.user.id)
+                merged += key in members
+                members[key] = update
+            elif update.callback_query:
+                query = update.callback_query
+                message = query.message
+                key = (query.data, message.chat.id if message else None, message.message_id if message else None)
+                if self.drop_callback and self.drop_callback(query):
+                    dropped += 1
+                elif key in callbacks:
+                    merged += 1
+                else:
+                    callbacks[key] = update
+            elif update.message and update.message.get_command(pure=True) == "joinlist":
+                merged += update.message.chat.id in joinlists
+                joinlists[update.message.chat.id] = update
+            else:
+                messages.append(update)
+
+        stages = [list(join_requests.values()), list(members.values()), messages,
+                  list(callbacks.values()), list(joinlists.values())]
+        return stages, merged, dropped
+
+    async def _process(self, update):
+        if self.pipeline is not None:
+            # Порядок внутри чата и ошибки обработчиков - забота очередей
+            return await self.pipeline.process(update)
+        try:
+            await self.dispatcher.process_updates([update])
+            return True
+        except Exception as e:
+            logging.error(f"Ошибка обработки накопившегося обновления {update.update_id}: {e}")
+            return False
+
+    async def drain(self):
+        """Забрать и обработать очередь. Возвращает статистику."""
+        Bot.set_current(self.dispatcher.bot)
+        Dispatcher.set_current(self.dispatcher)
+        started = time.perf_counter()
+
+        # getUpdates не работает при установленном webhook; очередь при этом сохраняется
+        await self.dispatcher.bot.delete_webhook(drop_pending_updates=False)
+        updates = await self.fetch()
+        fetched = time.perf_counter()
+
+        stages, merged, dropped = self.plan(updates)
+        processed = errors = 0
+        for stage in stages:
+            for start in range(0, len(stage), self.concurrency):
+                results = await asyncio.gather(*(self._process(u) for u in stage[start:start + self.concurrency]))
+                processed += sum(results)
+                errors += len(results) - sum(results)
+
+        self.stats = {
+            "fetched": len(updates),
+            "processed": processed,
+            "merged": merged,
+            "dropped": dropped,
+            "errors": errors,
+            "fetch_seconds": round(fetched - started, 3),
+            "total_seconds": round(time.perf_counter() - started, 3),
+        }
+        logging.info(
+            f"Накопившиеся обновления разобраны за {self.stats['total_seconds']} с: "
+            f"получено {len(updates)}, обработано {processed}, схлопнуто {merged}, "
+            f"отброшено {dropped}, ошибок {errors}"
+        )
+        return self.stats
@@ -0,0 +1,92 @@
+"""Разбор очереди обновлений, накопившейся за время простоя
+
+Кладёт в FakeBotAPI очередь getUpdates: волну заявок (с повторами),
+повторные /joinlist, переходы по страницам и повторные нажатия «Принять»,
+после чего бот разбирает её через main.backlog. Печатает статистику
+разбора и проверяет, что ни одна заявка не потерялась.
+
+Запуск: python bench/backlog_drain.py [количество_заявок]
+"""
+import asyncio
+import os
+import random
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from fake_api import FakeBotAPI
+from load_test import ADMIN_ID, GROUP_ID, callback, command, join_request
+
+from callbacks import ACCEPT, PAGE
+
+
+async def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 5000
+
+    fake = FakeBotAPI(admin_ids=(ADMIN_ID,))
+    os.environ.update({
+        "BOT_TOKEN": "123456:backlog",
+        "GROUP_1_ID": str(GROUP_ID), "GROUP_1_THREAD": "10",
+        "STATE_BACKEND": "memory",
+        "AUDIT_LOG": "",
+        "TELEGRAM_API_URL": await fake.start(),
+        "JOIN_REQUEST_MAX": str(count * 2),
+        # Проверяется разбор очереди, а не допуск: весь backlog должен дойти до /joinlist
+        "RAID_THRESHOLD": "0",
+        "OUTBOUND_GLOBAL_RATE": "100000",
+        "OUTBOUND_CHAT_RATE": "6000000",
+    })
+    import main as bot_main
+
+    token = bot_main.callbacks.token
+    rng = random.Random(1)
+    updates = []
+
+    def add(update_factory, *args):
+        updates.append(update_factory(len(updates) + 1, *args))
+
+    users = list(range(200000, 200000 + count))
+    for user_id in users:
+        add(join_request, user_id)
+    # Пользователи, которые подали заявку повторно
+    for user_id in rng.sample(users, count // 20):
+        add(join_request, user_id)
+    # Админы несколько раз звали список и листали его
+    for _ in range(20):
+        add(command, "/joinlist")
+        add(callback, token(PAGE, GROUP_ID, rng.randrange(10), ""))
+    # Нажатия «Принять», часть из них - двойные
+    accepted = rng.sample(users, count // 10)
+    for user_id in accepted:
+        add(callback, token(ACCEPT, user_id, GROUP_ID))
+        if rng.random() < 0.3:
+            add(callback, token(ACCEPT, user_id, GROUP_ID))
+    fake.feed(updates)
+
+    await bot_main.on_startup(bot_main.dp)
+    started = time.perf_counter()
+    stats = await bot_main.backlog.drain()
+    # Очередь исходящих тоже должна разойтись
+    while sum(bot_main.outbox.depth()):
+        await asyncio.sleep(0.05)
+    total = time.perf_counter() - started
+
+    await bot_main.on_shutdown(bot_main.dp)
+    await (await bot_main.bot.get_session()).close()
+    await fake.stop()
+
+    print(f"Обновлений в очереди: {len(updates)}")
+    print(f"Статистика разбора: {stats}")
+    print(f"Вместе с исходящими: {total:.2f} с ({len(updates) / total:.0f} обновлений/с)")
+    print(f"Вызовы Bot API: {dict(fake.calls)}")
+    pending = bot_main.join_requests.count(GROUP_ID)
+    print(f"Заявок в очереди: {pending}, принято: {fake.calls['approveChatJoinRequest']}")
+    assert pending == count - len(accepted), pending
+    assert fake.calls["approveChatJoinRequest"] == len(accepted)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
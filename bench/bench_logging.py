@@ -0,0 +1,100 @@
+"""Задержки цикла событий из-за логирования: basicConfig против logs.setup_logging
+
+Имитирует рейд: обработчики заявок пишут по строке лога на каждую заявку,
+а stderr медленный (терминал, pipe в журнал контейнера) - запись одной
+строки занимает write_ms миллисекунд. Параллельно сторож каждую
+миллисекунду проверяет, на сколько опоздал цикл событий. Печатает
+время обработки и задержки цикла (p50/p99/max) для обоих вариантов.
+
+Запуск: python bench/bench_logging.py [количество_заявок] [write_ms]
+"""
+import asyncio
+import logging
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import logs
+
+
+class SlowStream:
+    """stderr, который не успевает за записью"""
+
+    def __init__(self, write_ms):
+        self.delay = write_ms / 1000
+        self.lines = 0
+
+    def write(self, text):
+        time.sleep(self.delay)
+        self.lines += text.count("\n")
+
+    def flush(self):
+        pass
+
+
+async def watchdog(stalls, stop):
+    """Опоздание пробуждения после sleep(1 мс) - столько цикл был занят"""
+    while not stop.is_set():
+        started = time.perf_counter()
+        await asyncio.sleep(0.001)
+        stalls.append(time.perf_counter() - started - 0.001)
+
+
+async def raid(count):
+    for user_id in range(count):
+        logging.info("Новая заявка @%s", f"user{user_id}", extra={"sample": "join_request"})
+        if user_id % 10 == 0:
+            await asyncio.sleep(0)
+
+
+async def measure(count):
+    stalls = []
+    stop = asyncio.Event()
+    guard = asyncio.create_task(watchdog(stalls, stop))
+    started = time.perf_counter()
+    await raid(count)
+    elapsed = time.perf_counter() - started
+    stop.set()
+    await guard
+    stalls.sort()
+    return elapsed, stalls
+
+
+def report(name, elapsed, stalls, stream):
+    print(f"{name}: обработка {elapsed * 1000:.0f} мс, задержки цикла "
+          f"p50={stalls[len(stalls) // 2] * 1000:.2f} мс, p99={stalls[int(len(stalls) * 0.99)] * 1000:.2f} мс, "
+          f"max={stalls[-1] * 1000:.2f} мс, строк в stderr: {stream.lines}")
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    write_ms = float(sys.argv[2]) if len(sys.argv) > 2 else 0.2
+
+    # Было: синхронная запись в stderr прямо из цикла событий
+    stream = SlowStream(write_ms)
+    logging.basicConfig(level=logging.INFO, stream=stream, force=True)
+    report("basicConfig", *asyncio.run(measure(count)), stream)
+
+    # Стало: очередь и поток записи, выборка частых событий
+    stream = SlowStream(write_ms)
+    real_stderr, sys.stderr = sys.stderr, stream
+    listener = logs.setup_logging("INFO", "json")
+    sys.stderr = real_stderr
+    elapsed, stalls = asyncio.run(measure(count))
+    listener.stop()
+    report("setup_logging", elapsed, stalls, stream)
+
+    # Без выборки в stderr уходит всё, но запись всё равно не в цикле событий
+    stream = SlowStream(write_ms)
+    sys.stderr = stream
+    listener = logs.setup_logging("INFO", "json", sample_limit=0)
+    sys.stderr = real_stderr
+    elapsed, stalls = asyncio.run(measure(count))
+    listener.stop()
+    report("setup_logging без выборки", elapsed, stalls, stream)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,72 @@
+"""Микро-бенчмарк накладных расходов метрик на одно обновление
+
+Сравнивает имитацию обработчика заявки без метрик и с тем набором
+измерений, который делает бот на каждое обновление: замер обработчика,
+счётчик событий и замер вызова Bot API.
+
+Запуск: python bench/bench_metrics.py [количество_обновлений]
+"""
+import asyncio
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from metrics import Registry
+
+registry = Registry()
+HANDLER_SECONDS = registry.histogram("bench_handler_seconds", "bench", ("handler",))
+API_SECONDS = registry.histogram("bench_api_seconds", "bench", ("method",))
+EVENTS = registry.counter("bench_events_total", "bench", ("group",))
+
+store = {}
+
+
+async def api_call():
+    return True
+
+
+async def plain_handler(user_id):
+    store[user_id] = user_id
+    await api_call()
+
+
+@HANDLER_SECONDS.timed("join_request")
+async def instrumented_handler(user_id):
+    store[user_id] = user_id
+    EVENTS.inc(-100)
+    started = time.perf_counter()
+    try:
+        await api_call()
+    finally:
+        API_SECONDS.observe(time.perf_counter() - started, "sendMessage")
+
+
+async def measure(handler, count):
+    store.clear()
+    started = time.perf_counter()
+    for user_id in range(count):
+        await handler(user_id)
+    return (time.perf_counter() - started) / count
+
+
+async def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 200000
+    # Прогрев, чтобы сравнение не зависело от порядка запуска
+    await measure(plain_handler, 1000)
+    await measure(instrumented_handler, 1000)
+
+    plain = min([await measure(plain_handler, count) for _ in range(3)])
+    instrumented = min([await measure(instrumented_handler, count) for _ in range(3)])
+    print(f"Без метрик:   {plain * 1e9:8.0f} нс/обновление")
+    print(f"С метриками:  {instrumented * 1e9:8.0f} нс/обновление")
+    print(f"Накладные расходы: {(instrumented - plain) * 1e9:.0f} нс/обновление")
+
+    started = time.perf_counter()
+    text = registry.render()
+    print(f"Вывод /metrics: {(time.perf_counter() - started) * 1000:.2f} мс, {len(text)} байт")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
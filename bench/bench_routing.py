@@ -0,0 +1,51 @@
+"""Бенчмарк проверки допуска группы при росте числа групп
+
+Сравнивает старую проверку (список [GROUP_1_ID, GROUP_2_ID], собираемый на
+каждое сообщение) с реестром групп (frozenset в GroupRegistry) для 2..10000
+групп. Проверяется худший для списка случай - группа в конце списка - и
+сообщение из чужой группы.
+
+Запуск: python bench/bench_routing.py [количество_проверок]
+"""
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from config import load_registry
+
+
+def measure(check, chat_id, count):
+    started = time.perf_counter()
+    for _ in range(count):
+        check(chat_id)
+    return (time.perf_counter() - started) / count * 1e9
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 200_000
+    print(f"{'групп':>8} {'список, нс':>12} {'реестр, нс':>12} {'чужая/список':>14} {'чужая/реестр':>14}")
+    for size in (2, 10, 100, 1000, 10000):
+        env = {f"GROUP_{n}_ID": str(-1000 - n) for n in range(1, size + 1)}
+        env.update({f"GROUP_{n}_THREAD": str(n) for n in range(1, size + 1)})
+        groups = load_registry(env=env)
+        ids = sorted(groups.ids, reverse=True)
+        last, foreign = ids[-1], 42
+
+        def list_check(chat_id):
+            return chat_id not in list(ids)     # Как раньше: список строится на каждое сообщение
+
+        def registry_check(chat_id):
+            return chat_id not in groups.ids
+
+        # Для больших списков уменьшаем число повторов, иначе замер идёт минутами
+        list_count = max(1000, count // max(1, size // 10))
+        print(f"{size:>8} {measure(list_check, last, list_count):>12.0f} "
+              f"{measure(registry_check, last, count):>12.0f} "
+              f"{measure(list_check, foreign, list_count):>14.0f} "
+              f"{measure(registry_check, foreign, count):>14.0f}")
+
+
+if __name__ == "__main__":
+    main()
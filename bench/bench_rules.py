@@ -0,0 +1,137 @@
+"""Автомодерация заявок: скорость правил и рейд через бота
+
+1. Оценка одной заявки скомпилированными правилами (rules.GroupRules)
+   против прямой проверки списка шаблонов по одному.
+2. Рейд через FakeBotAPI: спам-ники и заявки без ника отклоняются
+   пачками, в /joinlist попадают только остальные.
+
+Запуск: python bench/bench_rules.py [количество_заявок]
+"""
+import asyncio
+import json
+import os
+import random
+import re
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from fake_api import FakeBotAPI
+from load_test import ADMIN_ID, GROUP_ID, join_request
+from rules import GroupRules
+
+RULES = {
+    "deny_ids": list(range(900000, 905000)),
+    "deny_usernames": ["casino", "(?:free|cheap)_?crypto", "^(?:bot|spam)_?\\d{5,}$"],
+    "deny_words": [f"promo{i}_" for i in range(500)],
+    "no_username": "decline",
+    "id_ranges": [{"min": 8000000000, "action": "queue"}],
+    "rate": {"max": 100000, "window": 60, "action": "queue"},
+}
+
+
+def naive(user_id, username):
+    """Как было бы без компиляции: множество не собрано, шаблоны проверяются по одному"""
+    if user_id in RULES["deny_ids"]:
+        return "decline"
+    if username is None:
+        return "decline"
+    for pattern in RULES["deny_usernames"] + [re.escape(word) for word in RULES["deny_words"]]:
+        if re.search(pattern, username, re.IGNORECASE):
+            return "decline"
+    return None
+
+
+def micro(count):
+    rng = random.Random(1)
+    requests = []
+    for _ in range(count):
+        roll = rng.random()
+        user_id = rng.randrange(100000, 1000000)
+        if roll < 0.3:
+            requests.append((user_id, f"promo{rng.randrange(500)}_{rng.randrange(1000)}"))
+        elif roll < 0.4:
+            requests.append((user_id, None))
+        else:
+            requests.append((user_id, f"user{user_id}"))
+
+    rules = GroupRules(**RULES)
+    started = time.perf_counter()
+    compiled = [rules.evaluate(user_id, username)[0] for user_id, username in requests]
+    compiled_time = time.perf_counter() - started
+
+    sample = requests[:max(1, count // 20)]
+    started = time.perf_counter()
+    plain = [naive(user_id, username) for user_id, username in sample]
+    naive_time = (time.perf_counter() - started) * len(requests) / len(sample)
+
+    assert compiled[:len(sample)] == [action if action == "decline" else None for action in plain]
+    print(f"Правила: {len(RULES['deny_ids'])} ID, {len(RULES['deny_usernames'])} шаблонов ника, "
+          f"{len(RULES['deny_words'])} запрещённых слов")
+    print(f"Скомпилированные: {compiled_time / count * 1e6:.2f} мкс на заявку")
+    print(f"По одному шаблону: {naive_time / count * 1e6:.2f} мкс на заявку (оценка по {len(sample)})")
+
+
+async def raid(count):
+    fake = FakeBotAPI(admin_ids=(ADMIN_ID,))
+    workdir = tempfile.mkdtemp()
+    config = os.path.join(workdir, "groups.json")
+    with open(config, "w", encoding="utf-8") as file:
+        json.dump({"groups": [{"id": GROUP_ID, "thread": 10, "rules": RULES}]}, file)
+    os.environ.update({
+        "BOT_TOKEN": "123456:rules",
+        "BOT_CONFIG": config,
+        "STATE_BACKEND": "memory",
+        "AUDIT_LOG": os.path.join(workdir, "audit.jsonl"),
+        "TELEGRAM_API_URL": await fake.start(),
+        "JOIN_REQUEST_MAX": str(count * 2),
+        "OUTBOUND_GLOBAL_RATE": "100000",
+        "OUTBOUND_CHAT_RATE": "6000000",
+        "BULK_CONCURRENCY": "32",
+    })
+    import main as bot_main
+    from aiogram import types
+
+    rng = random.Random(2)
+    updates = []
+    expected = {"decline": 0, "queue": 0}
+    for n in range(count):
+        update = join_request(n + 1, 300000 + n)
+        sender = update["chat_join_request"]["from"]
+        roll = rng.random()
+        if roll < 0.5:
+            sender["username"] = f"promo{rng.randrange(500)}_{rng.randrange(1000)}"
+        elif roll < 0.7:
+            del sender["username"]
+        expected["queue" if roll >= 0.7 else "decline"] += 1
+        updates.append(update)
+
+    await bot_main.on_startup(bot_main.dp)
+    started = time.perf_counter()
+    await asyncio.gather(*(bot_main.update_pipeline.process(types.Update(**raw)) for raw in updates))
+    handled = time.perf_counter() - started
+    while bot_main.auto_decisions.stats()["pending"] or bot_main.auto_decisions._tasks or sum(bot_main.outbox.depth()):
+        await asyncio.sleep(0.05)
+    total = time.perf_counter() - started
+
+    stats = bot_main.audit_log.summary(GROUP_ID)
+    await bot_main.on_shutdown(bot_main.dp)
+    await (await bot_main.bot.get_session()).close()
+    await fake.stop()
+
+    print(f"Рейд: {count} заявок обработано за {handled:.2f} с, решения выполнены за {total:.2f} с")
+    print(f"Автомодерация: {bot_main.auto_decisions.stats()}")
+    print(f"В /joinlist: {bot_main.join_requests.count(GROUP_ID)}, журнал: {stats['events']}")
+    print(f"Вызовы Bot API: {dict(fake.calls)}")
+    assert fake.calls["declineChatJoinRequest"] == expected["decline"]
+    assert bot_main.join_requests.count(GROUP_ID) == expected["queue"]
+
+
+if __name__ == "__main__":
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    micro(count * 10)
+    asyncio.run(raid(count))
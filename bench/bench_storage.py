@@ -0,0 +1,50 @@
+"""Бенчмарк записи заявок в SQLite: с групповой фиксацией и без неё
+
+Запуск: python bench/bench_storage.py [количество_заявок]
+"""
+import asyncio
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from request_store import RequestStore
+from storage import SQLiteBackend
+
+
+async def run(count, group_commit):
+    with tempfile.TemporaryDirectory() as tmp:
+        backend = SQLiteBackend(os.path.join(tmp, "state.db"), group_commit=group_commit)
+        store = RequestStore(backend=backend)
+        await backend.start()
+
+        started = time.perf_counter()
+        for user_id in range(count):
+            store.add(-100, user_id, f"user{user_id}")
+            if user_id % 100 == 0:
+                # Отдаём управление циклу, как между реальными обновлениями
+                await asyncio.sleep(0)
+        await backend.flush()
+        elapsed = time.perf_counter() - started
+
+        await backend.close()
+
+        # Проверяем, что всё действительно записано
+        reloaded = SQLiteBackend(os.path.join(tmp, "state.db"))
+        assert len(reloaded.load_requests()) == count
+        await reloaded.close()
+    return count / elapsed
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 5000
+    for group_commit in (False, True):
+        rate = asyncio.run(run(count, group_commit))
+        mode = "с групповой фиксацией" if group_commit else "без групповой фиксации"
+        print(f"{mode:>26}: {rate:10.0f} заявок/с")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,174 @@
+"""Проверка нескольких реплик: каждая заявка принимается ровно один раз
+
+Поднимает FakeBotAPI и N процессов бота (main.py в режиме webhook) с общей
+базой SQLite. Играет роль балансировщика: заявки и нажатия отправляются
+случайным репликам, каждое нажатие «Принять» повторяется несколько раз
+одновременно (двойные клики, несколько админов). Часть повторов помечается
+как уже пересланная - так реплика обрабатывает чужую группу сама, как при
+недоступном владельце, и двойное принятие исключает только claim в базе.
+
+Проверяет, что approveChatJoinRequest и запись в журнал для каждой заявки
+выполнены ровно один раз.
+
+Запуск: python bench/cluster_harness.py [реплик] [заявок] [повторов_нажатия]
+"""
+import asyncio
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+from collections import Counter
+
+import aiohttp
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from fake_api import FakeBotAPI
+from webhook_harness import ADMIN_ID, SECRET
+
+from callbacks import ACCEPT, CallbackCodec, derive_key
+from cluster import FORWARDED_HEADER
+
+GROUPS = [(-1001, 10), (-1002, 20), (-1003, 30), (-1004, 40)]
+BASE_PORT = 18100
+BOT_TOKEN = "123456:harness"
+
+
+def join_request_update(update_id, group_id, user_id):
+    user = {"id": user_id, "is_bot": False, "first_name": "u", "username": f"user{user_id}"}
+    return {
+        "update_id": update_id,
+        "chat_join_request": {
+            "chat": {"id": group_id, "type": "supergroup", "title": "test"},
+            "from": user,
+            "user_chat_id": user_id,
+            "date": int(time.time()),
+        },
+    }
+
+
+def callback_update(update_id, group_id, data):
+    return {
+        "update_id": update_id,
+        "callback_query": {
+            "id": str(update_id),
+            "chat_instance": "1",
+            "from": {"id": ADMIN_ID, "is_bot": False, "first_name": "admin"},
+            "message": {
+                "message_id": 1,
+                "date": int(time.time()),
+                "chat": {"id": group_id, "type": "supergroup", "title": "test"},
+                "text": "list",
+            },
+            "data": data,
+        },
+    }
+
+
+async def wait_ready(session, url, timeout=30):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            async with session.get(url) as response:
+                if response.status == 200:
+                    return
+        except aiohttp.ClientError:
+            pass
+        await asyncio.sleep(0.2)
+    raise RuntimeError(f"Реплика не запустилась: {url}")
+
+
+async def main():
+    replicas = int(sys.argv[1]) if len(sys.argv) > 1 else 3
+    count = int(sys.argv[2]) if len(sys.argv) > 2 else 40
+    clicks = int(sys.argv[3]) if len(sys.argv) > 3 else 4
+
+    fake = FakeBotAPI(admin_ids=(ADMIN_ID,))
+    api_url = await fake.start()
+    workdir = tempfile.mkdtemp(prefix="cluster_harness_")
+    urls = {f"r{i}": f"http://127.0.0.1:{BASE_PORT + i}/webhook" for i in range(replicas)}
+
+    env = dict(os.environ, **{
+        "BOT_TOKEN": BOT_TOKEN,
+        "BOT_MODE": "webhook",
+        "WEBHOOK_URL": "http://127.0.0.1",
+        "WEBHOOK_SECRET": SECRET,
+        "TELEGRAM_API_URL": api_url,
+        "STATE_BACKEND": "sqlite",
+        "STATE_DB_PATH": os.path.join(workdir, "state.db"),
+        "REPLICAS": ",".join(f"{name}={url}" for name, url in urls.items()),
+        "PYTHONPATH": ROOT,
+        # Лимиты Telegram здесь не нужны: журнал должен успеть уйти за время прогона
+        "OUTBOUND_GLOBAL_RATE": "1000",
+        "OUTBOUND_CHAT_RATE": "60000",
+    })
+    for n, (group_id, thread_id) in enumerate(GROUPS, 1):
+        env[f"GROUP_{n}_ID"], env[f"GROUP_{n}_THREAD"] = str(group_id), str(thread_id)
+
+    processes = []
+    for i, name in enumerate(urls):
+        processes.append(await asyncio.create_subprocess_exec(
+            sys.executable, os.path.join(ROOT, "main.py"), cwd=workdir,
+            env=dict(env, REPLICA_ID=name, PORT=str(BASE_PORT + i), AUDIT_LOG=f"audit-{name}.jsonl"),
+            stdout=asyncio.subprocess.DEVNULL, stderr=asyncio.subprocess.DEVNULL,
+        ))
+
+    headers = {"X-Telegram-Bot-Api-Secret-Token": SECRET}
+    requests = [(random.choice(GROUPS)[0], 7000 + i) for i in range(count)]
+    try:
+        async with aiohttp.ClientSession() as session:
+            for i in range(replicas):
+                await wait_ready(session, f"http://127.0.0.1:{BASE_PORT + i}/health")
+
+            async def post(update, forwarded=False):
+                extra = {FORWARDED_HEADER: "harness"} if forwarded else {}
+                async with session.post(random.choice(list(urls.values())), json=update,
+                                        headers={**headers, **extra}) as response:
+                    assert response.status == 200, response.status
+
+            update_id = 1
+            for group_id, user_id in requests:
+                await post(join_request_update(update_id, group_id, user_id))
+                update_id += 1
+            # Ждём пересылки владельцам и групповой фиксации в базу
+            await asyncio.sleep(1)
+
+            codec = CallbackCodec(derive_key(BOT_TOKEN))
+            clicks_sent = []
+            for group_id, user_id in requests:
+                for n in range(clicks):
+                    clicks_sent.append(post(callback_update(update_id, group_id, codec.encode(ACCEPT, user_id, group_id)),
+                                            forwarded=n % 2 == 1))
+                    update_id += 1
+            await asyncio.gather(*clicks_sent)
+            await asyncio.sleep(2)
+    finally:
+        for process in processes:
+            process.terminate()
+        await asyncio.gather(*(process.wait() for process in processes))
+        await fake.stop()
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    approvals = Counter((int(p["chat_id"]), int(p["user_id"]))
+                        for method, p in fake.requests if method == "approveChatJoinRequest")
+    logged = Counter(int(p["chat_id"]) for method, p in fake.requests
+                     if method == "sendMessage" and "принят в группу" in p.get("text", ""))
+    expected = Counter(group_id for group_id, _ in requests)
+
+    print(f"Реплик: {replicas}, заявок: {count}, нажатий на заявку: {clicks}")
+    print(f"Вызовы Bot API: {dict(fake.calls)}")
+    duplicates = {key: n for key, n in approvals.items() if n > 1}
+    missing = [key for key in requests if key not in approvals]
+    print(f"Принято: {len(approvals)}, повторных принятий: {len(duplicates)}, пропущено: {len(missing)}")
+    assert not duplicates, duplicates
+    assert not missing, missing
+    assert logged == expected, (logged, expected)
+    print("OK: каждая заявка принята ровно один раз")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
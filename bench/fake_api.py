@@ -0,0 +1,149 @@
+"""Локальная замена Telegram Bot API для нагрузочных прогонов и проверок
+
+Отвечает на методы, которые использует бот, и считает вызовы.
+Бот подключается к ней через TELEGRAM_API_URL.
+
+Для нагрузочных прогонов можно задать задержку ответа, долю ошибок и
+долю ответов 429 (flood wait) - см. FakeBotAPI. getUpdates отдаёт
+обновления, добавленные через feed(), с долгим опросом как у Telegram.
+"""
+import asyncio
+import json
+import random
+import time
+from collections import Counter
+
+from aiohttp import web
+
+# Методы, на которых имитируются задержки и сбои (служебные не трогаем)
+FAULT_METHODS = frozenset({
+    "sendMessage", "deleteMessage", "editMessageText", "editMessageReplyMarkup",
+    "approveChatJoinRequest", "declineChatJoinRequest", "answerCallbackQuery",
+})
+
+
+class FakeBotAPI:
+    """Минимальный сервер Bot API: успешные ответы и счётчики вызовов.
+
+    latency - задержка ответа в секундах (jitter - случайная добавка до jitter),
+    error_rate - доля ответов с ошибкой 500,
+    flood_rate - доля ответов 429 с retry_after секунд ожидания.
+    """
+
+    def __init__(self, admin_ids=(1,), latency=0.0, jitter=0.0, error_rate=0.0, flood_rate=0.0, retry_after=1,
+                 seed=None):
+        self.admin_ids = admin_ids
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.flood_rate = flood_rate
+        self.retry_after = retry_after
+        self.calls = Counter()
+        self.errors = Counter()     # (метод, код ошибки) -> количество
+        self.requests = []      # (метод, параметры) всех вызовов
+        self._message_id = 0
+        self._random = random.Random(seed)
+        self._updates = asyncio.Queue()
+
+    def config(self):
+        """Настройки имитации (для сохранения рядом с результатами прогона)"""
+        return {
+            "latency": self.latency,
+            "jitter": self.jitter,
+            "error_rate": self.error_rate,
+            "flood_rate": self.flood_rate,
+            "retry_after": self.retry_after,
+        }
+
+    def feed(self, updates):
+        """Поставить обновления в очередь для getUpdates"""
+        for update in updates:
+            self._updates.put_nowait(update)
+
+    def _message(self, params):
+        self._message_id += 1
+        return {
+            "message_id": self._message_id,
+            "date": int(time.time()),
+            "chat": {"id": int(params.get("chat_id", 0)), "type": "supergroup"},
+            "text": params.get("text", ""),
+        }
+
+    def result(self, method, params):
+        """Результат метода Bot API"""
+        if method in ("sendMessage", "editMessageText", "editMessageReplyMarkup"):
+            return self._message(params)
+        if method == "getChatAdministrators":
+            return [{"status": "creator", "is_anonymous": False,
+                     "user": {"id": user_id, "is_bot": False, "first_name": "admin"}}
+                    for user_id in self.admin_ids]
+        if method == "getMe":
+            return {"id": 42, "is_bot": True, "first_name": "bot", "username": "bot"}
+        return True
+
+    async def get_updates(self, params):
+        """getUpdates: всё, что накопилось, или ожидание первого обновления до timeout"""
+        offset = int(params.get("offset", 0))
+        limit = int(params.get("limit", 100))
+        updates = []
+        if self._updates.empty():
+            try:
+                updates.append(await asyncio.wait_for(self._updates.get(), float(params.get("timeout", 0)) or 0.01))
+            except asyncio.TimeoutError:
+                return []
+        while len(updates) < limit and not self._updates.empty():
+            updates.append(self._updates.get_nowait())
+        return [update for update in updates if update["update_id"] >= offset]
+
+    def fault(self, method):
+        """Ответ-сбой для метода или None"""
+        if method not in FAULT_METHODS:
+            return None
+        roll = self._random.random()
+        if roll < self.flood_rate:
+            return web.json_response({
+                "ok": False, "error_code": 429,
+                "description": f"Too Many Requests: retry after {self.retry_after}",
+                "parameters": {"retry_after": self.retry_after},
+            }, status=429)
+        if roll < self.flood_rate + self.error_rate:
+            return web.json_response({"ok": False, "error_code": 500, "description": "Internal Server Error"},
+                                     status=500)
+        return None
+
+    async def handle(self, request):
+        method = request.match_info["method"]
+        if request.content_type == "application/json":
+            params = await request.json()
+        else:
+            params = dict(await request.post())
+        self.calls[method] += 1
+        self.requests.append((method, params))
+
+        if method == "getUpdates":
+            return web.json_response({"ok": True, "result": await self.get_updates(params)})
+
+        if method in FAULT_METHODS and (self.latency or self.jitter):
+            await asyncio.sleep(self.latency + self._random.uniform(0, self.jitter))
+        response = self.fault(method)
+        if response is not None:
+            self.errors[(method, json.loads(response.body)["error_code"])] += 1
+            return response
+        return web.json_response({"ok": True, "result": self.result(method, params)})
+
+    def app(self):
+        app = web.Application()
+        app.router.add_post("/bot{token}/{method}", self.handle)
+        return app
+
+    async def start(self, port=0):
+        """Запустить сервер. Возвращает базовый URL для TELEGRAM_API_URL."""
+        self._runner = web.AppRunner(self.app(), access_log=None)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, "127.0.0.1", port)
+        await site.start()
+        port = site._server.sockets[0].getsockname()[1]
+        return f"http://127.0.0.1:{port}"
+
+    async def stop(self):
+        await self._runner.cleanup()
@@ -0,0 +1,162 @@
+"""Наплыв заявок: память и исходящие вызовы не растут вместе с рейдом
+
+Через FakeBotAPI и настоящие обработчики бота (main.py) прогоняются две
+волны заявок - size и 4 * size разных пользователей - вперемешку с
+/joinlist от админа и серией заявок одного пользователя. После
+каждой волны бот должен сам выйти из режима рейда. Проверяется:
+
+- невыполненных решений не больше AUTOMOD_MAX_PENDING; очередь группы не
+  больше RAID_QUEUE_MAX плюс RAID_THRESHOLD заявок, принятых до включения
+  рейда, и ни одна заявка из неё не вытеснена;
+- окон пользователей не больше лимита;
+- сообщений и правок от бота (уведомления, /joinlist, отчёты) не больше,
+  чем позволяют паузы /joinlist и правок списка за время волны, - от
+  числа заявок они не зависят;
+- каждая заявка сверх очереди отклонена ровно один раз (или оставлена
+  без ответа, если очередь отклонений была полна);
+- после рейда новая заявка снова уведомляет админов.
+
+Запуск: python bench/flood_harness.py [size]
+"""
+import asyncio
+import os
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from fake_api import FakeBotAPI
+from load_test import ADMIN_ID, GROUP_ID, command, join_request, rss_bytes
+
+RAID_QUEUE_MAX = 1000
+JOIN_REQUEST_MAX = 5000
+RAID_THRESHOLD = 100
+RAID_JOINLIST_COOLDOWN = 2
+AUTOMOD_MAX_PENDING = 50   # Меньше пачки (AUTOMOD_BATCH): часть отклонений не помещается и остаётся без ответа
+REPEATS = 30            # Заявок от одного пользователя за волну
+CHUNK = 500             # Обновлений, поданных разом
+NOTIFY_METHODS = ("sendMessage", "editMessageText", "deleteMessage")
+
+
+async def wave(bot_main, fake, first_user, size, update_id):
+    """Одна волна: size новых пользователей, /joinlist после каждой порции и повторщик"""
+    from aiogram import types
+
+    updates = []
+    for n in range(size):
+        updates.append(join_request(update_id + len(updates), first_user + n))
+        if n == size // 2:
+            for _ in range(REPEATS):
+                updates.append(join_request(update_id + len(updates), first_user - 1))
+        if n % CHUNK == 0:
+            updates.append(command(update_id + len(updates), "/joinlist"))
+
+    before_calls = dict(fake.calls)
+    before_counts = bot_main.admission.counts()
+    before_auto = bot_main.auto_decisions.stats()
+    before_events = dict(bot_main.audit_log.summary(GROUP_ID)["events"])
+    peaks = {"pending": 0, "decisions": 0, "users": 0}
+
+    started = time.perf_counter()
+    for offset in range(0, len(updates), CHUNK):
+        chunk = updates[offset:offset + CHUNK]
+        await asyncio.gather(*(bot_main.update_pipeline.process(types.Update(**raw)) for raw in chunk))
+        peaks["pending"] = max(peaks["pending"], bot_main.join_requests.count(GROUP_ID))
+        peaks["decisions"] = max(peaks["decisions"], bot_main.auto_decisions.stats()["pending"])
+        peaks["users"] = max(peaks["users"], bot_main.admission.stats()["tracked_users"])
+        await asyncio.sleep(0)
+    flooded = time.perf_counter() - started
+    assert bot_main.admission.in_raid(GROUP_ID), "рейд не включился"
+
+    # Ждём, пока выполнятся решения и рейд закончится сам
+    while bot_main.admission.in_raid(GROUP_ID) or bot_main.auto_decisions._tasks or sum(bot_main.outbox.depth()):
+        await asyncio.sleep(0.1)
+        if time.perf_counter() - started > flooded + 30:
+            raise AssertionError("рейд не закончился")
+    await asyncio.sleep(0.5)
+    elapsed = time.perf_counter() - started
+
+    counts = {key: value - before_counts[key] for key, value in bot_main.admission.counts().items()}
+    auto = {key: value - before_auto[key] for key, value in bot_main.auto_decisions.stats().items()}
+    calls = {method: fake.calls[method] - before_calls.get(method, 0) for method in fake.calls}
+    events = {key: value - before_events.get(key, 0) for key, value in bot_main.audit_log.summary(GROUP_ID)["events"].items()}
+    notifications = sum(calls.get(method, 0) for method in NOTIFY_METHODS)
+    print(f"Волна {size}: {len(updates)} обновлений за {flooded:.1f} с, рейд закончился через {elapsed:.1f} с")
+    print(f"  допуск: {counts}")
+    print(f"  автомодерация: {auto}, без ответа: {events.get('raid_shed', 0)}, вытеснено: {events.get('evict', 0)}")
+    print(f"  пики: очередь {peaks['pending']}, решения {peaks['decisions']}, окна пользователей {peaks['users']}")
+    print(f"  сообщений и правок: {notifications} {({m: calls.get(m, 0) for m in NOTIFY_METHODS})}, "
+          f"отклонений: {calls.get('declineChatJoinRequest', 0)}, RSS {rss_bytes() / 2 ** 20:.0f} МБ")
+
+    duplicates = bot_main.RAID_USER_LIMIT - 1
+    assert peaks["pending"] <= RAID_QUEUE_MAX + RAID_THRESHOLD
+    assert not events.get("evict"), events
+    # Не поместившиеся в очередь отклонений остаются без ответа, а не попадают в /joinlist
+    assert events.get("raid_shed", 0) == auto["dropped"]
+    assert peaks["decisions"] <= AUTOMOD_MAX_PENDING
+    assert peaks["users"] <= bot_main.admission.max_users
+    assert counts["shed"] == REPEATS - bot_main.RAID_USER_LIMIT
+    # Серия одного пользователя приходит при полной очереди: его RAID_USER_LIMIT заявок схлопываются
+    # в одно решение (а если решение не поместилось, каждая остаётся без ответа)
+    handled = calls.get("declineChatJoinRequest", 0) + auto["dropped"]
+    assert counts["overflow"] - duplicates <= handled <= counts["overflow"], (handled, counts["overflow"])
+    # Начало и конец рейда, первая сводка, а дальше только то, что пропускают паузы: /joinlist - отправка
+    # и удаление прошлого списка, правки открытого списка
+    limit = 10 + elapsed * (2 / RAID_JOINLIST_COOLDOWN + 1 / bot_main.JOINLIST_EDIT_DELAY)
+    assert notifications <= limit, (notifications, limit)
+    return len(updates)
+
+
+async def main(size):
+    fake = FakeBotAPI(admin_ids=(ADMIN_ID,))
+    workdir = tempfile.mkdtemp()
+    os.environ.update({
+        "BOT_TOKEN": "123456:flood",
+        "GROUP_1_ID": str(GROUP_ID), "GROUP_1_THREAD": "10",
+        "STATE_BACKEND": "memory",
+        "AUDIT_LOG": os.path.join(workdir, "audit.jsonl"),
+        "TELEGRAM_API_URL": await fake.start(),
+        "JOIN_REQUEST_MAX": str(JOIN_REQUEST_MAX),
+        "OUTBOUND_GLOBAL_RATE": "100000",
+        "OUTBOUND_CHAT_RATE": "6000000",
+        "BULK_CONCURRENCY": "32",
+        "AUTOMOD_MAX_PENDING": str(AUTOMOD_MAX_PENDING),
+        "RAID_THRESHOLD": str(RAID_THRESHOLD),
+        "RAID_WINDOW": "2",
+        "RAID_RECOVERY": "1",
+        "RAID_QUEUE_MAX": str(RAID_QUEUE_MAX),
+        "RAID_JOINLIST_COOLDOWN": str(RAID_JOINLIST_COOLDOWN),
+    })
+    import main as bot_main
+
+    # Окон пользователей меньше, чем участников второй волны: проверяем, что старые вытесняются
+    bot_main.admission.max_users = size * 2
+    await bot_main.on_startup(bot_main.dp)
+    first_updates = await wave(bot_main, fake, 10 ** 6, size, 1)
+    await wave(bot_main, fake, 2 * 10 ** 6, size * 4, first_updates + 1)
+
+    # После рейда обычная заявка снова уведомляет админов
+    from aiogram import types
+    sent = fake.calls["sendMessage"]
+    await bot_main.update_pipeline.process(types.Update(**join_request(10 ** 7, 3 * 10 ** 6)))
+    while fake.calls["sendMessage"] == sent:
+        await asyncio.sleep(0.05)
+    raid_messages = [params["text"] for method, params in fake.requests
+                     if method == "sendMessage" and "Наплыв" in params.get("text", "")]
+
+    stats = bot_main.audit_log.summary(GROUP_ID)["events"]
+    await bot_main.on_shutdown(bot_main.dp)
+    await (await bot_main.bot.get_session()).close()
+    await fake.stop()
+
+    print(f"Журнал: {stats}")
+    print(f"Сообщения о рейде: {len(raid_messages)}")
+    assert len(raid_messages) == 4, raid_messages
+    print("OK: очередь, память и исходящие вызовы ограничены при наплыве")
+
+
+if __name__ == "__main__":
+    asyncio.run(main(int(sys.argv[1]) if len(sys.argv) > 1 else 5000))
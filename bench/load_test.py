@@ -0,0 +1,337 @@
+"""Нагрузочный прогон бота через настоящие обработчики dp и поддельный Bot API
+
+Сценарии:
+    raid      - волна заявок на вступление от разных пользователей
+    joinlist  - шквал команд /joinlist (с фильтрами и без)
+    clicks    - нажатия кнопок: страницы, принять, игнорировать
+    mixed     - всё вместе вперемешку
+
+Транспорт:
+    direct    - обновления передаются прямо в очереди бота (update_pipeline), без HTTP
+    webhook   - HTTP-запросы в aiohttp-приложение бота (web.create_app)
+    polling   - бот забирает обновления через getUpdates у FakeBotAPI
+
+Отчёт: обновлений в секунду, p50/p99 времени обработки, вызовы Bot API на
+обновление, рост памяти. С --out результат сохраняется в JSON; с
+--baseline печатается сравнение с прошлым прогоном.
+
+Запуск: python bench/load_test.py raid --updates 5000 --latency 0.02 --out raid.json
+"""
+import argparse
+import asyncio
+import gc
+import json
+import os
+import platform
+import random
+import resource
+import sys
+import time
+
+import aiohttp
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from fake_api import FakeBotAPI
+
+from callbacks import ACCEPT, IGNORE, PAGE
+
+GROUP_ID = -1001
+ADMIN_ID = 1
+SECRET = "load-test-secret"
+WEBHOOK_PORT = 18090
+
+
+def user(user_id):
+    return {"id": user_id, "is_bot": False, "first_name": "u", "username": f"user{user_id}"}
+
+
+def chat():
+    return {"id": GROUP_ID, "type": "supergroup", "title": "test"}
+
+
+def join_request(update_id, user_id):
+    return {"update_id": update_id, "chat_join_request": {
+        "chat": chat(), "from": user(user_id), "user_chat_id": user_id, "date": int(time.time()),
+    }}
+
+
+def command(update_id, text):
+    return {"update_id": update_id, "message": {
+        "message_id": update_id, "date": int(time.time()), "chat": chat(), "from": user(ADMIN_ID), "text": text,
+        "entities": [{"type": "bot_command", "offset": 0, "length": len(text.split()[0])}],
+    }}
+
+
+def callback(update_id, data):
+    return {"update_id": update_id, "callback_query": {
+        "id": str(update_id), "chat_instance": "1", "from": user(ADMIN_ID), "data": data,
+        "message": {"message_id": 1, "date": int(time.time()), "chat": chat(), "text": "list"},
+    }}
+
+
+class Generator:
+    """Поток обновлений для сценария. Пользователи заявок - 100000, 100001, ...
+
+    token(код, *поля) - callback_data кнопок бота (main.callbacks.token).
+    """
+
+    def __init__(self, token, seed=None):
+        self.token = token
+        self.random = random.Random(seed)
+        self.update_id = 0
+        self.next_user = 100000
+        self.pending = []
+
+    def _id(self):
+        self.update_id += 1
+        return self.update_id
+
+    def raid(self, count):
+        for _ in range(count):
+            self.pending.append(self.next_user)
+            self.next_user += 1
+            yield join_request(self._id(), self.pending[-1])
+
+    def joinlist(self, count):
+        for _ in range(count):
+            query = self.random.choice(["", "", "user10", "10000"])
+            yield command(self._id(), f"/joinlist {query}".strip())
+
+    def clicks(self, count):
+        for _ in range(count):
+            roll = self.random.random()
+            if roll < 0.4 or not self.pending:
+                yield callback(self._id(), self.token(PAGE, GROUP_ID, self.random.randrange(5), ""))
+                continue
+            user_id = self.pending.pop(self.random.randrange(len(self.pending)))
+            action = ACCEPT if roll < 0.8 else IGNORE
+            yield callback(self._id(), self.token(action, user_id, GROUP_ID))
+
+    def scenario(self, name, count):
+        if name == "raid":
+            return list(self.raid(count))
+        if name == "joinlist":
+            # Списку нужны заявки, иначе /joinlist ответит «нет заявок»
+            return list(self.raid(count // 10)) + list(self.joinlist(count))
+        if name == "clicks":
+            return list(self.raid(count)) + list(self.clicks(count))
+        # mixed: заявки идут первыми в каждой пачке, остальное вперемешку
+        updates = []
+        for _ in range(max(1, count // 100)):
+            batch = list(self.raid(50))
+            rest = list(self.joinlist(5)) + list(self.clicks(45))
+            self.random.shuffle(rest)
+            updates += batch + rest
+        return updates
+
+
+def rss_bytes():
+    """Текущий RSS процесса (Linux), иначе пиковый"""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except OSError:
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+def percentile(values, q):
+    if not values:
+        return None
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * q))]
+
+
+async def run(args):
+    fake = FakeBotAPI(admin_ids=(ADMIN_ID,), latency=args.latency, jitter=args.jitter,
+                      error_rate=args.error_rate, flood_rate=args.flood_rate, retry_after=args.retry_after,
+                      seed=args.seed)
+    os.environ.update({
+        "BOT_TOKEN": "123456:load",
+        "GROUP_1_ID": str(GROUP_ID), "GROUP_1_THREAD": "10",
+        "STATE_BACKEND": args.backend,
+        "AUDIT_LOG": "",
+        "STATE_DB_PATH": args.db,
+        "TELEGRAM_API_URL": await fake.start(),
+        "JOIN_REQUEST_MAX": str(args.updates * 2),
+    })
+    if not args.telegram_limits:
+        # Без лимитов Telegram меряется сам бот, а не ожидание токенов
+        os.environ.update({"OUTBOUND_GLOBAL_RATE": "100000", "OUTBOUND_CHAT_RATE": "6000000"})
+
+    import main as bot_main
+    from aiogram import Bot, Dispatcher
+    from aiogram.dispatcher.middlewares import BaseMiddleware
+    from web import create_app, start_server
+
+    dp = bot_main.dp
+    pipeline = bot_main.update_pipeline
+    latencies = []
+    errors = []
+    finished = asyncio.Event()
+    expected = 0
+
+    class Timing(BaseMiddleware):
+        """Время обработки каждого обновления всеми обработчиками"""
+
+        async def on_pre_process_update(self, update, data):
+            data["load_started"] = time.perf_counter()
+
+        async def on_post_process_update(self, update, results, data):
+            latencies.append(time.perf_counter() - data["load_started"])
+            if len(latencies) >= expected:
+                finished.set()
+
+    dp.middleware.setup(Timing())
+
+    @dp.errors_handler()
+    async def count_errors(update, error):
+        errors.append(type(error).__name__)
+        return True
+
+    Bot.set_current(bot_main.bot)
+    Dispatcher.set_current(dp)
+    await bot_main.on_startup(dp)
+
+    generator = Generator(bot_main.callbacks.token, args.seed)
+    updates = generator.scenario(args.scenario, args.updates)
+    expected = len(updates)
+    # Прогрев: импорт, первые соединения и загрузка админов не должны попасть в замер
+    await asyncio.sleep(0.5)
+
+    gc.collect()
+    rss_start = rss_bytes()
+    calls_start = sum(fake.calls.values())
+    started = time.perf_counter()
+
+    runner = polling = None
+    if args.transport == "direct":
+        from aiogram import types
+        semaphore = asyncio.Semaphore(args.concurrency)
+
+        async def feed(raw):
+            async with semaphore:
+                await pipeline.process(types.Update(**raw))
+
+        await asyncio.gather(*(feed(raw) for raw in updates))
+    elif args.transport == "webhook":
+        runner = await start_server(create_app(dp, "/webhook", SECRET, pipeline=pipeline), WEBHOOK_PORT)
+        url = f"http://127.0.0.1:{WEBHOOK_PORT}/webhook"
+        headers = {"X-Telegram-Bot-Api-Secret-Token": SECRET}
+        connector = aiohttp.TCPConnector(limit=args.concurrency)
+        async with aiohttp.ClientSession(connector=connector) as session:
+            async def post(raw):
+                async with session.post(url, json=raw, headers=headers) as response:
+                    await response.read()
+
+            await asyncio.gather(*(post(raw) for raw in updates))
+    else:
+        fake.feed(updates)
+        polling = asyncio.create_task(pipeline.poll(bot_main.ALLOWED_UPDATES, timeout=1))
+
+    try:
+        await asyncio.wait_for(finished.wait(), args.timeout)
+    except asyncio.TimeoutError:
+        print(f"Не дождались обработки: {len(latencies)} из {expected}", file=sys.stderr)
+    duration = time.perf_counter() - started
+
+    # Исходящие сообщения из очереди тоже часть нагрузки: ждём, пока они уйдут
+    while sum(bot_main.outbox.depth()) and time.perf_counter() - started < args.timeout:
+        await asyncio.sleep(0.05)
+    drain = time.perf_counter() - started
+
+    api_calls = sum(fake.calls.values()) - calls_start
+    gc.collect()
+    rss_end = rss_bytes()
+
+    if polling:
+        polling.cancel()
+        await asyncio.gather(polling, return_exceptions=True)
+    if runner:
+        await runner.cleanup()
+    await bot_main.on_shutdown(dp)
+    await (await bot_main.bot.get_session()).close()
+    await fake.stop()
+
+    processed = len(latencies)
+    return {
+        "scenario": args.scenario,
+        "transport": args.transport,
+        "updates": expected,
+        "processed": processed,
+        "concurrency": args.concurrency,
+        "backend": args.backend,
+        "fake_api": fake.config(),
+        "telegram_limits": args.telegram_limits,
+        "duration_s": round(duration, 4),
+        "drain_s": round(drain, 4),
+        "updates_per_s": round(processed / duration, 1) if duration else None,
+        "latency_ms": {
+            "p50": round(percentile(latencies, 0.50) * 1000, 3) if latencies else None,
+            "p99": round(percentile(latencies, 0.99) * 1000, 3) if latencies else None,
+            "max": round(max(latencies) * 1000, 3) if latencies else None,
+        },
+        "api_calls": api_calls,
+        "api_calls_per_update": round(api_calls / processed, 3) if processed else None,
+        "api_calls_by_method": dict(fake.calls),
+        "api_faults": {f"{method}:{code}": n for (method, code), n in fake.errors.items()},
+        "handler_errors": len(errors),
+        "pending_requests": bot_main.join_requests.count(GROUP_ID),
+        "memory": {
+            "rss_start_mb": round(rss_start / 2**20, 2),
+            "rss_end_mb": round(rss_end / 2**20, 2),
+            "growth_mb": round((rss_end - rss_start) / 2**20, 2),
+        },
+        "python": platform.python_version(),
+        "timestamp": int(time.time()),
+    }
+
+
+def compare(result, baseline):
+    """Сравнение с прошлым прогоном по основным показателям"""
+    rows = [
+        ("обновлений/с", result["updates_per_s"], baseline.get("updates_per_s")),
+        ("p50, мс", result["latency_ms"]["p50"], baseline.get("latency_ms", {}).get("p50")),
+        ("p99, мс", result["latency_ms"]["p99"], baseline.get("latency_ms", {}).get("p99")),
+        ("вызовов API/обновление", result["api_calls_per_update"], baseline.get("api_calls_per_update")),
+        ("рост памяти, МБ", result["memory"]["growth_mb"], baseline.get("memory", {}).get("growth_mb")),
+    ]
+    for name, new, old in rows:
+        delta = f"{(new - old) / old * 100:+.1f}%" if new is not None and old else "-"
+        print(f"{name:>24}: {old} -> {new} ({delta})")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("scenario", choices=("raid", "joinlist", "clicks", "mixed"), nargs="?", default="mixed")
+    parser.add_argument("--transport", choices=("direct", "webhook", "polling"), default="direct")
+    parser.add_argument("--updates", type=int, default=2000, help="размер сценария")
+    parser.add_argument("--concurrency", type=int, default=100, help="одновременно обрабатываемых обновлений")
+    parser.add_argument("--latency", type=float, default=0.0, help="задержка ответа Bot API, с")
+    parser.add_argument("--jitter", type=float, default=0.0, help="случайная добавка к задержке, с")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="доля ответов 500")
+    parser.add_argument("--flood-rate", type=float, default=0.0, help="доля ответов 429")
+    parser.add_argument("--retry-after", type=int, default=1, help="retry_after в ответах 429, с")
+    parser.add_argument("--telegram-limits", action="store_true", help="оставить лимиты исходящих сообщений бота")
+    parser.add_argument("--backend", choices=("memory", "sqlite"), default="memory")
+    parser.add_argument("--db", default="load_test.db", help="файл базы для --backend sqlite")
+    parser.add_argument("--timeout", type=float, default=120, help="предельная длительность прогона, с")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--out", help="сохранить результат в JSON")
+    parser.add_argument("--baseline", help="JSON прошлого прогона для сравнения")
+    args = parser.parse_args()
+
+    result = asyncio.run(run(args))
+    print(json.dumps(result, ensure_ascii=False, indent=2))
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            json.dump(result, f, ensure_ascii=False, indent=2)
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            compare(result, json.load(f))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,82 @@
+"""Медленная группа не задерживает остальные
+
+Через FakeBotAPI и polling (update_pipeline.poll) бот получает сотни
+обновлений одной группы - заявки и нажатия «Принять», каждое из которых
+пишет в ветку группы, - а следом одну заявку другой группы. Лимит
+исходящих на группу оставлен по умолчанию (OUTBOUND_CHAT_RATE), так что
+записи в ветку первой группы расходятся минутами. Проверяется, что
+заявка второй группы попадает в очередь за пару секунд: обработчики не
+ждут записей в ветку, а переполненная очередь первой группы не
+останавливает getUpdates.
+
+Запуск: python bench/slow_group_harness.py [количество_заявок]
+"""
+import asyncio
+import os
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from fake_api import FakeBotAPI
+from load_test import ADMIN_ID, GROUP_ID, callback, join_request
+
+from callbacks import ACCEPT
+
+OTHER_GROUP_ID = -1002
+DEADLINE = 2.0
+
+
+async def main(count):
+    fake = FakeBotAPI(admin_ids=(ADMIN_ID,))
+    os.environ.update({
+        "BOT_TOKEN": "123456:slow",
+        "GROUP_1_ID": str(GROUP_ID), "GROUP_1_THREAD": "10",
+        "GROUP_2_ID": str(OTHER_GROUP_ID), "GROUP_2_THREAD": "20",
+        "STATE_BACKEND": "memory",
+        "AUDIT_LOG": "",
+        "TELEGRAM_API_URL": await fake.start(),
+        # Заявки первой группы должны дойти до нажатий, а не уйти в режим рейда
+        "RAID_THRESHOLD": "0",
+    })
+    import main as bot_main
+
+    token = bot_main.callbacks.token
+    users = list(range(400000, 400000 + count))
+    updates = []
+    for user_id in users:
+        updates.append(join_request(len(updates) + 1, user_id))
+    for user_id in users:
+        updates.append(callback(len(updates) + 1, token(ACCEPT, user_id, GROUP_ID)))
+    other = join_request(len(updates) + 1, 500000)
+    other["chat_join_request"]["chat"]["id"] = OTHER_GROUP_ID
+    updates.append(other)
+
+    await bot_main.on_startup(bot_main.dp)
+    fake.feed(updates)
+    started = time.perf_counter()
+    polling = asyncio.create_task(bot_main.update_pipeline.poll(bot_main.ALLOWED_UPDATES, timeout=1))
+    while not bot_main.join_requests.count(OTHER_GROUP_ID) and time.perf_counter() - started < DEADLINE * 5:
+        await asyncio.sleep(0.01)
+    waited = time.perf_counter() - started
+    stats = bot_main.update_pipeline.stats()
+    logged = fake.calls["sendMessage"]
+
+    polling.cancel()
+    await asyncio.gather(polling, return_exceptions=True)
+    await bot_main.on_shutdown(bot_main.dp)
+    await (await bot_main.bot.get_session()).close()
+    await fake.stop()
+
+    print(f"Обновлений первой группы: {len(updates) - 1}, в ветку отправлено: {logged}")
+    print(f"Заявка второй группы в очереди через {waited:.2f} с")
+    print(f"Очереди: {stats}")
+    assert bot_main.join_requests.count(OTHER_GROUP_ID) == 1, "заявка второй группы не дошла"
+    assert waited < DEADLINE, waited
+    print("OK: медленная группа не задерживает остальные")
+
+
+if __name__ == "__main__":
+    asyncio.run(main(int(sys.argv[1]) if len(sys.argv) > 1 else 150))
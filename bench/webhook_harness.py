@@ -0,0 +1,150 @@
+"""Локальная проверка webhook: отправляет поддельные обновления в aiohttp-приложение бота
+
+Поднимает FakeBotAPI, приложение бота в режиме webhook и по HTTP отправляет
+заявки на вступление, /joinlist и нажатия кнопок. Печатает время ответа
+webhook и вызовы Bot API, которые сделал бот, и проверяет журнал и /stats.
+
+Запуск: python bench/webhook_harness.py [количество_заявок]
+"""
+import asyncio
+import os
+import sys
+import tempfile
+import time
+
+import aiohttp
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from fake_api import FakeBotAPI
+
+GROUP_ID = -1001
+ADMIN_ID = 1
+SECRET = "harness-secret"
+WEBHOOK_PORT = 18080
+
+
+def join_request_update(update_id, user_id):
+    user = {"id": user_id, "is_bot": False, "first_name": "u", "username": f"user{user_id}"}
+    return {
+        "update_id": update_id,
+        "chat_join_request": {
+            "chat": {"id": GROUP_ID, "type": "supergroup", "title": "test"},
+            "from": user,
+            "user_chat_id": user_id,
+            "date": int(time.time()),
+        },
+    }
+
+
+def command_update(update_id, text):
+    return {
+        "update_id": update_id,
+        "message": {
+            "message_id": update_id,
+            "date": int(time.time()),
+            "chat": {"id": GROUP_ID, "type": "supergroup", "title": "test"},
+            "from": {"id": ADMIN_ID, "is_bot": False, "first_name": "admin"},
+            "text": text,
+            "entities": [{"type": "bot_command", "offset": 0, "length": len(text.split()[0])}],
+        },
+    }
+
+
+def callback_update(update_id, data):
+    return {
+        "update_id": update_id,
+        "callback_query": {
+            "id": str(update_id),
+            "chat_instance": "1",
+            "from": {"id": ADMIN_ID, "is_bot": False, "first_name": "admin"},
+            "message": {
+                "message_id": 1,
+                "date": int(time.time()),
+                "chat": {"id": GROUP_ID, "type": "supergroup", "title": "test"},
+                "text": "list",
+            },
+            "data": data,
+        },
+    }
+
+
+async def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 50
+
+    fake = FakeBotAPI(admin_ids=(ADMIN_ID,))
+    os.environ.update({
+        "BOT_TOKEN": "123456:harness",
+        "GROUP_1_ID": str(GROUP_ID), "GROUP_1_THREAD": "10",
+        "GROUP_2_ID": "-1002", "GROUP_2_THREAD": "20",
+        "STATE_BACKEND": "memory",
+        "AUDIT_LOG": os.path.join(tempfile.mkdtemp(), "audit.jsonl"),
+        "TELEGRAM_API_URL": await fake.start(),
+    })
+    import main as bot_main
+    from aiogram import Bot, Dispatcher
+    from callbacks import ACCEPT, IGNORE
+    from web import create_app, start_server
+
+    Bot.set_current(bot_main.bot)
+    Dispatcher.set_current(bot_main.dp)
+    await bot_main.on_startup(bot_main.dp)
+    runner = await start_server(create_app(
+        bot_main.dp, "/webhook", SECRET, bot_main.status_snapshot, bot_main.registry,
+        pipeline=bot_main.update_pipeline, stats_provider=bot_main.audit_log.summary
+    ), WEBHOOK_PORT)
+
+    url = f"http://127.0.0.1:{WEBHOOK_PORT}/webhook"
+    headers = {"X-Telegram-Bot-Api-Secret-Token": SECRET}
+    latencies = []
+    async with aiohttp.ClientSession() as session:
+        # Без секрета запрос должен отклоняться
+        async with session.post(url, json=command_update(1, "/joinlist")) as response:
+            assert response.status == 403, response.status
+
+        updates = [join_request_update(100 + i, 5000 + i) for i in range(count)]
+        updates.append(command_update(99999, "/joinlist"))
+        updates.append(callback_update(100000, bot_main.callbacks.token(ACCEPT, 5000, GROUP_ID)))
+        updates.append(callback_update(100001, bot_main.callbacks.token(IGNORE, 5001, GROUP_ID)))
+        # Повторное нажатие получает ответ из кэша, без второго вызова API
+        updates.append(callback_update(100002, bot_main.callbacks.token(ACCEPT, 5000, GROUP_ID)))
+        # Подделанные данные отклоняются
+        updates.append(callback_update(100003, f"accept_5002_{GROUP_ID}"))
+
+        for update in updates:
+            started = time.perf_counter()
+            async with session.post(url, json=update, headers=headers) as response:
+                assert response.status == 200, response.status
+            latencies.append(time.perf_counter() - started)
+            if "callback_query" in update or "message" in update:
+                # Команды и кнопки приходят после того, как заявки обработаны
+                await asyncio.sleep(0.2)
+
+        async with session.get(f"http://127.0.0.1:{WEBHOOK_PORT}/stats") as response:
+            stats = (await response.json())["groups"][str(GROUP_ID)]
+
+    # Даём очереди исходящих сообщений время разойтись
+    await asyncio.sleep(1)
+    await runner.cleanup()
+    await bot_main.on_shutdown(bot_main.dp)
+    await (await bot_main.bot.get_session()).close()
+    await fake.stop()
+
+    latencies.sort()
+    print(f"Обновлений отправлено: {len(updates)}")
+    print(f"Ответ webhook: p50={latencies[len(latencies) // 2] * 1000:.2f} мс, "
+          f"max={latencies[-1] * 1000:.2f} мс")
+    print(f"Заявок в очереди: {bot_main.join_requests.count(GROUP_ID)}")
+    print(f"Вызовы Bot API: {dict(fake.calls)}")
+    assert bot_main.join_requests.count(GROUP_ID) == count - 2
+    assert fake.calls["approveChatJoinRequest"] == 1
+    print(f"Статистика /stats: {stats['events']}, админы: {stats['admins']}")
+    assert stats["events"] == {"request": count, "approve": 1, "ignore": 1}, stats["events"]
+    with open(bot_main.audit_log.path, encoding="utf-8") as file:
+        assert sum(1 for _ in file) == count + 2
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,75 @@
+"""Массовая обработка заявок с ограничением параллельных запросов к Bot API"""
+import asyncio
+import logging
+import time
+
+from aiogram.utils.exceptions import NetworkError, RetryAfter
+
+
+class BulkExecutor:
+    """Выполняет задачи не более чем в concurrency параллельных запросах.
+
+    При RetryAfter (flood wait) приостанавливаются все исполнители сразу,
+    а не только тот, кто получил ошибку: иначе остальные продолжат
+    упираться в тот же лимит. Сетевые ошибки повторяются с экспоненциальной
+    задержкой, прочие ошибки считаются окончательными.
+    """
+
+    def __init__(self, concurrency=8, retries=3, backoff=1.0):
+        self.concurrency = concurrency
+        self.retries = retries
+        self.backoff = backoff
+        self._resume_at = 0.0
+
+    async def _wait_flood(self):
+        delay = self._resume_at - time.monotonic()
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+    async def call(self, func, *args, **kwargs):
+        """Вызвать func с повторами при flood wait и сетевых ошибках"""
+        attempt = 0
+        while True:
+            await self._wait_flood()
+            try:
+                return await func(*args, **kwargs)
+            except RetryAfter as e:
+                self._resume_at = max(self._resume_at, time.monotonic() + e.timeout)
+                logging.warning(f"Flood wait {e.timeout} с при массовой обработке")
+            except NetworkError:
+                if attempt >= self.retries:
+                    raise
+                await asyncio.sleep(self.backoff * 2 ** attempt)
+            attempt += 1
+
+    async def run(self, items, worker, on_progress=None, progress_interval=2.0):
+        """Выполнить worker(item) для всех items.
+
+        on_progress(done, total) вызывается не чаще раза в progress_interval
+        секунд. Возвращает (успешные, [(item, ошибка), ...]).
+        """
+        items = list(items)
+        queue = iter(items)
+        succeeded, failed = [], []
+        last_progress = time.monotonic()
+
+        async def consume():
+            nonlocal last_progress
+            for item in queue:
+                try:
+                    await self.call(worker, item)
+                    succeeded.append(item)
+                except Exception as e:
+                    failed.append((item, e))
+
+                now = time.monotonic()
+                if on_progress and now - last_progress >= progress_interval:
+                    last_progress = now
+                    try:
+                        await on_progress(len(succeeded) + len(failed), len(items))
+                    except Exception as e:
+                        logging.warning(f"Ошибка обновления прогресса: {e}")
+
+        # Общий итератор раздаёт элементы исполнителям по мере освобождения
+        await asyncio.gather(*(consume() for _ in range(min(self.concurrency, len(items)))))
+        return succeeded, failed
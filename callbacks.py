@@ -0,0 +1,192 @@
+"""Компактные подписанные callback_data и маршрутизация нажатий кнопок
+
+Формат: версия (1 символ), код действия (1 символ), поля через точку и
+8 символов подписи HMAC-SHA256 в base64url. Числа записываются в base36,
+строка (фильтр списка) может быть только последним полем. Например,
+принятие пользователя 123456789 в группу -1001234567890:
+
+    1a21i3v9.-cryl7kyaXXXXXXXX   (26 байт при лимите Telegram 64)
+
+Подделанные, обрезанные и устаревшие (другой версии) данные отклоняются.
+"""
+import base64
+import hashlib
+import hmac
+import logging
+import time
+from collections import OrderedDict
+
+VERSION = "1"
+MAX_LENGTH = 64     # Лимит callback_data в Telegram, байт
+SIGNATURE_LENGTH = 8
+
+# Коды действий
+ACCEPT = "a"        # (user_id, group_id)
+IGNORE = "i"        # (user_id, group_id)
+CLOSE = "c"         # (group_id,)
+PAGE = "p"          # (group_id, page, query)
+BULK_ACCEPT = "A"   # (group_id, page или -1 для всего списка, query)
+BULK_IGNORE = "I"   # (group_id, page или -1 для всего списка, query)
+
+DIGITS = "0123456789abcdefghijklmnopqrstuvwxyz"
+
+
+def derive_key(bot_token):
+    """Ключ подписи из токена бота: одинаковый у всех реплик, новый при смене токена"""
+    return hashlib.sha256(f"callbacks:{bot_token}".encode()).digest()
+
+
+def _int36(value):
+    if value == 0:
+        return "0"
+    sign, value = ("-", -value) if value < 0 else ("", value)
+    digits = []
+    while value:
+        value, rest = divmod(value, 36)
+        digits.append(DIGITS[rest])
+    return sign + "".join(reversed(digits))
+
+
+class CallbackCodec:
+    """Кодирование и проверка callback_data"""
+
+    def __init__(self, key):
+        self.key = key
+
+    def _sign(self, body):
+        digest = hmac.new(self.key, body.encode(), hashlib.sha256).digest()
+        return base64.urlsafe_b64encode(digest[:6]).decode()
+
+    def encode(self, code, *fields):
+        parts = [_int36(field) if isinstance(field, int) else field for field in fields]
+        body = VERSION + code + ".".join(parts)
+        # Длинный фильтр обрезаем, чтобы уложиться в лимит Telegram
+        overflow = len(body.encode()) + SIGNATURE_LENGTH - MAX_LENGTH
+        if overflow > 0 and parts and not isinstance(fields[-1], int):
+            last = parts[-1].encode()[:max(0, len(parts[-1].encode()) - overflow)].decode(errors="ignore")
+            body = VERSION + code + ".".join(parts[:-1] + [last])
+        return body + self._sign(body)
+
+    def decode(self, data, types):
+        """Проверить подпись и разобрать поля по типам. Возвращает список полей или None."""
+        if len(data) < 2 + SIGNATURE_LENGTH or data[0] != VERSION:
+            return None
+        body, signature = data[:-SIGNATURE_LENGTH], data[-SIGNATURE_LENGTH:]
+        if not hmac.compare_digest(signature, self._sign(body)):
+            return None
+        raw = body[2:].split(".", len(types) - 1) if types else []
+        if len(raw) != len(types):
+            return None
+        try:
+            return [int(value, 36) if kind is int else value for kind, value in zip(types, raw)]
+        except ValueError:
+            return None
+
+
+class InflightCache:
+    """Повторные нажатия одной кнопки: (действие, поля) -> ответ.
+
+    Пока первое нажатие обрабатывается, повторы получают «уже выполняется»;
+    после завершения - тот же ответ в течение ttl секунд. Сроки у всех
+    записей одинаковые, поэтому в OrderedDict они идут по возрастанию и
+    просроченные удаляются с начала.
+    """
+    IN_FLIGHT = "⏳ Уже выполняется..."
+
+    def __init__(self, ttl=30, clock=time.monotonic):
+        self.ttl = ttl
+        self._clock = clock
+        self._entries = OrderedDict()   # ключ -> (ответ или None, срок)
+        self.hits = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def _purge(self, now):
+        while self._entries:
+            key, (_, deadline) = next(iter(self._entries.items()))
+            if deadline > now:
+                break
+            del self._entries[key]
+
+    def begin(self, key):
+        """None - нажатие первое, выполняем; иначе - ответ для повтора"""
+        now = self._clock()
+        self._purge(now)
+        entry = self._entries.get(key)
+        if entry is None:
+            self._entries[key] = (None, now + self.ttl)
+            return None
+        self.hits += 1
+        return entry[0] or self.IN_FLIGHT
+
+    def finish(self, key, answer):
+        """Запомнить ответ первого нажатия"""
+        self._entries[key] = (answer, self._clock() + self.ttl)
+        self._entries.move_to_end(key)
+
+    def fail(self, key):
+        """Забыть нажатие: следующее выполнится заново"""
+        self._entries.pop(key, None)
+
+
+class CallbackRouter:
+    """Выбор обработчика по коду действия из callback_data.
+
+    Обработчик вызывается как handler(callback_query, *поля). С dedup=True
+    повторные нажатия с теми же полями получают ответ из InflightCache без
+    вызова обработчика; обработчик в этом случае возвращает текст, которым
+    ответил на нажатие (None - не запоминать).
+    """
+
+    def __init__(self, key, answer, dedup_ttl=30):
+        self.codec = CallbackCodec(key)
+        self.answer = answer    # async answer(callback_query, text)
+        self.inflight = InflightCache(dedup_ttl)
+        self._handlers = {}     # код -> (handler, типы полей, dedup)
+
+    def token(self, code, *fields):
+        """callback_data для кнопки"""
+        return self.codec.encode(code, *fields)
+
+    @staticmethod
+    def action(data):
+        """Код действия из callback_data (без проверки подписи)"""
+        return (data or "")[1:2]
+
+    def handler(self, code, *types, dedup=False):
+        def decorator(func):
+            self._handlers[code] = (func, types, dedup)
+            return func
+        return decorator
+
+    async def dispatch(self, callback_query):
+        """Выполнить нажатие. False - данные не подписаны нами или устарели."""
+        data = callback_query.data or ""
+        route = self._handlers.get(data[1:2])
+        fields = self.codec.decode(data, route[1]) if route else None
+        if fields is None:
+            # Поддельные и устаревшие нажатия частые: строка форматируется, только если DEBUG включён
+            logging.debug("Отклонены callback_data: %r", data)
+            return False
+
+        handler, _, dedup = route
+        if not dedup:
+            await handler(callback_query, *fields)
+            return True
+
+        key = (data[1], *fields)
+        cached = self.inflight.begin(key)
+        if cached is not None:
+            await self.answer(callback_query, cached)
+            return True
+        try:
+            answer = await handler(callback_query, *fields)
+        except Exception:
+            self.inflight.fail(key)
+            raise
+        if answer:
+            self.inflight.finish(key, answer)
+        else:
+            self.inflight.fail(key)
+        return True
@@ -0,0 +1,126 @@
+"""Несколько реплик бота: распределение групп по кольцу хешей и пересылка обновлений владельцу"""
+import asyncio
+import bisect
+import hashlib
+import logging
+
+import aiohttp
+
+from web import SECRET_HEADER
+
+# Обновление уже переслано владельцу группы - обрабатываем на месте, не пересылая дальше
+FORWARDED_HEADER = "X-Bot-Forwarded-By"
+
+
+def _hash(key):
+    return int.from_bytes(hashlib.blake2b(str(key).encode(), digest_size=8).digest(), "big")
+
+
+class HashRing:
+    """Консистентное хеширование: каждая реплика занимает vnodes точек на кольце.
+
+    Группа принадлежит реплике с ближайшей точкой по часовой стрелке, поэтому
+    при добавлении или удалении реплики переезжает только ~1/N групп.
+    """
+
+    def __init__(self, nodes, vnodes=64):
+        self.nodes = sorted(nodes)
+        points = sorted((_hash(f"{node}#{i}"), node) for node in self.nodes for i in range(vnodes))
+        self._keys = [key for key, _ in points]
+        self._nodes = [node for _, node in points]
+
+    def owner(self, key):
+        if not self._keys:
+            return None
+        index = bisect.bisect(self._keys, _hash(key)) % len(self._keys)
+        return self._nodes[index]
+
+
+def parse_replicas(spec):
+    """Разбор REPLICAS: "id=url_webhook, id=url_webhook" -> {id: url}"""
+    replicas = {}
+    for item in filter(None, (part.strip() for part in (spec or "").split(","))):
+        replica_id, _, url = item.partition("=")
+        replicas[replica_id.strip()] = url.strip()
+    return replicas
+
+
+def update_chat_id(update):
+    """ID чата, к которому относится обновление (сырой JSON от Telegram), или None"""
+    for field in ("message", "edited_message", "chat_join_request", "chat_member", "my_chat_member"):
+        if field in update:
+            return update[field]["chat"]["id"]
+    message = (update.get("callback_query") or {}).get("message")
+    return message["chat"]["id"] if message else None
+
+
+class Cluster:
+    """Реплика в группе реплик за балансировщиком webhook.
+
+    Каждая группа закреплена за одной репликой (HashRing): она хранит
+    актуальные заявки группы в памяти, ведёт её списки и таймеры.
+    Обновления чужих групп пересылаются владельцу; если он недоступен,
+    обновление обрабатывается на месте - двойное принятие исключают
+    claim-операции общего хранилища (storage.py).
+    Без REPLICAS (одна реплика) все группы свои и пересылки нет.
+    """
+
+    def __init__(self, replica_id, replicas=None, secret=None, timeout=5):
+        self.replica_id = replica_id
+        self.replicas = replicas or {}
+        self.secret = secret
+        self.timeout = timeout
+        self.ring = HashRing(self.replicas or [replica_id])
+        self.forwarded = 0
+        self.forward_failed = 0
+        self._session = None
+
+    @property
+    def enabled(self):
+        return len(self.replicas) > 1
+
+    @property
+    def is_leader(self):
+        """Первая реплика по имени выполняет общие для всех действия (webhook, сжатие базы)"""
+        return self.ring.nodes[0] == self.replica_id
+
+    def owner(self, group_id):
+        return self.ring.owner(group_id)
+
+    def owns(self, group_id):
+        return not self.enabled or self.ring.owner(group_id) == self.replica_id
+
+    def route(self, update, headers):
+        """Кому переслать обновление: ID реплики-владельца или None (обработать здесь)"""
+        if not self.enabled or FORWARDED_HEADER in headers:
+            return None
+        chat_id = update_chat_id(update)
+        if chat_id is None or self.owns(chat_id):
+            return None
+        return self.owner(chat_id)
+
+    async def start(self):
+        if self.enabled and self._session is None:
+            self._session = aiohttp.ClientSession(timeout=aiohttp.ClientTimeout(total=self.timeout))
+
+    async def stop(self):
+        if self._session:
+            await self._session.close()
+            self._session = None
+
+    async def forward(self, update, owner):
+        """Переслать обновление владельцу. Возвращает True, если он его принял."""
+        headers = {FORWARDED_HEADER: self.replica_id}
+        if self.secret:
+            headers[SECRET_HEADER] = self.secret
+        try:
+            async with self._session.post(self.replicas[owner], json=update, headers=headers) as response:
+                if response.status == 200:
+                    self.forwarded += 1
+                    return True
+                error = f"HTTP {response.status}"
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            error = type(e).__name__
+        self.forward_failed += 1
+        logging.warning(f"Не удалось переслать обновление реплике {owner}: {error}")
+        return False
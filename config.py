@@ -0,0 +1,136 @@
+"""Настройки групп: загрузка из переменных окружения и файла конфигурации"""
+import json
+import logging
+import os
+import re
+from dataclasses import dataclass, field
+from types import MappingProxyType
+from typing import Mapping, Optional
+
+try:
+    import tomllib
+except ImportError:
+    tomllib = None
+
+try:
+    import yaml
+except ImportError:
+    yaml = None
+
+
+@dataclass(frozen=True)
+class GroupSettings:
+    """Настройки одной группы"""
+    group_id: int
+    thread_id: Optional[int] = None     # Закрытая ветка для журнала решений
+    joinlist_timeout: int = 120         # Через сколько секунд удалять список заявок
+    extra: Mapping = field(default_factory=lambda: MappingProxyType({}))  # Прочие настройки из файла
+
+
+@dataclass(frozen=True)
+class GroupRegistry:
+    """Неизменяемый реестр групп.
+
+    ids - frozenset для проверки допуска за O(1), groups - словарь
+    group_id -> GroupSettings. При перезагрузке конфигурации создаётся новый
+    реестр и подменяется одной ссылкой, поэтому обработчики всегда видят
+    целостный набор настроек.
+    """
+    ids: frozenset
+    groups: Mapping[int, GroupSettings]
+
+    def __contains__(self, group_id):
+        return group_id in self.ids
+
+    def __len__(self):
+        return len(self.ids)
+
+    def get(self, group_id):
+        return self.groups.get(group_id)
+
+    def thread_id(self, group_id):
+        settings = self.groups.get(group_id)
+        return settings.thread_id if settings else None
+
+    def joinlist_timeout(self, group_id, default=120):
+        settings = self.groups.get(group_id)
+        return settings.joinlist_timeout if settings else default
+
+
+def read_config_file(path):
+    """Прочитать файл конфигурации (JSON, YAML или TOML - по расширению)"""
+    ext = os.path.splitext(path)[1].lower()
+    if ext in (".yaml", ".yml"):
+        if yaml is None:
+            raise RuntimeError("Для YAML-конфигурации установите пакет PyYAML")
+        with open(path, encoding="utf-8") as f:
+            return yaml.safe_load(f) or {}
+    if ext == ".toml":
+        if tomllib is None:
+            raise RuntimeError("TOML-конфигурация требует Python 3.11+")
+        with open(path, "rb") as f:
+            return tomllib.load(f)
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def _env_groups(env):
+    """Группы из GROUP_<n>_ID / GROUP_<n>_THREAD (n - любое число)"""
+    groups = {}
+    for key, value in env.items():
+        match = re.fullmatch(r"GROUP_(\d+)_ID", key)
+        if match and value:
+            thread = env.get(f"GROUP_{match.group(1)}_THREAD")
+            groups[int(value)] = {"thread": int(thread) if thread else None}
+    return groups
+
+
+def load_registry(path=None, env=None):
+    """Собрать реестр групп из окружения и (если задан) файла конфигурации.
+
+    Формат файла:
+        defaults: {joinlist_timeout: 120}
+        groups:
+          - {id: -100123, thread: 45, joinlist_timeout: 300}
+          - id: -100456
+            rules:                      # автомодерация, см. rules.py
+              deny_usernames: ["(?:bot|casino)\\d*$"]
+              deny_words: [promo, airdrop]
+              no_username: decline
+              rate: {max: 30, window: 60, action: queue}
+
+    Настройки из файла дополняют и перекрывают группы из окружения.
+    """
+    env = os.environ if env is None else env
+    raw = _env_groups(env)
+    defaults = {"joinlist_timeout": int(env.get("JOINLIST_TIMEOUT", 120))}
+
+    if path:
+        data = read_config_file(path)
+        defaults.update(data.get("defaults") or {})
+        for group in data.get("groups") or []:
+            group = dict(group)
+            raw.setdefault(int(group.pop("id")), {}).update(group)
+
+    # Старый формат своих сроков: JOINLIST_TIMEOUTS="group_id:секунды,...".
+    # Только для уже настроенных групп: срок не должен добавлять группу в допуск
+    for item in filter(None, (part.strip() for part in env.get("JOINLIST_TIMEOUTS", "").split(","))):
+        group, _, seconds = item.rpartition(":")
+        if int(group) not in raw:
+            logging.warning(f"JOINLIST_TIMEOUTS: группа {group} не настроена, срок пропущен")
+            continue
+        # Срок из файла по-прежнему важнее
+        raw[int(group)].setdefault("joinlist_timeout", int(seconds))
+
+    groups = {}
+    for group_id, settings in raw.items():
+        settings = {**defaults, **settings}
+        thread = settings.pop("thread", None)
+        timeout = int(settings.pop("joinlist_timeout"))
+        groups[group_id] = GroupSettings(
+            group_id=group_id,
+            thread_id=int(thread) if thread is not None else None,
+            joinlist_timeout=timeout,
+            extra=MappingProxyType(settings),
+        )
+    return GroupRegistry(ids=frozenset(groups), groups=MappingProxyType(groups))
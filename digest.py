@@ -0,0 +1,145 @@
+"""Сводные уведомления о новых заявках: волна заявок - одно сообщение, которое обновляется"""
+import asyncio
+import logging
+import time
+from collections import deque
+
+RECENT_USERNAMES = 5
+
+
+def single_text(username, user_id):
+    """Уведомление об одной заявке (как раньше)"""
+    return (
+        f"🆕 <b>Новая заявка на вступление!</b>\n"
+        f"👤 От: @{username} (ID: {user_id})\n"
+        f"📝 Для просмотра списка используйте /joinlist"
+    )
+
+
+def digest_text(total, recent):
+    """Сводка по волне заявок: количество и последние ники"""
+    names = ", ".join(f"@{username}" for username in reversed(recent))
+    more = f" и ещё {total - len(recent)}" if total > len(recent) else ""
+    return (
+        f"🆕 <b>Новые заявки на вступление: {total}</b>\n"
+        f"👤 Последние: {names}{more}\n"
+        f"📝 Для просмотра списка используйте /joinlist"
+    )
+
+
+class _Burst:
+    """Волна заявок одной группы и её сообщение"""
+
+    def __init__(self, now):
+        self.started = now
+        self.last_event = now
+        self.total = 0
+        self.pending = 0
+        self.last_user = None
+        self.recent = deque(maxlen=RECENT_USERNAMES)
+        self.message_id = None
+        self.wakeup = asyncio.Event()
+        self.task = None
+
+
+class JoinDigest:
+    """Объединение уведомлений о заявках по группам.
+
+    Первая заявка после затишья уходит сразу обычным уведомлением. Заявки,
+    пришедшие следом, копятся и не чаще раза в window секунд (или сразу при
+    накоплении threshold штук) превращают это сообщение в сводку правкой
+    на месте. Если window секунд заявок нет - волна закончилась, следующая
+    снова начнётся с отдельного сообщения. Сводка старше max_age секунд
+    продолжается новым сообщением, чтобы не теряться в истории чата.
+    """
+
+    def __init__(self, outbox, window=3.0, threshold=50, max_age=600, clock=time.monotonic):
+        self.outbox = outbox
+        self.window = window
+        self.threshold = threshold
+        self.max_age = max_age
+        self._clock = clock
+        self._bursts = {}   # group_id -> _Burst
+        self.requests = 0
+        self.sent = 0
+        self.edited = 0
+
+    def add(self, group_id, user_id, username):
+        """Учесть новую заявку (не ждёт отправки)"""
+        self.requests += 1
+        now = self._clock()
+        burst = self._bursts.get(group_id)
+        if burst is None:
+            burst = self._bursts[group_id] = _Burst(now)
+        burst.last_event = now
+        burst.total += 1
+        burst.pending += 1
+        burst.last_user = (username, user_id)
+        burst.recent.append(username)
+
+        if burst.task is None:
+            burst.task = asyncio.create_task(self._run(group_id, burst))
+        elif burst.pending >= self.threshold:
+            burst.wakeup.set()
+
+    async def _run(self, group_id, burst):
+        try:
+            while True:
+                if burst.pending:
+                    await self._flush(group_id, burst)
+                burst.wakeup.clear()
+                try:
+                    await asyncio.wait_for(burst.wakeup.wait(), self.window)
+                except asyncio.TimeoutError:
+                    pass
+                if not burst.pending and self._clock() - burst.last_event >= self.window:
+                    break
+        except Exception:
+            logging.exception(f"Ошибка сводки заявок для группы {group_id}")
+        finally:
+            # Между проверкой и удалением нет await, поэтому новая заявка не потеряется
+            if self._bursts.get(group_id) is burst:
+                del self._bursts[group_id]
+
+    async def _flush(self, group_id, burst):
+        count, burst.pending = burst.pending, 0
+        if burst.message_id is not None and self._clock() - burst.started > self.max_age:
+            # Сводка ушла далеко вверх - продолжаем новым сообщением с новым счётом
+            burst.message_id = None
+            burst.started = self._clock()
+            burst.total = count
+
+        if burst.total == 1:
+            text = single_text(*burst.last_user)
+        else:
+            text = digest_text(burst.total, burst.recent)
+
+        if burst.message_id is not None:
+            try:
+                await self.outbox.edit_message_text(text, group_id, burst.message_id, parse_mode='HTML')
+                self.edited += 1
+                return
+            except Exception as e:
+                # Например, сообщение удалили - отправим сводку заново
+                logging.warning(f"Не удалось обновить сводку заявок: {e}")
+
+        try:
+            message = await self.outbox.send_message(group_id, text, parse_mode='HTML')
+            burst.message_id = message.message_id
+            self.sent += 1
+        except Exception as e:
+            logging.error(f"Не удалось отправить уведомление о заявке: {e}")
+
+    async def stop(self):
+        for burst in list(self._bursts.values()):
+            if burst.task:
+                burst.task.cancel()
+        self._bursts.clear()
+
+    def stats(self):
+        return {
+            "active_groups": len(self._bursts),
+            "requests": self.requests,
+            "sent": self.sent,
+            "edited": self.edited,
+        }
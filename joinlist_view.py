@@ -0,0 +1,145 @@
+"""Постраничный вывод списка заявок с кэшем и поиском по префиксу"""
+import html
+from bisect import bisect_left
+
+from aiogram.types import InlineKeyboardMarkup, InlineKeyboardButton
+
+from callbacks import ACCEPT, BULK_ACCEPT, BULK_IGNORE, CLOSE, IGNORE, PAGE
+
+
+class PrefixIndex:
+    """Отсортированные ключи для поиска по префиксу за O(log n + k)"""
+
+    def __init__(self, pairs):
+        self._keys = sorted(pairs)
+
+    def search(self, prefix):
+        """user_id всех записей, ключ которых начинается с prefix"""
+        result = []
+        keys = self._keys
+        i = bisect_left(keys, (prefix,))
+        while i < len(keys) and keys[i][0].startswith(prefix):
+            result.append(keys[i][1])
+            i += 1
+        return result
+
+
+class JoinListView:
+    """Рендер страниц /joinlist.
+
+    Готовые страницы кэшируются для каждой группы и сбрасываются только
+    когда меняется версия заявок этой группы (см. RequestStore.version).
+    Индексы для поиска строятся лениво при первом поиске после изменения.
+    callback_data кнопок выдаёт callbacks.token (см. callbacks.py).
+    """
+
+    def __init__(self, store, callbacks, page_size=10, max_cached_pages=64):
+        self.store = store
+        self.callbacks = callbacks
+        self.page_size = page_size
+        self.max_cached_pages = max_cached_pages
+        self._pages = {}    # group_id -> (version, {(page, query): (text, markup, page)})
+        self._indexes = {}  # group_id -> (version, индекс по нику, индекс по ID)
+
+    def _matches(self, group_id, query):
+        """Заявки группы, подходящие под фильтр, в порядке поступления"""
+        entries = self.store.list(group_id)
+        if not query:
+            return entries
+
+        version = self.store.version(group_id)
+        cached = self._indexes.get(group_id)
+        if cached is None or cached[0] != version:
+            by_username = PrefixIndex((e.username.lower(), e.user_id) for e in entries)
+            by_id = PrefixIndex((str(e.user_id), e.user_id) for e in entries)
+            cached = self._indexes[group_id] = (version, by_username, by_id)
+
+        # Ники в Telegram не начинаются с цифры, поэтому цифры - это поиск по ID
+        index = cached[2] if query.isdigit() else cached[1]
+        found = set(index.search(query))
+        return [e for e in entries if e.user_id in found]
+
+    def render(self, group_id, page=0, query=""):
+        """Текст и клавиатура страницы. Возвращает (text, markup, page) или None, если заявок нет."""
+        query = normalize_query(query)
+        self.store.expire(group_id)
+        version = self.store.version(group_id)
+
+        cached = self._pages.get(group_id)
+        if cached is None or cached[0] != version:
+            cached = self._pages[group_id] = (version, {})
+        pages = cached[1]
+
+        key = (page, query)
+        if key not in pages:
+            if len(pages) >= self.max_cached_pages:
+                pages.clear()
+            pages[key] = self._render(group_id, page, query)
+        return pages[key]
+
+    def select(self, group_id, page=None, query=""):
+        """Заявки под фильтром: все (page=None) или только указанной страницы"""
+        entries = self._matches(group_id, normalize_query(query))
+        if page is None or not entries:
+            return entries
+        return self._page(entries, page)[0]
+
+    def _page(self, entries, page):
+        total_pages = (len(entries) + self.page_size - 1) // self.page_size
+        page = max(0, min(page, total_pages - 1))
+        return entries[page * self.page_size:(page + 1) * self.page_size], page, total_pages
+
+    def _render(self, group_id, page, query):
+        entries = self._matches(group_id, query)
+        if not entries:
+            return None
+
+        chunk, page, total_pages = self._page(entries, page)
+
+        if query:
+            text = f"🔎 <b>Поиск заявок:</b> {html.escape(query)}\n"
+        else:
+            text = "📋 <b>Список входящих заявок:</b>\n"
+        text += f"Всего: {len(entries)} | Страница {page + 1}/{total_pages}\n\n"
+
+        token = self.callbacks.token
+        markup = InlineKeyboardMarkup()
+        for user in chunk:
+            i = user.ordinal
+            text += f"{i}. @{user.username} (ID: {user.user_id})\n"
+
+            # Добавляем кнопки для каждого пользователя
+            markup.row(
+                InlineKeyboardButton(f"✅ Принять #{i}", callback_data=token(ACCEPT, user.user_id, group_id)),
+                InlineKeyboardButton(f"❌ Игнорировать #{i}", callback_data=token(IGNORE, user.user_id, group_id))
+            )
+
+        # Навигация по страницам
+        nav = []
+        if page > 0:
+            nav.append(InlineKeyboardButton("◀️ Назад", callback_data=token(PAGE, group_id, page - 1, query)))
+        if page < total_pages - 1:
+            nav.append(InlineKeyboardButton("Вперёд ▶️", callback_data=token(PAGE, group_id, page + 1, query)))
+        if nav:
+            markup.row(*nav)
+
+        # Массовые действия: над всем списком (с учётом фильтра, страница -1) и над текущей страницей
+        markup.row(
+            InlineKeyboardButton("✅ Принять всех", callback_data=token(BULK_ACCEPT, group_id, -1, query)),
+            InlineKeyboardButton("❌ Игнорировать всех", callback_data=token(BULK_IGNORE, group_id, -1, query))
+        )
+        if total_pages > 1:
+            markup.row(
+                InlineKeyboardButton("✅ Принять страницу", callback_data=token(BULK_ACCEPT, group_id, page, query)),
+                InlineKeyboardButton("❌ Игнорировать страницу", callback_data=token(BULK_IGNORE, group_id, page, query))
+            )
+
+        # Кнопка закрытия списка
+        markup.add(InlineKeyboardButton("🚫 Закрыть список", callback_data=token(CLOSE, group_id)))
+        return text, markup, page
+
+
+def normalize_query(query):
+    """Фильтр /joinlist: без @, в нижнем регистре, не длиннее ника Telegram"""
+    return (query or "").strip().lstrip("@").lower()[:32]
+
@@ -0,0 +1,134 @@
+"""Пинги для поддержания активности: общий пул соединений и статистика задержек"""
+import asyncio
+import logging
+import random
+import time
+from bisect import bisect_left
+
+import aiohttp
+
+# Верхние границы корзин гистограммы задержек, секунды
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+class PingTarget:
+    """Цель пинга: адрес, набор путей и окно случайной задержки между пингами"""
+
+    def __init__(self, name, base_url, paths=("/",), min_delay=60, max_delay=840, max_backoff=3600):
+        self.name = name
+        self.base_url = base_url.rstrip("/")
+        self.paths = paths
+        self.min_delay = min_delay
+        self.max_delay = max_delay
+        self.max_backoff = max_backoff
+
+        self.ok = 0
+        self.failed = 0
+        self.consecutive_failures = 0
+        self.last_status = None
+        self.last_error = None
+        self.last_latency = None
+        self.latency_sum = 0.0
+        self.histogram = [0] * (len(LATENCY_BUCKETS) + 1)   # Последняя корзина - больше 10 с
+
+    def next_delay(self):
+        """Случайная задержка в окне; после ошибок окно растёт экспоненциально"""
+        delay = random.uniform(self.min_delay, self.max_delay)
+        if self.consecutive_failures:
+            delay = min(self.max_backoff, delay * 2 ** min(self.consecutive_failures, 6))
+        return delay
+
+    def record(self, latency, status=None, error=None):
+        self.last_latency = latency
+        self.last_status = status
+        self.last_error = error
+        if error is None:
+            # Задержки учитываем только для успешных пингов
+            self.latency_sum += latency
+            self.histogram[bisect_left(LATENCY_BUCKETS, latency)] += 1
+            self.ok += 1
+            self.consecutive_failures = 0
+        else:
+            self.failed += 1
+            self.consecutive_failures += 1
+
+    def stats(self):
+        return {
+            "url": self.base_url,
+            "ok": self.ok,
+            "failed": self.failed,
+            "consecutive_failures": self.consecutive_failures,
+            "last_status": self.last_status,
+            "last_error": self.last_error,
+            "last_latency": self.last_latency,
+            "latency_avg": self.latency_sum / self.ok if self.ok else None,
+            "latency_histogram": dict(zip([str(b) for b in LATENCY_BUCKETS] + ["+Inf"], self.histogram)),
+        }
+
+
+def parse_targets(spec):
+    """Разбор PING_TARGETS: "url|мин-макс, url|мин-макс" (задержки в секундах, окно необязательно)"""
+    targets = []
+    for item in filter(None, (part.strip() for part in spec.split(","))):
+        url, _, window = item.partition("|")
+        target = PingTarget(url, url)
+        if window:
+            low, _, high = window.partition("-")
+            target.min_delay, target.max_delay = int(low), int(high or low)
+        targets.append(target)
+    return targets
+
+
+class KeepAlive:
+    """Фоновые пинги всех целей через одну сессию aiohttp.
+
+    Сессия держит keep-alive соединения и кэш DNS, поэтому повторный пинг
+    не тратит время на резолв и TCP/TLS-рукопожатие.
+    """
+
+    def __init__(self, targets, timeout=10):
+        self.targets = targets
+        self.timeout = timeout
+        self._session = None
+        self._tasks = []
+
+    async def start(self):
+        connector = aiohttp.TCPConnector(limit=len(self.targets) or 1, keepalive_timeout=1800, ttl_dns_cache=3600)
+        self._session = aiohttp.ClientSession(connector=connector,
+                                              timeout=aiohttp.ClientTimeout(total=self.timeout))
+        self._tasks = [asyncio.create_task(self._run(target)) for target in self.targets]
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        self._tasks = []
+        if self._session:
+            await self._session.close()
+            self._session = None
+
+    async def ping(self, target):
+        url = target.base_url + random.choice(target.paths)
+        started = time.monotonic()
+        try:
+            async with self._session.get(url) as response:
+                await response.read()
+                error = None if response.status < 500 else f"HTTP {response.status}"
+                target.record(time.monotonic() - started, response.status, error)
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            target.record(time.monotonic() - started, error=type(e).__name__)
+
+        if target.last_error:
+            logging.warning(f"Не удалось пинговать {url}: {target.last_error}")
+        else:
+            logging.info("Пинг %s: %s за %.0f мс", url, target.last_status, target.last_latency * 1000)
+
+    async def _run(self, target):
+        while True:
+            await asyncio.sleep(target.next_delay())
+            try:
+                await self.ping(target)
+            except Exception:
+                logging.exception(f"Ошибка в системе пинга {target.name}")
+
+    def stats(self):
+        return {target.name: target.stats() for target in self.targets}
@@ -0,0 +1,114 @@
+"""Живой список заявок: одно сообщение /joinlist на группу, обновляемое правками"""
+import asyncio
+import hashlib
+import logging
+
+from aiogram.utils.exceptions import MessageNotModified, MessageToEditNotFound
+
+EMPTY_TEXT = "📭 Все заявки разобраны."
+
+
+def content_hash(text, markup=None):
+    """Отпечаток содержимого сообщения: одинаковый - правка ничего не изменит"""
+    digest = hashlib.blake2b(text.encode(), digest_size=16)
+    if markup is not None:
+        digest.update(markup.as_json().encode())
+    return digest.digest()
+
+
+class _LiveMessage:
+    def __init__(self, message_id, page, query, digest):
+        self.message_id = message_id
+        self.page = page
+        self.query = query
+        self.hash = digest
+        self.task = None
+
+
+class LiveJoinList:
+    """Сообщения со списком заявок, которые обновляются при изменении заявок.
+
+    touch(group_id) после изменения откладывает правку на delay секунд:
+    все изменения за это время дают одну правку. Перед правкой новое
+    содержимое сравнивается с отпечатком показанного - если ничего не
+    изменилось (например, изменения затронули другую страницу), запрос к API
+    не делается. Если сообщение удалили, вызывается on_gone(group_id).
+    """
+
+    def __init__(self, view, outbox, delay=1.0, on_gone=None):
+        self.view = view
+        self.outbox = outbox
+        self.delay = delay
+        self.on_gone = on_gone
+        self._messages = {}     # group_id -> _LiveMessage
+        self.edits = 0
+        self.skipped = 0
+
+    def __contains__(self, group_id):
+        return group_id in self._messages
+
+    def attach(self, group_id, message_id, page=0, query="", text=None, markup=None):
+        """Сделать сообщение живым списком группы (text и markup - то, что уже показано)"""
+        self.detach(group_id)
+        digest = content_hash(text, markup) if text is not None else None
+        self._messages[group_id] = _LiveMessage(message_id, page, query, digest)
+
+    def detach(self, group_id):
+        live = self._messages.pop(group_id, None)
+        if live and live.task:
+            live.task.cancel()
+
+    def shown(self, group_id, page, query, text, markup):
+        """Список перелистнули или отфильтровали - запомнить, что показано"""
+        live = self._messages.get(group_id)
+        if live:
+            live.page, live.query = page, query
+            live.hash = content_hash(text, markup)
+
+    def touch(self, group_id):
+        """Заявки группы изменились - запланировать правку списка"""
+        live = self._messages.get(group_id)
+        if live and live.task is None:
+            live.task = asyncio.create_task(self._refresh_later(group_id, live))
+
+    async def _refresh_later(self, group_id, live):
+        try:
+            await asyncio.sleep(self.delay)
+        finally:
+            live.task = None
+        if self._messages.get(group_id) is live:
+            await self.refresh(group_id, live)
+
+    async def refresh(self, group_id, live):
+        rendered = self.view.render(group_id, live.page, live.query)
+        if rendered is None:
+            text, markup, page = EMPTY_TEXT, None, 0
+        else:
+            text, markup, page = rendered
+
+        digest = content_hash(text, markup)
+        if digest == live.hash:
+            self.skipped += 1
+            return
+        try:
+            await self.outbox.edit_message_text(
+                text, group_id, live.message_id, reply_markup=markup, parse_mode='HTML'
+            )
+        except MessageNotModified:
+            pass
+        except MessageToEditNotFound:
+            # Список удалили вручную - больше не обновляем
+            if self._messages.get(group_id) is live:
+                self.detach(group_id)
+                if self.on_gone:
+                    self.on_gone(group_id)
+            return
+        except Exception as e:
+            logging.warning(f"Не удалось обновить список заявок: {e}")
+            return
+        live.page, live.hash = page, digest
+        self.edits += 1
+
+    async def stop(self):
+        for group_id in list(self._messages):
+            self.detach(group_id)
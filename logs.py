@@ -0,0 +1,167 @@
+"""Логирование без блокировки цикла событий: очередь, фоновый поток записи, JSON и выборка"""
+import atexit
+import contextvars
+import json
+import logging
+import os
+import queue
+import sys
+import time
+from datetime import datetime
+from logging.handlers import QueueHandler, QueueListener, TimedRotatingFileHandler
+
+# Поля контекста текущего обновления (update, chat, user) - см. update_pipeline.py
+log_context = contextvars.ContextVar("log_context", default=None)
+
+# Стандартные атрибуты LogRecord; всё остальное пришло через extra и попадает в JSON
+_RECORD_FIELDS = set(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {"message", "asctime", "context"}
+
+
+def set_context(**fields):
+    """Поля, которые добавляются ко всем записям текущей задачи (и созданных из неё)"""
+    log_context.set(fields)
+
+
+class JsonFormatter(logging.Formatter):
+    """Одна запись - одна строка JSON: время, уровень, логгер, сообщение, контекст и extra"""
+
+    def format(self, record):
+        data = {
+            "ts": datetime.fromtimestamp(record.created).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+        }
+        context = getattr(record, "context", None)
+        if context:
+            data.update(context)
+        for key, value in vars(record).items():
+            if key not in _RECORD_FIELDS:
+                data[key] = value
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            data["exc"] = record.exc_text
+        return json.dumps(data, ensure_ascii=False, default=str)
+
+
+class TextFormatter(logging.Formatter):
+    """Прежний формат basicConfig, контекст - в квадратных скобках в конце"""
+
+    def __init__(self):
+        super().__init__("%(levelname)s:%(name)s:%(message)s")
+
+    def format(self, record):
+        text = super().format(record)
+        context = getattr(record, "context", None)
+        if context:
+            text += " [" + " ".join(f"{key}={value}" for key, value in context.items()) + "]"
+        return text
+
+
+class SamplingFilter(logging.Filter):
+    """Выборка частых событий.
+
+    Записи с extra={"sample": ключ} пропускаются не больше limit раз за
+    interval секунд на ключ (например, заявка на каждое вступление во время
+    рейда). Число отброшенных записей добавляется полем suppressed к первой
+    записи следующего окна. Записи без ключа не ограничиваются.
+    """
+
+    def __init__(self, limit=20, interval=1.0, clock=time.monotonic):
+        super().__init__()
+        self.limit = limit
+        self.interval = interval
+        self._clock = clock
+        self._windows = {}  # ключ -> [начало окна, пропущено, отброшено]
+
+    def filter(self, record):
+        key = getattr(record, "sample", None)
+        if key is None or not self.limit:
+            return True
+        now = self._clock()
+        window = self._windows.get(key)
+        if window is None or now - window[0] >= self.interval:
+            if window and window[2]:
+                record.suppressed = window[2]
+            window = self._windows[key] = [now, 0, 0]
+        if window[1] >= self.limit:
+            window[2] += 1
+            return False
+        window[1] += 1
+        return True
+
+
+class ContextQueueHandler(QueueHandler):
+    """Кладёт запись в очередь как есть: форматирование - в потоке записи.
+
+    Здесь, в потоке вызова, запоминается только контекст (в потоке записи
+    его уже не видно) и текст исключения (traceback может измениться).
+    """
+
+    def prepare(self, record):
+        record.context = log_context.get()
+        if record.exc_info and not record.exc_text:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+
+class RotatingLogHandler(TimedRotatingFileHandler):
+    """Файл с ротацией по времени (when) и по размеру (max_bytes), что наступит раньше"""
+
+    def __init__(self, path, when="midnight", max_bytes=0, backups=7):
+        super().__init__(path, when=when, backupCount=backups, encoding="utf-8", delay=True)
+        self.max_bytes = max_bytes
+        # Несколько ротаций по размеру за один период получают суффиксы .1, .2, ...
+        self.namer = self._unique_name
+
+    @staticmethod
+    def _unique_name(name):
+        candidate, index = name, 0
+        while os.path.exists(candidate):
+            index += 1
+            candidate = f"{name}.{index}"
+        return candidate
+
+    def shouldRollover(self, record):
+        if self.max_bytes and self.stream is not None and self.stream.tell() >= self.max_bytes:
+            return True
+        return super().shouldRollover(record)
+
+
+class _Listener(QueueListener):
+    """QueueListener, который можно останавливать повторно (вручную и при выходе)"""
+
+    def stop(self):
+        if self._thread is not None:
+            super().stop()
+
+
+def setup_logging(level="INFO", fmt="json", path=None, max_bytes=0, when="midnight", backups=7, sample_limit=20):
+    """Настроить корневой логгер: запись в stderr (и в файл path) из фонового потока.
+
+    Возвращает запущенный QueueListener; при выходе он останавливается
+    сам и дописывает всё, что осталось в очереди.
+    """
+    formatter = JsonFormatter() if fmt == "json" else TextFormatter()
+    handlers = [logging.StreamHandler(sys.stderr)]
+    if path:
+        handlers.append(RotatingLogHandler(path, when=when, max_bytes=max_bytes, backups=backups))
+    for handler in handlers:
+        handler.setFormatter(formatter)
+
+    log_queue = queue.SimpleQueue()
+    queue_handler = ContextQueueHandler(log_queue)
+    queue_handler.addFilter(SamplingFilter(limit=sample_limit))
+
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    root.addHandler(queue_handler)
+    root.setLevel(level)
+
+    listener = _Listener(log_queue, *handlers)
+    listener.start()
+    atexit.register(listener.stop)
+    return listener
@@ -1,213 +1,596 @@
 import logging
 import os
 import asyncio
-import random
-import aiohttp
+import signal
+import time
 from datetime import datetime, timedelta
 from aiogram import Bot, Dispatcher, executor, types
+from aiogram.bot.api import TelegramAPIServer, TELEGRAM_PRODUCTION
 from aiogram.dispatcher.middlewares import BaseMiddleware
 from aiogram.dispatcher.handler import CancelHandler
-from aiogram.types import InlineKeyboardMarkup, InlineKeyboardButton
 from dotenv import load_dotenv
-from flask import Flask, render_template_string
-from threading import Thread
+
+from admin_cache import AdminCache
+from admission import ADMIT, OVERFLOW, SHED, AdmissionControl
+from audit import (
+    EVENT_APPROVE, EVENT_AUTO_APPROVE, EVENT_AUTO_DECLINE, EVENT_IGNORE, EVENT_RAID_SHED, EVENT_REQUEST, AuditLog,
+    summary_text
+)
+from backlog import BacklogDrainer
+from bulk import BulkExecutor
+from callbacks import (
+    ACCEPT, BULK_ACCEPT, BULK_IGNORE, CLOSE, IGNORE, PAGE, CallbackRouter, derive_key
+)
+from cluster import Cluster, parse_replicas
+from config import load_registry
+from digest import JoinDigest
+from joinlist_view import JoinListView
+from live_list import LiveJoinList
+from logs import setup_logging
+from keepalive import KeepAlive, PingTarget, parse_targets
+from metrics import MetricsBot, registry
+from outbound import OutboundQueue, PRIORITY_LOG
+from request_store import JoinRequest, RequestStore
+from rules import APPROVE, DECLINE, AutoDecisions, compile_rules
+from scheduler import DeadlineScheduler
+from storage import create_backend
+from update_pipeline import UpdatePipeline
+from web import create_app, derive_webhook_secret, start_server
 
 # Загружаем переменные окружения
 load_dotenv()
 
 # Настройки бота
 API_TOKEN = os.getenv("BOT_TOKEN")
-GROUP_1_ID = int(os.getenv("GROUP_1_ID"))        # ID первой группы
-GROUP_1_THREAD = int(os.getenv("GROUP_1_THREAD")) # ID ветки первой группы
-GROUP_2_ID = int(os.getenv("GROUP_2_ID"))        # ID второй группы  
-GROUP_2_THREAD = int(os.getenv("GROUP_2_THREAD")) # ID ветки второй группы
+BOT_CONFIG = os.getenv("BOT_CONFIG")                     # Файл настроек групп (JSON/YAML/TOML), дополняет GROUP_<n>_ID/THREAD
 PING_URL = os.getenv("PING_URL", "https://example.com")  # URL другого бота для пинга
+PING_TARGETS = os.getenv("PING_TARGETS")                 # Цели пинга: "url|мин-макс, ..." (вместо PING_URL и самопинга)
+PORT = int(os.getenv("PORT", 10000))                     # Порт HTTP-сервера
+BOT_MODE = os.getenv("BOT_MODE", "polling")              # Получение обновлений: polling или webhook
+STARTUP_BACKLOG = os.getenv("STARTUP_BACKLOG", "drain")  # Обновления, накопившиеся за время простоя: drain или skip
+WEBHOOK_URL = os.getenv("WEBHOOK_URL")                   # Публичный адрес сервера для webhook (https://...)
+WEBHOOK_PATH = os.getenv("WEBHOOK_PATH", "/webhook")     # Путь приёма обновлений
+STATS_TOKEN = os.getenv("STATS_TOKEN")                   # Токен для /metrics и /stats (Authorization: Bearer); без него - только localhost
+WEBHOOK_SECRET = os.getenv("WEBHOOK_SECRET") or derive_webhook_secret(API_TOKEN)  # Секрет заголовка X-Telegram-Bot-Api-Secret-Token (по умолчанию из BOT_TOKEN)
+TELEGRAM_API_URL = os.getenv("TELEGRAM_API_URL")         # Свой сервер Bot API (по умолчанию api.telegram.org)
+JOIN_REQUEST_TTL = int(os.getenv("JOIN_REQUEST_TTL", 0))      # Время жизни заявки в секундах (0 - без ограничения)
+JOIN_REQUEST_MAX = int(os.getenv("JOIN_REQUEST_MAX", 10000))  # Максимум заявок на группу
+BULK_CONCURRENCY = int(os.getenv("BULK_CONCURRENCY", 8))      # Параллельных запросов при массовой обработке
+OUTBOUND_GLOBAL_RATE = float(os.getenv("OUTBOUND_GLOBAL_RATE", 30))  # Исходящих запросов в секунду на весь бот
+OUTBOUND_CHAT_RATE = float(os.getenv("OUTBOUND_CHAT_RATE", 20))      # Исходящих сообщений в минуту на одну группу
+ADMIN_CACHE_TTL = int(os.getenv("ADMIN_CACHE_TTL", 300))       # Время жизни кэша админов в секундах
+STATE_BACKEND = os.getenv("STATE_BACKEND", "sqlite")            # Хранилище состояния: sqlite или memory
+STATE_DB_PATH = os.getenv("STATE_DB_PATH", "bot_state.db")      # Файл базы SQLite
+STATE_COMPACT_INTERVAL = int(os.getenv("STATE_COMPACT_INTERVAL", 6 * 3600))  # Период сжатия базы в секундах
+CALLBACK_SECRET = os.getenv("CALLBACK_SECRET")           # Ключ подписи кнопок (по умолчанию выводится из BOT_TOKEN)
+JOINLIST_EDIT_DELAY = float(os.getenv("JOINLIST_EDIT_DELAY", 1))  # Задержка правки открытого списка после изменений, секунды
+NOTIFY_WINDOW = float(os.getenv("NOTIFY_WINDOW", 3))     # Окно объединения уведомлений о заявках, секунды
+NOTIFY_THRESHOLD = int(os.getenv("NOTIFY_THRESHOLD", 50))  # Обновить сводку досрочно после стольких заявок
+NOTIFY_MAX_AGE = int(os.getenv("NOTIFY_MAX_AGE", 600))    # Через сколько секунд начинать новую сводку
+REPLICA_ID = os.getenv("REPLICA_ID", "main")             # Имя этой реплики
+REPLICAS = os.getenv("REPLICAS")                         # Все реплики: "имя=url_webhook, ..." (пусто - одна реплика)
+UPDATE_WORKERS = int(os.getenv("UPDATE_WORKERS", 32))    # Обработчиков входящих обновлений (разные чаты - параллельно)
+UPDATE_QUEUE_DEPTH = int(os.getenv("UPDATE_QUEUE_DEPTH", 100))  # Очередь одного чата, после которой webhook этого чата ждёт
+UPDATE_QUEUE_TOTAL = int(os.getenv("UPDATE_QUEUE_TOTAL", 0))    # Всего в очередях, после которого polling ждёт (0 - WORKERS * DEPTH)
+AUDIT_LOG = os.getenv("AUDIT_LOG", "audit.jsonl")        # Журнал заявок и решений (пусто - не писать); у каждой реплики свой
+AUDIT_MAX_BYTES = int(os.getenv("AUDIT_MAX_BYTES", 10 * 1024 * 1024))  # Размер журнала, после которого он сжимается в архив
+AUDIT_BACKUPS = int(os.getenv("AUDIT_BACKUPS", 10))      # Сколько сжатых архивов журнала хранить
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO")               # Уровень логирования
+LOG_FORMAT = os.getenv("LOG_FORMAT", "json")             # Формат логов: json или text
+LOG_FILE = os.getenv("LOG_FILE")                         # Файл логов (по умолчанию только stderr)
+LOG_MAX_BYTES = int(os.getenv("LOG_MAX_BYTES", 10 * 1024 * 1024))  # Размер файла логов, после которого он ротируется
+LOG_ROTATE_WHEN = os.getenv("LOG_ROTATE_WHEN", "midnight")  # Ротация файла логов по времени (как в TimedRotatingFileHandler)
+LOG_BACKUPS = int(os.getenv("LOG_BACKUPS", 7))           # Сколько старых файлов логов хранить
+LOG_SAMPLE_LIMIT = int(os.getenv("LOG_SAMPLE_LIMIT", 20))  # Частых событий (заявки при рейде) в логе в секунду, 0 - все
+AUTOMOD_WINDOW = float(os.getenv("AUTOMOD_WINDOW", 1))   # Сколько секунд копить автоматические решения в пачку
+AUTOMOD_BATCH = int(os.getenv("AUTOMOD_BATCH", 100))     # Выполнить пачку досрочно при таком количестве решений
+AUTOMOD_MAX_PENDING = int(os.getenv("AUTOMOD_MAX_PENDING", 10000))  # Больше стольких невыполненных решений на группу не копить
+RAID_THRESHOLD = int(os.getenv("RAID_THRESHOLD", 100))   # Заявок в группу за RAID_WINDOW, после которых включается режим рейда (0 - выкл.)
+RAID_WINDOW = float(os.getenv("RAID_WINDOW", 60))        # Скользящее окно подсчёта заявок, секунды
+RAID_USER_LIMIT = int(os.getenv("RAID_USER_LIMIT", 3))   # Заявок от одного пользователя за окно, сверх которых они отбрасываются
+RAID_QUEUE_MAX = int(os.getenv("RAID_QUEUE_MAX", 1000))  # Очередь группы во время рейда, после которой новые заявки отклоняются
+RAID_RECOVERY = float(os.getenv("RAID_RECOVERY", 120))   # Сколько секунд затишья нужно, чтобы рейд закончился
+RAID_JOINLIST_COOLDOWN = float(os.getenv("RAID_JOINLIST_COOLDOWN", 30))  # /joinlist во время рейда не чаще раза в столько секунд
+
+# Настройка логирования: запись идёт в фоновом потоке, цикл событий не ждёт stderr и диск
+setup_logging(LOG_LEVEL, LOG_FORMAT, LOG_FILE, max_bytes=LOG_MAX_BYTES, when=LOG_ROTATE_WHEN,
+              backups=LOG_BACKUPS, sample_limit=LOG_SAMPLE_LIMIT)
+
+# Реестр групп: допуск, ветки журнала и настройки каждой группы
+groups = load_registry(BOT_CONFIG)
+if not groups:
+    logging.warning("Не настроено ни одной группы (GROUP_<n>_ID или BOT_CONFIG)")
 
-# Настройка логирования
-logging.basicConfig(level=logging.INFO)
+# Правила автомодерации групп (rules в BOT_CONFIG), скомпилированные при загрузке настроек
+group_rules = compile_rules(groups)
+
+def reload_groups():
+    """Перечитать настройки групп (по SIGHUP) без остановки обработки обновлений"""
+    global groups, group_rules
+    try:
+        new_groups = load_registry(BOT_CONFIG)
+        new_rules = compile_rules(new_groups)
+    except Exception as e:
+        logging.error(f"Ошибка перезагрузки настроек, оставлены прежние: {e}")
+        return
+    added = new_groups.ids - groups.ids
+    groups, group_rules = new_groups, new_rules
+    for group_id in added:
+        admin_cache.refresh_soon(group_id)
+    logging.info(f"Настройки групп перезагружены: {len(groups)} групп")
 
 # Инициализация бота
-bot = Bot(token=API_TOKEN)
+bot = MetricsBot(
+    token=API_TOKEN,
+    server=TelegramAPIServer.from_base(TELEGRAM_API_URL) if TELEGRAM_API_URL else TELEGRAM_PRODUCTION
+)
 dp = Dispatcher(bot)
 
+# Все отправки, правки и удаления сообщений идут через общую очередь
+outbox = OutboundQueue(
+    bot,
+    global_rate=OUTBOUND_GLOBAL_RATE,
+    global_burst=int(OUTBOUND_GLOBAL_RATE),
+    chat_rate=OUTBOUND_CHAT_RATE / 60,
+    chat_burst=int(OUTBOUND_CHAT_RATE)
+)
+
 # Middleware: блокирует команды вне разрешенных групп
 class GroupOnlyMiddleware(BaseMiddleware):
     async def on_pre_process_message(self, message: types.Message, data: dict):
-        # Разрешаем работу только в двух группах
-        if message.chat.id not in [GROUP_1_ID, GROUP_2_ID]:
+        # Разрешаем работу только в настроенных группах
+        if message.chat.id not in groups.ids:
             raise CancelHandler()
 
 dp.middleware.setup(GroupOnlyMiddleware())
 
-# Хранилище заявок для каждой группы отдельно
-join_requests = {
-    GROUP_1_ID: [],
-    GROUP_2_ID: []
-}
+# Входящие обновления: в одном чате строго по порядку, разные чаты параллельно
+update_pipeline = UpdatePipeline(dp, workers=UPDATE_WORKERS, max_depth=UPDATE_QUEUE_DEPTH, max_total=UPDATE_QUEUE_TOTAL)
+
+# Метрики обработчиков и событий (см. /metrics)
+HANDLER_SECONDS = registry.histogram("bot_handler_seconds", "Длительность обработчиков", ("handler",))
+CALLBACK_SECONDS = registry.histogram("bot_callback_seconds", "Длительность обработки кнопок", ("action",))
+JOIN_REQUESTS = registry.counter("bot_join_requests_total", "Новые заявки на вступление", ("group",))
+DEDUP_HITS = registry.counter("bot_join_request_duplicates_total", "Повторные заявки от того же пользователя", ("group",))
+APPROVALS = registry.counter("bot_approvals_total", "Принятые заявки", ("group",))
+IGNORES = registry.counter("bot_ignores_total", "Проигнорированные заявки", ("group",))
+AUTO_DECISIONS = registry.counter("bot_auto_decisions_total", "Решения автомодерации", ("group", "action"))
+RAID_SHED = registry.counter("bot_raid_shed_total", "Заявки сверх очереди рейда, оставленные без ответа", ("group",))
+CALLBACKS_REJECTED = registry.counter("bot_callbacks_rejected_total", "Нажатия с неподписанными или устаревшими данными")
+
+# Типы обновлений от Telegram (chat_member приходит только если запрошен явно)
+ALLOWED_UPDATES = ["message", "callback_query", "chat_join_request", "chat_member", "my_chat_member"]
+
+# Реплики бота: каждая группа закреплена за одной из них
+cluster = Cluster(REPLICA_ID, parse_replicas(REPLICAS), WEBHOOK_SECRET)
+
+# Постоянное хранилище состояния (переживает перезапуск, общее для всех реплик)
+state_backend = create_backend(STATE_BACKEND, STATE_DB_PATH, shared=cluster.enabled)
+
+# Журнал заявок и решений; статистика для /stats ведётся по ходу записи
+audit_log = AuditLog(AUDIT_LOG or None, max_bytes=AUDIT_MAX_BYTES, backups=AUDIT_BACKUPS)
+
+# Хранилище заявок для каждой группы отдельно; истёкшие и вытесненные попадают в журнал
+join_requests = RequestStore(
+    ttl=JOIN_REQUEST_TTL, max_size=JOIN_REQUEST_MAX, backend=state_backend,
+    on_drop=lambda group_id, entry, reason: audit_log.record(reason, group_id, entry)
+)
+
+# Кнопки: подписанные callback_data и ответы на повторные нажатия без повторной работы
+callbacks = CallbackRouter(CALLBACK_SECRET.encode() if CALLBACK_SECRET else derive_key(API_TOKEN), outbox.answer_callback)
+
+# Постраничный вывод /joinlist с кэшем страниц
+joinlist_view = JoinListView(join_requests, callbacks)
+
+# Кэш админов групп: проверка прав без запроса к API на каждое нажатие
+admin_cache = AdminCache(bot.get_chat_administrators, ttl=ADMIN_CACHE_TTL)
+
+# Значения, которые считаются при чтении /metrics
+registry.callback("bot_pending_requests", "Заявки в очереди", ("group",),
+                  lambda: {g: join_requests.count(g) for g in join_requests.groups()})
+registry.callback("bot_open_joinlists", "Открытые сообщения со списком заявок", (),
+                  lambda: {(): len(active_joinlist_messages)})
+registry.callback("bot_outbound_queue_depth", "Запросы в очереди исходящих сообщений", ("priority",),
+                  lambda: dict(enumerate(outbox.depth())))
+registry.callback("bot_send_failures_total", "Неудачные отправки сообщений", (),
+                  lambda: {(): outbox.failed}, kind="counter")
+registry.callback("bot_callback_duplicates_total", "Повторные нажатия, получившие ответ из кэша", (),
+                  lambda: {(): callbacks.inflight.hits}, kind="counter")
+registry.callback("bot_update_queue_depth", "Входящие обновления, ждущие обработки", (),
+                  lambda: {(): update_pipeline.depth()})
+registry.callback("bot_update_backpressure_total", "Обновления, пришедшие в переполненную очередь чата", (),
+                  lambda: {(): update_pipeline.throttled}, kind="counter")
+registry.callback("bot_forwarded_updates_total", "Обновления, пересланные реплике-владельцу группы", ("result",),
+                  lambda: {"ok": cluster.forwarded, "failed": cluster.forward_failed}, kind="counter")
+
+# Уведомления о заявках: волна заявок - одна сводка вместо сообщения на каждую
+join_digest = JoinDigest(outbox, window=NOTIFY_WINDOW, threshold=NOTIFY_THRESHOLD, max_age=NOTIFY_MAX_AGE)
+registry.callback("bot_joinlist_edits_total", "Правки открытых списков: выполненные и пропущенные без изменений", ("result",),
+                  lambda: {"edited": live_list.edits, "skipped": live_list.skipped}, kind="counter")
+registry.callback("bot_join_notifications_total", "Сообщения о заявках: отправленные и обновлённые сводки", ("kind",),
+                  lambda: {"sent": join_digest.sent, "edited": join_digest.edited}, kind="counter")
+
+# Допуск заявок: при наплыве группа переходит в режим рейда (без уведомлений, с отклонением лишнего)
+async def raid_changed(group_id, raid, counts):
+    """Сообщить в ветку о начале и конце рейда"""
+    if raid:
+        text = (
+            f"🚨 <b>Наплыв заявок</b>\n"
+            f"Больше {RAID_THRESHOLD} заявок за {RAID_WINDOW:.0f} с. Уведомления о заявках приостановлены, "
+            f"/joinlist отвечает не чаще раза в {RAID_JOINLIST_COOLDOWN:.0f} с, "
+            f"после {RAID_QUEUE_MAX} заявок в очереди новые отклоняются."
+        )
+    else:
+        text = (
+            f"✅ <b>Наплыв закончился</b>\n"
+            f"📥 Заявок за рейд: {sum(counts.values())}, в очереди сейчас: {join_requests.count(group_id)}\n"
+            f"⛔ Сверх очереди (отклонено или оставлено без ответа): {counts[OVERFLOW]}, "
+            f"🔁 отброшено повторов: {counts[SHED]}\n"
+            f"📝 Для просмотра списка используйте /joinlist"
+        )
+    await send_to_thread(group_id, text)
+
+admission = AdmissionControl(
+    threshold=RAID_THRESHOLD, window=RAID_WINDOW, user_limit=RAID_USER_LIMIT, max_pending=RAID_QUEUE_MAX,
+    recovery=RAID_RECOVERY, joinlist_cooldown=RAID_JOINLIST_COOLDOWN, on_change=raid_changed
+)
+registry.callback("bot_admission_total", "Решения допуска заявок: admit, quiet (рейд), overflow, shed", ("result",),
+                  admission.counts, kind="counter")
+registry.callback("bot_auto_decisions_dropped_total", "Автоматические решения, не поместившиеся в очередь (AUTOMOD_MAX_PENDING)", (),
+                  lambda: {(): auto_decisions.dropped}, kind="counter")
+registry.callback("bot_raid_groups", "Группы в режиме рейда", (),
+                  lambda: {(): len(admission.stats()["raid_groups"])})
+
+# Массовая обработка заявок и группы, где она сейчас идёт
+bulk_executor = BulkExecutor(concurrency=BULK_CONCURRENCY)
+bulk_in_progress = set()
 
 # Активные сообщения со списками заявок (для автоудаления)
 active_joinlist_messages = {}
 
-async def get_group_thread_id(group_id):
-    """Получить ID ветки для определенной группы"""
-    if group_id == GROUP_1_ID:
-        return GROUP_1_THREAD
-    elif group_id == GROUP_2_ID:
-        return GROUP_2_THREAD
-    return None
+# Отложенные действия (автоудаление списков); сроки переживают перезапуск
+scheduler = DeadlineScheduler(backend=state_backend)
+
+def remember_joinlist_message(group_id, message_id):
+    """Запомнить активное сообщение со списком"""
+    active_joinlist_messages[group_id] = message_id
+    state_backend.save_list_message(group_id, message_id)
+
+def forget_joinlist_message(group_id):
+    """Забыть активное сообщение со списком"""
+    if active_joinlist_messages.pop(group_id, None) is not None:
+        state_backend.delete_list_message(group_id)
+    scheduler.cancel("joinlist", group_id)
+    live_list.detach(group_id)
+
+def extend_joinlist(group_id):
+    """Списком пользуются - откладываем его автоудаление"""
+    message_id = active_joinlist_messages.get(group_id)
+    if message_id is not None:
+        scheduler.schedule("joinlist", group_id, groups.joinlist_timeout(group_id), message_id)
+
+# Открытый список обновляется правками при любом изменении заявок группы
+live_list = LiveJoinList(joinlist_view, outbox, delay=JOINLIST_EDIT_DELAY, on_gone=forget_joinlist_message)
+join_requests.on_change = live_list.touch
 
+def sent_message(future):
+    """Сообщение из future очереди исходящих, если оно уже отправлено (иначе None)"""
+    if not future.done() or future.cancelled() or future.exception() is not None:
+        return None
+    return future.result()
+
+@HANDLER_SECONDS.timed("send_to_thread")
 async def send_to_thread(group_id, text):
-    """Отправить сообщение в закрытую ветку группы"""
-    thread_id = await get_group_thread_id(group_id)
-    if thread_id:
-        try:
-            # Сначала пробуем с HTML форматированием
-            await bot.send_message(
-                chat_id=group_id,
-                text=text,
-                message_thread_id=thread_id,
-                parse_mode='HTML'
-            )
-        except Exception as e:
-            try:
-                # Если не получилось, отправляем без форматирования
-                await bot.send_message(
-                    chat_id=group_id,
-                    text=text,
-                    message_thread_id=thread_id,
-                    parse_mode=None
-                )
-            except Exception as e2:
-                logging.error(f"Ошибка отправки в ветку: {e2}")
+    """Отправить сообщение в закрытую ветку группы.
+
+    Отправки не ждёт: у записей в ветку низший приоритет, и при лимите
+    сообщений в чате обработчик простоял бы секунды, задерживая
+    остальные обновления группы.
+    """
+    thread_id = groups.thread_id(group_id)
+    if not thread_id:
+        return
+    
+    def fallback(future):
+        # Если не получилось с HTML форматированием, отправляем без него (ошибку очередь уже записала в лог)
+        if not future.cancelled() and future.exception() is not None:
+            outbox.send_message(group_id, text, priority=PRIORITY_LOG, message_thread_id=thread_id, parse_mode=None)
+    
+    outbox.send_message(
+        group_id,
+        text,
+        priority=PRIORITY_LOG,
+        message_thread_id=thread_id,
+        parse_mode='HTML'
+    ).add_done_callback(fallback)
+
+async def check_admin(callback_query, group_id):
+    """Проверить, что кнопку нажал админ группы. Не админу отвечаем отказом."""
+    try:
+        if await admin_cache.is_admin(group_id, callback_query.from_user.id):
+            return True
+    except Exception as e:
+        logging.error(f"Ошибка проверки прав админа: {e}")
+    await outbox.answer_callback(callback_query, "⛔ Решения по заявкам принимают только админы.", show_alert=True)
+    return False
+
+def split_message(header, lines, limit=4000):
+    """Разбить длинный отчёт на сообщения в пределах лимита Telegram (4096 символов)"""
+    chunks = []
+    text = header
+    for line in lines:
+        if len(text) + len(line) + 1 > limit:
+            chunks.append(text)
+            text = header
+        text += line + "\n"
+    chunks.append(text)
+    return chunks
 
 @dp.message_handler(commands=['joinlist'])
+@HANDLER_SECONDS.timed("join_list")
 async def join_list_handler(message: types.Message):
-    """Показать список входящих заявок с кнопками принять/игнорировать"""
+    """Показать список входящих заявок с кнопками принять/игнорировать.
+
+    /joinlist <фильтр> - поиск по началу ника или ID.
+    """
     group_id = message.chat.id
+    query = message.get_args()
     
-    # Проверяем есть ли заявки для этой группы
-    if not join_requests.get(group_id, []):
-        await message.reply("📭 Нет входящих заявок.")
+    # Во время рейда каждый /joinlist - новое сообщение; открытый список и так обновляется сам
+    if not admission.joinlist_allowed(group_id):
         return
     
-    # Удаляем предыдущие активные сообщения со списками
-    if group_id in active_joinlist_messages:
-        try:
-            await bot.delete_message(group_id, active_joinlist_messages[group_id])
-        except:
-            pass
-    
-    # Формируем список заявок с кнопками
-    text = "📋 <b>Список входящих заявок:</b>\n\n"
-    markup = InlineKeyboardMarkup()
+    # Проверяем есть ли заявки для этой группы
+    if not join_requests.count(group_id):
+        outbox.send_message(group_id, "📭 Нет входящих заявок.", reply_to_message_id=message.message_id)
+        return
     
-    for i, user in enumerate(join_requests[group_id], 1):
-        text += f"{i}. @{user['username']} (ID: {user['id']})\n"
-        
-        # Добавляем кнопки для каждого пользователя
-        markup.row(
-            InlineKeyboardButton(f"✅ Принять #{i}", callback_data=f"accept_{user['id']}_{group_id}"),
-            InlineKeyboardButton(f"❌ Игнорировать #{i}", callback_data=f"ignore_{user['id']}_{group_id}")
-        )
+    rendered = joinlist_view.render(group_id, 0, query)
+    if rendered is None:
+        outbox.send_message(group_id, "🔎 Заявки по запросу не найдены.", reply_to_message_id=message.message_id)
+        return
+    text, markup, _ = rendered
     
-    # Кнопка закрытия списка
-    markup.add(InlineKeyboardButton("🚫 Закрыть список", callback_data=f"close_list_{group_id}"))
+    # Удаляем предыдущие активные сообщения со списками (не дожидаясь удаления)
+    if group_id in active_joinlist_messages:
+        outbox.delete_message(group_id, active_joinlist_messages[group_id])
     
     # Отправляем сообщение со списком
-    sent_message = await message.reply(text, reply_markup=markup, parse_mode='HTML')
-    
-    # Сохраняем ID сообщения для автоудаления
-    active_joinlist_messages[group_id] = sent_message.message_id
+    sent_message = await outbox.send_message(
+        group_id, text, reply_to_message_id=message.message_id, reply_markup=markup, parse_mode='HTML'
+    )
     
-    # Задача автоудаления через 2 минуты
-    asyncio.create_task(auto_delete_joinlist(group_id, sent_message.message_id))
+    # Сохраняем ID сообщения и планируем автоудаление (заменяет срок предыдущего списка)
+    remember_joinlist_message(group_id, sent_message.message_id)
+    live_list.attach(group_id, sent_message.message_id, 0, query, text, markup)
+    scheduler.schedule(
+        "joinlist", group_id, groups.joinlist_timeout(group_id), sent_message.message_id
+    )
+
+@dp.message_handler(commands=['stats'])
+@HANDLER_SECONDS.timed("stats")
+async def stats_handler(message: types.Message):
+    """Статистика модерации группы (только для админов)"""
+    group_id = message.chat.id
+    try:
+        is_admin = await admin_cache.is_admin(group_id, message.from_user.id)
+    except Exception as e:
+        logging.error(f"Ошибка проверки прав админа: {e}")
+        is_admin = False
+    if not is_admin:
+        outbox.send_message(group_id, "⛔ Статистика доступна только админам.", reply_to_message_id=message.message_id)
+        return
+    outbox.send_message(
+        group_id, summary_text(audit_log.summary(group_id)), reply_to_message_id=message.message_id, parse_mode='HTML'
+    )
 
 async def auto_delete_joinlist(group_id, message_id):
-    """Автоудаление списка заявок через 2 минуты"""
-    await asyncio.sleep(120)  # 2 минуты
+    """Автоудаление списка заявок по истечении срока"""
+    if active_joinlist_messages.get(group_id) != message_id:
+        return
+    try:
+        await outbox.delete_message(group_id, message_id)
+    except Exception as e:
+        # Например, список уже удалили вручную - кнопки всё равно больше не нужны
+        logging.warning(f"Не удалось удалить список заявок: {e}")
+    forget_joinlist_message(group_id)
+
+scheduler.register("joinlist", auto_delete_joinlist)
+
+@callbacks.handler(PAGE, int, int, str)
+@CALLBACK_SECONDS.timed("page")
+async def handle_page_callback(callback_query: types.CallbackQuery, group_id, page, query):
+    """Переключение страниц списка заявок"""
+    rendered = joinlist_view.render(group_id, page, query)
+    if rendered is None:
+        await outbox.answer_callback(callback_query, "📭 Нет входящих заявок.")
+        return
     
-    if active_joinlist_messages.get(group_id) == message_id:
-        try:
-            await bot.delete_message(group_id, message_id)
-            del active_joinlist_messages[group_id]
-        except:
-            pass
+    text, markup, page = rendered
+    await outbox.answer_callback(callback_query, f"Страница {page + 1}")
+    # Правку не ждём; если она не пройдёт, ошибку запишет очередь, а список поправит live_list
+    outbox.edit_message_text(
+        text, callback_query.message.chat.id, callback_query.message.message_id,
+        reply_markup=markup, parse_mode='HTML'
+    )
+    live_list.shown(group_id, page, query, text, markup)
+    extend_joinlist(group_id)
 
-@dp.callback_query_handler(lambda c: c.data.startswith(('accept_', 'ignore_', 'close_list_')))
-async def handle_callback(callback_query: types.CallbackQuery):
-    """Обработка нажатий кнопок принять/игнорировать/закрыть"""
-    data = callback_query.data
-    
-    if data.startswith('accept_'):
-        # Принять пользователя
-        parts = data.split('_')
-        user_id = int(parts[1])
-        group_id = int(parts[2])
+@callbacks.handler(BULK_ACCEPT, int, int, str, dedup=True)
+@CALLBACK_SECONDS.timed("bulk")
+async def handle_bulk_accept(callback_query: types.CallbackQuery, group_id, page, query):
+    """Массовое принятие заявок (всех или одной страницы)"""
+    return await process_bulk(callback_query, True, group_id, page, query)
+
+@callbacks.handler(BULK_IGNORE, int, int, str, dedup=True)
+@CALLBACK_SECONDS.timed("bulk")
+async def handle_bulk_ignore(callback_query: types.CallbackQuery, group_id, page, query):
+    """Массовое игнорирование заявок (всех или одной страницы)"""
+    return await process_bulk(callback_query, False, group_id, page, query)
+
+async def process_bulk(callback_query, accept, group_id, page, query):
+    """Массовое решение по заявкам. Возвращает ответ на нажатие (для повторных нажатий)."""
+    if not await check_admin(callback_query, group_id):
+        return
+    
+    if group_id in bulk_in_progress:
+        await outbox.answer_callback(callback_query, "⏳ Массовая обработка уже идёт.")
+        return
+    
+    users = joinlist_view.select(group_id, None if page < 0 else page, query)
+    if not users:
+        await outbox.answer_callback(callback_query, "❗ Заявки не найдены.")
+        return
+    
+    verb = "Принимаю" if accept else "Игнорирую"
+    answer = f"⏳ {verb} заявки: {len(users)}"
+    bulk_in_progress.add(group_id)
+    try:
+        await outbox.answer_callback(callback_query, answer)
+        # Один статус на всю обработку, прогресс - правками этого сообщения.
+        # Отправки не ждём: пока статус не ушёл, прогресс просто не показывается
+        status = outbox.send_message(group_id, f"⏳ {verb} заявки: 0/{len(users)}")
         
-        user = next((u for u in join_requests.get(group_id, []) if u['id'] == user_id), None)
+        async def on_progress(done, total):
+            message = sent_message(status)
+            if message is not None:
+                outbox.edit_message_text(f"⏳ {verb} заявки: {done}/{total}", group_id, message.message_id)
         
-        if not user:
-            await callback_query.answer("❗ Заявка не найдена.")
-            return
+        claimed = []
         
-        try:
-            # Принимаем пользователя в группу
-            await bot.approve_chat_join_request(chat_id=group_id, user_id=user_id)
-            
-            # Удаляем из списка заявок
-            join_requests[group_id].remove(user)
-            
-            # Формируем сообщение о принятии
+        async def process(user):
+            # Заявку, которую уже забрал другой админ или реплика, пропускаем
+            if not await join_requests.claim(group_id, user.user_id):
+                return
+            if accept:
+                try:
+                    await bot.approve_chat_join_request(chat_id=group_id, user_id=user.user_id)
+                except Exception:
+                    join_requests.release(group_id, user)
+                    raise
+            claimed.append(user)
+        
+        _, failed = await bulk_executor.run(users, process, on_progress, progress_interval=5)
+        done = claimed
+        (APPROVALS if accept else IGNORES).inc(group_id, amount=len(done))
+        for user in done:
+            audit_log.record(EVENT_APPROVE if accept else EVENT_IGNORE, group_id, user, callback_query.from_user)
+        
+        result = f"{'✅ Принято' if accept else '❌ Проигнорировано'}: {len(done)}"
+        if failed:
+            result += f"\n❗ Ошибок: {len(failed)}"
+            logging.error(f"Ошибки массовой обработки: {[str(e) for _, e in failed[:5]]}")
+        
+        def show_result(future):
+            message = sent_message(future)
+            if message is not None:
+                outbox.edit_message_text(result, group_id, message.message_id)
+        status.add_done_callback(show_result)
+        
+        # Один сводный отчёт в ветку вместо сообщения на каждого пользователя
+        if accept and done:
             admin_username = callback_query.from_user.username or "админ"
             admin_id = callback_query.from_user.id
-            user_username = user['username']
             now = (datetime.utcnow() + timedelta(hours=3)).strftime("%d.%m.%Y %H:%M")
-            
-            log_message = (
-                f"✅ <b>Пользователь принят в группу</b>\n"
-                f"👤 Принят: @{user_username} (ID: {user_id})\n"
+            header = (
+                f"✅ <b>Массовое принятие в группу: {len(done)}</b>\n"
                 f"👨‍💼 Принял: @{admin_username} (ID: {admin_id})\n"
-                f"⏰ Время: {now} МСК"
+                f"⏰ Время: {now} МСК\n\n"
             )
-            
-            # Отправляем в закрытую ветку
-            await send_to_thread(group_id, log_message)
-            
-            await callback_query.answer("✅ Пользователь принят!")
-            
-        except Exception as e:
-            await callback_query.answer("❗ Ошибка при принятии пользователя.")
-            logging.error(f"Ошибка принятия пользователя: {e}")
-            return
+            for chunk in split_message(header, [f"👤 @{u.username} (ID: {u.user_id})" for u in done]):
+                await send_to_thread(group_id, chunk)
+    finally:
+        bulk_in_progress.discard(group_id)
+    
+    # Список обновится сам (live_list); админ ещё работает с ним
+    extend_joinlist(group_id)
+    return answer
+
+@callbacks.handler(ACCEPT, int, int, dedup=True)
+@CALLBACK_SECONDS.timed("accept")
+async def handle_accept(callback_query: types.CallbackQuery, user_id, group_id):
+    """Принять заявку. Возвращает ответ на нажатие (для повторных нажатий)."""
+    if not await check_admin(callback_query, group_id):
+        return
+    
+    # Забираем заявку до вызова API: при двойном нажатии или на другой
+    # реплике второй обработчик её уже не получит
+    user = await join_requests.claim(group_id, user_id)
+    
+    if not user:
+        await outbox.answer_callback(callback_query, "❗ Заявка не найдена.")
+        return
     
-    elif data.startswith('ignore_'):
-        # Игнорировать пользователя
-        parts = data.split('_')
-        user_id = int(parts[1])
-        group_id = int(parts[2])
-        
-        user = next((u for u in join_requests.get(group_id, []) if u['id'] == user_id), None)
-        
-        if user:
-            join_requests[group_id].remove(user)
-            await callback_query.answer("❌ Заявка проигнорирована.")
-        else:
-            await callback_query.answer("❗ Заявка не найдена.")
-    
-    elif data.startswith('close_list_'):
-        # Закрыть список
-        await callback_query.answer("🚫 Список закрыт.")
-    
-    # Удаляем сообщение со списком
-    group_id = int(data.split('_')[-1])
     try:
-        await bot.delete_message(callback_query.message.chat.id, callback_query.message.message_id)
-        if group_id in active_joinlist_messages:
-            del active_joinlist_messages[group_id]
-    except:
-        pass
+        # Принимаем пользователя в группу
+        await bot.approve_chat_join_request(chat_id=group_id, user_id=user_id)
+    except Exception as e:
+        # Решение не состоялось - возвращаем заявку в список
+        join_requests.release(group_id, user)
+        await outbox.answer_callback(callback_query, "❗ Ошибка при принятии пользователя.")
+        logging.error(f"Ошибка принятия пользователя: {e}")
+        return
+    APPROVALS.inc(group_id)
+    audit_log.record(EVENT_APPROVE, group_id, user, callback_query.from_user)
+    
+    # Формируем сообщение о принятии
+    admin_username = callback_query.from_user.username or "админ"
+    admin_id = callback_query.from_user.id
+    now = (datetime.utcnow() + timedelta(hours=3)).strftime("%d.%m.%Y %H:%M")
+    
+    log_message = (
+        f"✅ <b>Пользователь принят в группу</b>\n"
+        f"👤 Принят: @{user.username} (ID: {user_id})\n"
+        f"👨‍💼 Принял: @{admin_username} (ID: {admin_id})\n"
+        f"⏰ Время: {now} МСК"
+    )
+    
+    # Отправляем в закрытую ветку
+    await send_to_thread(group_id, log_message)
+    extend_joinlist(group_id)
+    
+    # Отвечаем последним и не ждём: пользователь уже принят, и устаревшее
+    # нажатие ("query is too old") не должно сорвать запись и учёт
+    answer = "✅ Пользователь принят!"
+    outbox.answer_callback(callback_query, answer)
+    return answer
+
+@callbacks.handler(IGNORE, int, int, dedup=True)
+@CALLBACK_SECONDS.timed("ignore")
+async def handle_ignore(callback_query: types.CallbackQuery, user_id, group_id):
+    """Игнорировать заявку. Возвращает ответ на нажатие (для повторных нажатий)."""
+    if not await check_admin(callback_query, group_id):
+        return
+    
+    user = await join_requests.claim(group_id, user_id)
+    if not user:
+        await outbox.answer_callback(callback_query, "❗ Заявка не найдена.")
+        return
+    
+    IGNORES.inc(group_id)
+    audit_log.record(EVENT_IGNORE, group_id, user, callback_query.from_user)
+    extend_joinlist(group_id)
+    answer = "❌ Заявка проигнорирована."
+    outbox.answer_callback(callback_query, answer)
+    return answer
+
+@callbacks.handler(CLOSE, int)
+@CALLBACK_SECONDS.timed("close")
+async def handle_close(callback_query: types.CallbackQuery, group_id):
+    """Закрыть список"""
+    await outbox.answer_callback(callback_query, "🚫 Список закрыт.")
+    outbox.delete_message(callback_query.message.chat.id, callback_query.message.message_id)
+    forget_joinlist_message(group_id)
+
+@dp.callback_query_handler()
+async def handle_callback(callback_query: types.CallbackQuery):
+    """Все кнопки бота: обработчик выбирается по коду действия в callback_data"""
+    if not await callbacks.dispatch(callback_query):
+        CALLBACKS_REJECTED.inc()
+        await outbox.answer_callback(callback_query, "⌛ Кнопка устарела, откройте /joinlist заново.")
 
 @dp.chat_join_request_handler()
+@HANDLER_SECONDS.timed("join_request")
 async def handle_join_request(request: types.ChatJoinRequest):
     """Обработка новых заявок на вступление"""
     group_id = request.chat.id
@@ -215,363 +598,247 @@ async def handle_join_request(request: types.ChatJoinRequest):
     username = request.from_user.username or "без_ника"
     
     # Проверяем, что группа поддерживается
-    if group_id not in [GROUP_1_ID, GROUP_2_ID]:
+    if group_id not in groups.ids:
         return
     
-    # Инициализируем список заявок для группы если его нет
-    if group_id not in join_requests:
-        join_requests[group_id] = []
+    # При наплыве: повторы отбрасываем, сверх очереди - отклоняем, остальное копим без уведомлений
+    admitted = admission.admit(group_id, user_id, join_requests.count(group_id))
+    if admitted == SHED:
+        return
+    if admitted == OVERFLOW:
+        # Если и отклонений уже слишком много (AUTOMOD_MAX_PENDING), заявку оставляем в Telegram без ответа:
+        # в очереди группы она вытеснила бы заявки, пришедшие до рейда
+        if not auto_decisions.add(group_id, user_id, username, DECLINE, "raid_overflow"):
+            RAID_SHED.inc(group_id)
+            now = time.time()
+            audit_log.record(EVENT_RAID_SHED, group_id, JoinRequest(user_id, username, 0, now), rule="raid_overflow")
+        return
     
-    # Исключаем дублирование заявок
-    if any(u['id'] == user_id for u in join_requests[group_id]):
+    # Очевидные случаи решают правила группы; админам остаются только спорные заявки
+    rules = group_rules.get(group_id)
+    if rules:
+        action, rule = rules.evaluate(user_id, request.from_user.username)
+        if action in (APPROVE, DECLINE) and auto_decisions.add(group_id, user_id, username, action, rule):
+            AUTO_DECISIONS.inc(group_id, action)
+            logging.info("Автомодерация: %s по правилу %s", action, rule, extra={"sample": "automod"})
+            return
+    
+    # Добавляем заявку в список, исключая дублирование
+    entry = join_requests.add(group_id, user_id, username)
+    if entry is None:
+        DEDUP_HITS.inc(group_id)
         return
+    JOIN_REQUESTS.inc(group_id)
+    # Во время рейда в лог попадает только выборка; аргументы форматируются, только если запись пройдёт
+    logging.info("Новая заявка @%s", username, extra={"sample": "join_request"})
+    audit_log.record(EVENT_REQUEST, group_id, entry)
     
-    # Добавляем заявку в список
-    join_requests[group_id].append({
-        "id": user_id,
-        "username": username
-    })
-    
-    # Отправляем уведомление о новой заявке
-    notification_text = (
-        f"🆕 <b>Новая заявка на вступление!</b>\n"
-        f"👤 От: @{username} (ID: {user_id})\n"
-        f"📝 Для просмотра списка используйте /joinlist"
-    )
+    # Уведомление о новой заявке (при волне заявок - общая сводка, при рейде - ничего)
+    if admitted == ADMIT:
+        join_digest.add(group_id, user_id, username)
+
+async def finish_auto_decisions(group_id, done, failed):
+    """Пачка автоматических решений выполнена: журнал, отчёт в ветку, неудачные - админам"""
+    now = time.time()
+    for user_id, username, action, rule in done:
+        event = EVENT_AUTO_APPROVE if action == APPROVE else EVENT_AUTO_DECLINE
+        audit_log.record(event, group_id, JoinRequest(user_id, username, 0, now), rule=rule)
+    
+    for (user_id, username, action, rule), error in failed:
+        logging.warning(f"Автомодерация не выполнила {action} для {user_id}: {error}")
+        # Не удалось принять - пусть решат админы; отклонение могло не пройти, потому что заявки уже нет
+        if action == APPROVE and join_requests.add(group_id, user_id, username):
+            join_digest.add(group_id, user_id, username)
     
-    await bot.send_message(group_id, notification_text, parse_mode='HTML')
+    approved = [(user_id, username, rule) for user_id, username, action, rule in done if action == APPROVE]
+    declined = len(done) - len(approved)
+    # Во время рейда отклонения не расписываем пачками: итог будет в сообщении о конце рейда
+    if not done or (not approved and admission.in_raid(group_id)):
+        return
+    header = (
+        f"🤖 <b>Автомодерация</b>\n"
+        f"✅ Принято: {len(approved)}, ⛔ отклонено: {declined}\n\n"
+    )
+    # Принятых перечисляем поимённо, отклонённых (при рейде - тысячи) только считаем
+    lines = [f"👤 @{username} (ID: {user_id}) - {rule}" for user_id, username, rule in approved]
+    for chunk in split_message(header, lines):
+        await send_to_thread(group_id, chunk)
+
+# Автоматические решения выполняются пачками с общим ограничением параллельных запросов
+auto_decisions = AutoDecisions(
+    bulk_executor, bot.approve_chat_join_request, bot.decline_chat_join_request,
+    on_done=finish_auto_decisions, window=AUTOMOD_WINDOW, batch_size=AUTOMOD_BATCH, max_pending=AUTOMOD_MAX_PENDING
+)
+
+@dp.chat_member_handler()
+async def handle_chat_member(update: types.ChatMemberUpdated):
+    """Изменение прав участника: обновляем кэш админов"""
+    admin_cache.apply_member_update(update.chat.id, update.new_chat_member)
+
+@dp.my_chat_member_handler()
+async def handle_my_chat_member(update: types.ChatMemberUpdated):
+    """Изменился статус самого бота: загружаем админов заново"""
+    admin_cache.invalidate(update.chat.id)
 
 @dp.message_handler(commands=['start'], chat_type=types.ChatType.PRIVATE)
 async def private_start(message: types.Message):
     """Обработка команды /start в личных сообщениях"""
-    await message.reply("❗ Этот бот работает только внутри групп.")
+    outbox.send_message(
+        message.chat.id, "❗ Этот бот работает только внутри групп.", reply_to_message_id=message.message_id
+    )
 
 # Система пинга для поддержания активности бота
-async def ping_other_bot():
-    """Пинг другого бота для поддержания активности"""
-    while True:
-        try:
-            # Случайная задержка от 1 до 17 минут
-            delay = random.randint(60, 1020)  # 60-1020 секунд
-            await asyncio.sleep(delay)
-            
-            async with aiohttp.ClientSession() as session:
-                # Случайные запросы для имитации активности
-                endpoints = ["/", "/status", "/health", "/ping"]
-                endpoint = random.choice(endpoints)
-                
-                try:
-                    async with session.get(f"{PING_URL}{endpoint}", timeout=10) as response:
-                        logging.info(f"Пинг {PING_URL}{endpoint}: {response.status}")
-                except:
-                    logging.warning(f"Не удалось пинговать {PING_URL}{endpoint}")
-                    
-        except Exception as e:
-            logging.error(f"Ошибка в системе пинга: {e}")
+if PING_TARGETS:
+    ping_targets = parse_targets(PING_TARGETS)
+else:
+    ping_targets = [
+        # Другой бот: случайная задержка от 1 до 17 минут, случайные страницы для имитации активности
+        PingTarget("other", PING_URL, ("/", "/status", "/health", "/ping"), 60, 1020),
+        # Самопинг: случайная задержка от 1 до 14 минут
+        PingTarget("self", f"http://localhost:{PORT}", ("/",), 60, 840),
+    ]
+keepalive = KeepAlive(ping_targets)
+
+# Разбор накопившихся за простой обновлений; переходы по страницам старых списков не нужны
+backlog = BacklogDrainer(
+    dp, ALLOWED_UPDATES, drop_callback=lambda callback_query: callbacks.action(callback_query.data) == PAGE,
+    pipeline=update_pipeline
+)
+
+def status_snapshot():
+    """Живые поля для /status"""
+    pending = {str(g): join_requests.count(g) for g in join_requests.groups()}
+    return {
+        "pending_requests": pending,
+        "pending_total": sum(pending.values()),
+        "open_joinlists": len(active_joinlist_messages),
+        "joinlist_edits": {"edited": live_list.edits, "skipped": live_list.skipped},
+        "updates": update_pipeline.stats(),
+        "outbound": outbox.stats(),
+        "notifications": join_digest.stats(),
+        "automod": auto_decisions.stats(),
+        "admission": admission.stats(),
+        "keepalive": keepalive.stats(),
+        "replica": cluster.replica_id,
+        "backlog": backlog.stats,
+    }
 
-async def self_ping():
-    """Самопинг бота"""
+async def compact_state():
+    """Периодическое сжатие базы состояния"""
     while True:
+        await asyncio.sleep(STATE_COMPACT_INTERVAL)
         try:
-            # Случайная задержка от 1 до 14 минут
-            delay = random.randint(60, 840)  # 60-840 секунд
-            await asyncio.sleep(delay)
-            
-            # Простой HTTP запрос к собственному серверу
-            async with aiohttp.ClientSession() as session:
-                try:
-                    async with session.get("http://localhost:10000/", timeout=5) as response:
-                        logging.info(f"Самопинг: {response.status}")
-                except:
-                    logging.warning("Самопинг неудачен")
-                    
+            await state_backend.compact()
+            logging.info("Хранилище состояния сжато")
         except Exception as e:
-            logging.error(f"Ошибка самопинга: {e}")
-
-# Flask приложение с анимацией Рик и Морти
-app = Flask(__name__)
-
-@app.route('/')
-def home():
-    """Главная страница с анимацией Рик и Морти"""
-    html_template = """
-    <!DOCTYPE html>
-    <html lang="ru">
-    <head>
-        <meta charset="UTF-8">
-        <meta name="viewport" content="width=device-width, initial-scale=1.0">
-        <title>Rick & Morty Portal Bot</title>
-        <style>
-            * {
-                margin: 0;
-                padding: 0;
-                box-sizing: border-box;
-            }
-            
-            body {
-                font-family: 'Arial', sans-serif;
-                background: linear-gradient(45deg, #1a1a2e, #16213e, #0f3460);
-                background-size: 600% 600%;
-                animation: gradientShift 8s ease infinite;
-                height: 100vh;
-                display: flex;
-                justify-content: center;
-                align-items: center;
-                overflow: hidden;
-            }
-            
-            @keyframes gradientShift {
-                0% { background-position: 0% 50%; }
-                50% { background-position: 100% 50%; }
-                100% { background-position: 0% 50%; }
-            }
-            
-            .container {
-                text-align: center;
-                z-index: 10;
-            }
-            
-            .portal {
-                width: 200px;
-                height: 200px;
-                border-radius: 50%;
-                background: radial-gradient(circle, #00ff41, #00b8ff, #9400ff);
-                animation: portalSpin 3s linear infinite, portalPulse 2s ease-in-out infinite alternate;
-                margin: 0 auto 30px;
-                position: relative;
-                box-shadow: 0 0 50px #00ff41, inset 0 0 50px #00b8ff;
-            }
-            
-            @keyframes portalSpin {
-                from { transform: rotate(0deg); }
-                to { transform: rotate(360deg); }
-            }
-            
-            @keyframes portalPulse {
-                from { transform: scale(1); box-shadow: 0 0 50px #00ff41, inset 0 0 50px #00b8ff; }
-                to { transform: scale(1.1); box-shadow: 0 0 80px #00ff41, inset 0 0 80px #00b8ff; }
-            }
-            
-            .characters {
-                position: absolute;
-                width: 100%;
-                height: 100%;
-                top: 0;
-                left: 0;
-            }
-            
-            .rick, .morty {
-                position: absolute;
-                width: 60px;
-                height: 80px;
-                background-size: contain;
-                background-repeat: no-repeat;
-                animation: jump 4s ease-in-out infinite;
-            }
-            
-            .rick {
-                background: linear-gradient(to bottom, #87ceeb 30%, #ffffff 30% 60%, #1e90ff 60%);
-                left: -80px;
-                top: 50%;
-                transform: translateY(-50%);
-                animation-delay: 0s;
-            }
-            
-            .morty {
-                background: linear-gradient(to bottom, #ffd700 30%, #ffffff 30% 60%, #1e90ff 60%);
-                right: -80px;
-                top: 50%;
-                transform: translateY(-50%);
-                animation-delay: 2s;
-            }
-            
-            @keyframes jump {
-                0%, 100% { transform: translateX(0) translateY(-50%) scale(1); }
-                25% { transform: translateX(150px) translateY(-80%) scale(1.2); }
-                50% { transform: translateX(300px) translateY(-50%) scale(1); }
-                75% { transform: translateX(150px) translateY(-80%) scale(1.2); }
-            }
-            
-            .title {
-                color: #00ff41;
-                font-size: 2.5em;
-                margin-bottom: 20px;
-                text-shadow: 0 0 20px #00ff41;
-                animation: textGlow 3s ease-in-out infinite alternate;
-            }
-            
-            @keyframes textGlow {
-                from { text-shadow: 0 0 20px #00ff41; }
-                to { text-shadow: 0 0 40px #00ff41, 0 0 60px #00ff41; }
-            }
-            
-            .status {
-                color: #ffffff;
-                font-size: 1.2em;
-                margin-top: 20px;
-                animation: fadeInOut 2s ease-in-out infinite;
-            }
-            
-            @keyframes fadeInOut {
-                0%, 100% { opacity: 0.7; }
-                50% { opacity: 1; }
-            }
-            
-            .particles {
-                position: absolute;
-                width: 100%;
-                height: 100%;
-                top: 0;
-                left: 0;
-                pointer-events: none;
-            }
-            
-            .particle {
-                position: absolute;
-                width: 4px;
-                height: 4px;
-                background: #00ff41;
-                border-radius: 50%;
-                animation: float 6s linear infinite;
-            }
-            
-            @keyframes float {
-                0% { 
-                    transform: translateY(100vh) scale(0); 
-                    opacity: 0;
-                }
-                10% {
-                    opacity: 1;
-                }
-                90% {
-                    opacity: 1;
-                }
-                100% { 
-                    transform: translateY(-100vh) scale(1); 
-                    opacity: 0;
-                }
-            }
-        </style>
-    </head>
-    <body>
-        <div class="particles" id="particles"></div>
-        
-        <div class="container">
-            <div class="portal">
-                <div class="characters">
-                    <div class="rick"></div>
-                    <div class="morty"></div>
-                </div>
-            </div>
-            <h1 class="title">RICK & MORTY BOT</h1>
-            <div class="status">✅ Портал активен! Бот работает...</div>
-        </div>
-        
-        <script>
-            // Создание частиц
-            function createParticle() {
-                const particle = document.createElement('div');
-                particle.className = 'particle';
-                particle.style.left = Math.random() * 100 + '%';
-                particle.style.animationDelay = Math.random() * 6 + 's';
-                particle.style.animationDuration = (Math.random() * 4 + 4) + 's';
-                
-                // Случайные цвета для частиц
-                const colors = ['#00ff41', '#00b8ff', '#9400ff', '#ffd700'];
-                particle.style.background = colors[Math.floor(Math.random() * colors.length)];
-                
-                document.getElementById('particles').appendChild(particle);
-                
-                // Удаляем частицу после анимации
-                setTimeout(() => {
-                    particle.remove();
-                }, 8000);
-            }
-            
-            // Создаем частицы каждые 200мс
-            setInterval(createParticle, 200);
-            
-            // Эффект при клике
-            document.addEventListener('click', (e) => {
-                for (let i = 0; i < 10; i++) {
-                    setTimeout(() => {
-                        const spark = document.createElement('div');
-                        spark.style.position = 'absolute';
-                        spark.style.left = e.clientX + 'px';
-                        spark.style.top = e.clientY + 'px';
-                        spark.style.width = '6px';
-                        spark.style.height = '6px';
-                        spark.style.background = '#00ff41';
-                        spark.style.borderRadius = '50%';
-                        spark.style.pointerEvents = 'none';
-                        spark.style.zIndex = '1000';
-                        
-                        const angle = (Math.PI * 2 * i) / 10;
-                        const velocity = 100;
-                        const vx = Math.cos(angle) * velocity;
-                        const vy = Math.sin(angle) * velocity;
-                        
-                        let opacity = 1;
-                        let x = 0;
-                        let y = 0;
-                        
-                        document.body.appendChild(spark);
-                        
-                        const animate = () => {
-                            x += vx * 0.02;
-                            y += vy * 0.02;
-                            opacity -= 0.02;
-                            
-                            spark.style.transform = `translate(${x}px, ${y}px)`;
-                            spark.style.opacity = opacity;
-                            
-                            if (opacity > 0) {
-                                requestAnimationFrame(animate);
-                            } else {
-                                spark.remove();
-                            }
-                        };
-                        
-                        animate();
-                    }, i * 20);
-                }
-            });
-        </script>
-    </body>
-    </html>
-    """
-    return render_template_string(html_template)
+            logging.error(f"Ошибка сжатия хранилища: {e}")
 
-@app.route('/status')
-def status():
-    """Статус бота"""
-    return {"status": "active", "timestamp": datetime.now().isoformat()}
+async def on_startup(dispatcher):
+    """Восстановление состояния после перезапуска"""
+    join_requests.restore(state_backend.load_requests())
+    # Списки и таймеры ведёт только реплика-владелец группы
+    active_joinlist_messages.update(
+        (group_id, message_id) for group_id, message_id in state_backend.load_list_messages().items()
+        if cluster.owns(group_id)
+    )
+    for group_id, message_id in active_joinlist_messages.items():
+        live_list.attach(group_id, message_id)
+    await state_backend.start()
+    await cluster.start()
+    outbox.start()
+    update_pipeline.start()
+    admission.start()
+    await audit_log.start()
+    
+    # Просроченные за время простоя удаления выполнятся сразу
+    scheduler.restore(row for row in state_backend.load_deadlines() if cluster.owns(row[1]))
+    scheduler.start()
+    
+    # Заранее загружаем админов, чтобы первое нажатие не ждало API
+    for group_id in groups.ids:
+        if cluster.owns(group_id):
+            admin_cache.refresh_soon(group_id)
+    if cluster.is_leader:
+        asyncio.create_task(compact_state())
+    await keepalive.start()
+    
+    # kill -HUP перечитывает настройки групп
+    if hasattr(signal, "SIGHUP"):
+        asyncio.get_running_loop().add_signal_handler(signal.SIGHUP, reload_groups)
+    logging.info(f"Восстановлено заявок: {sum(join_requests.count(g) for g in join_requests.groups())}")
 
-@app.route('/health')  
-def health():
-    """Проверка здоровья"""
-    return {"health": "ok"}
+async def on_shutdown(dispatcher):
+    """Сохранение несохранённых изменений перед остановкой"""
+    await keepalive.stop()
+    await update_pipeline.stop()
+    await join_digest.stop()
+    await auto_decisions.stop()
+    await admission.stop()
+    await live_list.stop()
+    await scheduler.stop()
+    await outbox.stop()
+    await cluster.stop()
+    await audit_log.close()
+    await state_backend.close()
 
-@app.route('/ping')
-def ping():
-    """Простой пинг"""
-    return "pong"
+async def on_startup_polling(dispatcher):
+    """Запуск в режиме polling: HTTP-сервер работает на том же цикле событий"""
+    await on_startup(dispatcher)
+    await start_server(create_app(
+        status_provider=status_snapshot, metrics_registry=registry, stats_provider=audit_log.summary,
+        private_token=STATS_TOKEN
+    ), PORT)
+    if STARTUP_BACKLOG == "drain":
+        await backlog.drain()
 
-def run_flask():
-    """Запуск Flask сервера"""
-    port = int(os.environ.get("PORT", 10000))
-    app.run(host="0.0.0.0", port=port, debug=False)
+async def run_webhook():
+    """Запуск в режиме webhook: обновления и служебные страницы обслуживает одно aiohttp-приложение"""
+    Bot.set_current(bot)
+    Dispatcher.set_current(dp)
+    await on_startup(dp)
+    runner = await start_server(create_app(
+        dp, WEBHOOK_PATH, WEBHOOK_SECRET, status_snapshot, registry, cluster, update_pipeline, audit_log.summary,
+        STATS_TOKEN
+    ), PORT)
+    # Webhook один на всех: его регистрирует (и разбирает очередь до него) только первая реплика
+    if cluster.is_leader:
+        if STARTUP_BACKLOG == "drain":
+            await backlog.drain()
+        await bot.set_webhook(
+            WEBHOOK_URL.rstrip("/") + WEBHOOK_PATH,
+            secret_token=WEBHOOK_SECRET,
+            allowed_updates=ALLOWED_UPDATES,
+            drop_pending_updates=STARTUP_BACKLOG == "skip"
+        )
+    try:
+        await asyncio.Event().wait()
+    finally:
+        await runner.cleanup()
+        await on_shutdown(dp)
+        await (await bot.get_session()).close()
 
 # Запуск всех компонентов
 if __name__ == '__main__':
-    # Запуск Flask в отдельном потоке
-    Thread(target=run_flask, daemon=True).start()
-    
-    # Запуск фоновых задач пинга
-    loop = asyncio.get_event_loop()
-    loop.create_task(ping_other_bot())
-    loop.create_task(self_ping())
-    
     # Запуск бота
-    logging.info("🚀 Бот запущен!")
-    executor.start_polling(dp, skip_updates=True)
+    logging.info(f"🚀 Бот запущен! Режим: {BOT_MODE}, реплика: {REPLICA_ID}")
+    if cluster.enabled and BOT_MODE != "webhook":
+        # getUpdates может опрашивать только один процесс
+        raise SystemExit("Несколько реплик (REPLICAS) работают только в режиме webhook")
+    if BOT_MODE == "webhook":
+        loop = asyncio.get_event_loop()
+        task = loop.create_task(run_webhook())
+        try:
+            loop.run_until_complete(task)
+        except KeyboardInterrupt:
+            # Даём корректно закрыть сервер и сохранить состояние
+            task.cancel()
+            loop.run_until_complete(asyncio.gather(task, return_exceptions=True))
+    else:
+        # Свой цикл getUpdates: следующая пачка запрашивается, когда очереди чатов приняли текущую
+        executor.start(
+            dp,
+            update_pipeline.poll(ALLOWED_UPDATES),
+            skip_updates=STARTUP_BACKLOG == "skip",
+            on_startup=on_startup_polling,
+            on_shutdown=on_shutdown
+        )
@@ -0,0 +1,183 @@
+"""Метрики в формате Prometheus (text exposition) без внешних зависимостей
+
+Запись метрики на горячем пути - это поиск в словаре по кортежу меток и
+сложение, без блокировок (всё работает в одном цикле событий). Значения,
+которые и так известны в других местах (размер очередей, число заявок),
+не дублируются, а вычисляются при чтении /metrics через CallbackMetric.
+"""
+import functools
+import time
+from bisect import bisect_left
+
+from aiogram import Bot
+
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def _format_labels(names, values, extra=""):
+    pairs = [f'{name}="{value}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class Counter:
+    """Монотонно растущий счётчик"""
+    kind = "counter"
+
+    def __init__(self, name, help, labels=()):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self.values = {}
+
+    def inc(self, *labels, amount=1):
+        self.values[labels] = self.values.get(labels, 0) + amount
+
+    def samples(self):
+        for labels, value in self.values.items():
+            yield self.name + _format_labels(self.labels, labels), value
+
+
+class Gauge(Counter):
+    """Значение, которое может расти и уменьшаться"""
+    kind = "gauge"
+
+    def set(self, value, *labels):
+        self.values[labels] = value
+
+
+class CallbackMetric:
+    """Метрика, значения которой вычисляются при чтении: collect() -> {метки: значение}"""
+
+    def __init__(self, name, help, labels, collect, kind="gauge"):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self.kind = kind
+        self.collect = collect
+
+    def samples(self):
+        for labels, value in self.collect().items():
+            if not isinstance(labels, tuple):
+                labels = (labels,)
+            yield self.name + _format_labels(self.labels, labels), value
+
+
+class _Timer:
+    __slots__ = ("histogram", "labels", "started")
+
+    def __init__(self, histogram, labels):
+        self.histogram = histogram
+        self.labels = labels
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+
+    def __exit__(self, *exc):
+        self.histogram.observe(time.perf_counter() - self.started, *self.labels)
+
+
+class Histogram:
+    """Гистограмма с фиксированными корзинами"""
+    kind = "histogram"
+
+    def __init__(self, name, help, labels=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self.buckets = buckets
+        self.values = {}    # метки -> [счётчики по корзинам..., сумма, количество]
+
+    def observe(self, value, *labels):
+        data = self.values.get(labels)
+        if data is None:
+            data = self.values[labels] = [0] * (len(self.buckets) + 1) + [0.0, 0]
+        # Счётчик корзины без накопления; накопленные суммы считаются при выводе
+        data[bisect_left(self.buckets, value)] += 1
+        data[-2] += value
+        data[-1] += 1
+
+    def time(self, *labels):
+        """Контекстный менеджер: замер длительности блока"""
+        return _Timer(self, labels)
+
+    def timed(self, *labels):
+        """Декоратор асинхронной функции: замер длительности каждого вызова"""
+        def decorator(func):
+            @functools.wraps(func)
+            async def wrapper(*args, **kwargs):
+                started = time.perf_counter()
+                try:
+                    return await func(*args, **kwargs)
+                finally:
+                    self.observe(time.perf_counter() - started, *labels)
+            return wrapper
+        return decorator
+
+    def samples(self):
+        for labels, data in self.values.items():
+            cumulative = 0
+            for bound, count in zip(self.buckets, data):
+                cumulative += count
+                yield self.name + "_bucket" + _format_labels(self.labels, labels, f'le="{bound}"'), cumulative
+            yield self.name + "_bucket" + _format_labels(self.labels, labels, 'le="+Inf"'), data[-1]
+            yield self.name + "_sum" + _format_labels(self.labels, labels), data[-2]
+            yield self.name + "_count" + _format_labels(self.labels, labels), data[-1]
+
+
+class Registry:
+    """Набор метрик и их вывод в текстовом формате Prometheus"""
+
+    def __init__(self):
+        self.metrics = []
+
+    def register(self, metric):
+        self.metrics.append(metric)
+        return metric
+
+    def counter(self, name, help, labels=()):
+        return self.register(Counter(name, help, labels))
+
+    def gauge(self, name, help, labels=()):
+        return self.register(Gauge(name, help, labels))
+
+    def histogram(self, name, help, labels=(), buckets=DEFAULT_BUCKETS):
+        return self.register(Histogram(name, help, labels, buckets))
+
+    def callback(self, name, help, labels, collect, kind="gauge"):
+        return self.register(CallbackMetric(name, help, labels, collect, kind))
+
+    def render(self):
+        lines = []
+        for metric in self.metrics:
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            for sample, value in metric.samples():
+                lines.append(f"{sample} {value}")
+        return "\n".join(lines) + "\n"
+
+
+# Общий набор метрик бота
+registry = Registry()
+
+API_SECONDS = registry.histogram("bot_api_request_seconds", "Длительность вызовов Bot API", ("method",))
+API_ERRORS = registry.counter("bot_api_errors_total", "Ошибки вызовов Bot API", ("method",))
+
+
+class MetricsBot(Bot):
+    """Bot, замеряющий каждый вызов Bot API.
+
+    Все методы aiogram проходят через Bot.request, поэтому достаточно
+    переопределить его одного.
+    """
+
+    async def request(self, method, data=None, files=None, **kwargs):
+        started = time.perf_counter()
+        try:
+            return await super().request(method, data, files, **kwargs)
+        except Exception:
+            API_ERRORS.inc(method)
+            raise
+        finally:
+            API_SECONDS.observe(time.perf_counter() - started, method)
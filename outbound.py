@@ -0,0 +1,241 @@
+"""Единая очередь исходящих запросов к Bot API с ограничением скорости"""
+import asyncio
+import logging
+import time
+from collections import deque
+
+from aiogram.utils.exceptions import NetworkError, RetryAfter
+
+# Классы приоритета: меньше - важнее
+PRIORITY_CALLBACK = 0       # Ответы на нажатия кнопок (Telegram ждёт их не дольше ~15 с)
+PRIORITY_NOTIFICATION = 1   # Списки, уведомления, статусы
+PRIORITY_LOG = 2            # Записи в закрытую ветку
+
+
+class TokenBucket:
+    """Маркерная корзина: rate маркеров в секунду, не больше capacity"""
+
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self.paused_until = 0.0
+
+    def delay(self, now):
+        """Сколько секунд ждать до появления маркера (0 - можно отправлять)"""
+        if now < self.paused_until:
+            return self.paused_until - now
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens >= 1:
+            return 0.0
+        return (1 - self.tokens) / self.rate
+
+    def consume(self):
+        self.tokens -= 1
+
+    def pause(self, now, seconds):
+        """Не выдавать маркеры seconds секунд (flood wait от Telegram)"""
+        self.paused_until = max(self.paused_until, now + seconds)
+
+
+class _Job:
+    __slots__ = ("priority", "chat_id", "func", "args", "kwargs", "future", "created", "attempts")
+
+    def __init__(self, priority, chat_id, func, args, kwargs, future):
+        self.priority = priority
+        self.chat_id = chat_id
+        self.func = func
+        self.args = args
+        self.kwargs = kwargs
+        self.future = future
+        self.created = time.monotonic()
+        self.attempts = 0
+
+
+def _consume_exception(future):
+    # Ошибки уже записаны в лог очередью; не даём asyncio ругаться на них
+    if not future.cancelled():
+        future.exception()
+
+
+class OutboundQueue:
+    """Все отправки, правки и удаления сообщений проходят через эту очередь.
+
+    Запрос уходит, когда есть маркеры и в глобальной корзине, и в корзине
+    его чата. Среди готовых выбирается самый приоритетный; внутри одного
+    приоритета чаты обслуживаются по кругу, поэтому упёршийся в лимит чат
+    не задерживает остальные. RetryAfter приостанавливает корзину чата и
+    возвращает запрос в начало очереди.
+    """
+
+    def __init__(self, bot, global_rate=30.0, global_burst=30, chat_rate=20 / 60, chat_burst=20,
+                 max_in_flight=16, retries=3):
+        self.bot = bot
+        self.chat_rate = chat_rate
+        self.chat_burst = chat_burst
+        self.retries = retries
+        self._global = TokenBucket(global_rate, global_burst)
+        self._chats = {}
+        # По словарю на приоритет: chat_id -> очередь заявок (порядок ключей - очередь обхода)
+        self._queues = [{} for _ in range(PRIORITY_LOG + 1)]
+        self._wakeup = asyncio.Event()
+        self._slots = asyncio.Semaphore(max_in_flight)
+        self._task = None
+
+        # Счётчики для мониторинга
+        self.submitted = 0
+        self.sent = 0
+        self.failed = 0
+        self.retried = 0
+        self.latency_total = 0.0
+        self.latency_max = 0.0
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            self._task = None
+
+    def depth(self):
+        """Количество запросов в очереди по приоритетам"""
+        return [sum(len(q) for q in queues.values()) for queues in self._queues]
+
+    def stats(self):
+        done = self.sent + self.failed
+        return {
+            "queue_depth": self.depth(),
+            "submitted": self.submitted,
+            "sent": self.sent,
+            "failed": self.failed,
+            "retried": self.retried,
+            "latency_avg": self.latency_total / done if done else 0.0,
+            "latency_max": self.latency_max,
+        }
+
+    def submit(self, priority, chat_id, func, *args, **kwargs):
+        """Поставить вызов func(*args, **kwargs) в очередь. Возвращает future с результатом.
+
+        chat_id=None - запрос не привязан к чату (учитывается только общий лимит).
+        """
+        future = asyncio.get_running_loop().create_future()
+        future.add_done_callback(_consume_exception)
+        job = _Job(priority, chat_id, func, args, kwargs, future)
+        self._queues[priority].setdefault(chat_id, deque()).append(job)
+        self.submitted += 1
+        self._wakeup.set()
+        return future
+
+    # Обёртки над методами Bot API
+
+    def send_message(self, chat_id, text, priority=PRIORITY_NOTIFICATION, **kwargs):
+        return self.submit(priority, chat_id, self.bot.send_message, chat_id, text, **kwargs)
+
+    def edit_message_text(self, text, chat_id, message_id, priority=PRIORITY_NOTIFICATION, **kwargs):
+        return self.submit(priority, chat_id, self.bot.edit_message_text, text, chat_id, message_id, **kwargs)
+
+    def edit_message_reply_markup(self, chat_id, message_id, reply_markup=None, priority=PRIORITY_NOTIFICATION):
+        return self.submit(priority, chat_id, self.bot.edit_message_reply_markup,
+                           chat_id, message_id, reply_markup=reply_markup)
+
+    def delete_message(self, chat_id, message_id, priority=PRIORITY_NOTIFICATION):
+        return self.submit(priority, chat_id, self.bot.delete_message, chat_id, message_id)
+
+    def answer_callback(self, callback_query, text=None, show_alert=None):
+        return self.submit(PRIORITY_CALLBACK, None, self.bot.answer_callback_query,
+                           callback_query.id, text, show_alert)
+
+    def _bucket(self, chat_id):
+        if chat_id is None:
+            return None
+        bucket = self._chats.get(chat_id)
+        if bucket is None:
+            bucket = self._chats[chat_id] = TokenBucket(self.chat_rate, self.chat_burst)
+        return bucket
+
+    def _next_job(self, now):
+        """Выбрать готовый к отправке запрос или вернуть время ожидания"""
+        wait = self._global.delay(now)
+        if wait:
+            return None, wait
+
+        wait = None
+        for queues in self._queues:
+            for chat_id in list(queues):
+                bucket = self._bucket(chat_id)
+                delay = bucket.delay(now) if bucket else 0.0
+                if delay:
+                    wait = delay if wait is None else min(wait, delay)
+                    continue
+
+                jobs = queues.pop(chat_id)
+                job = jobs.popleft()
+                if jobs:
+                    # Чат уходит в конец круга
+                    queues[chat_id] = jobs
+                if bucket:
+                    bucket.consume()
+                self._global.consume()
+                return job, 0.0
+        return None, wait
+
+    async def _run(self):
+        while True:
+            job, wait = self._next_job(time.monotonic())
+            if job is None:
+                self._wakeup.clear()
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), wait)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+
+            await self._slots.acquire()
+            asyncio.create_task(self._execute(job))
+
+    async def _execute(self, job):
+        try:
+            result = await job.func(*job.args, **job.kwargs)
+        except (RetryAfter, NetworkError) as e:
+            self._retry(job, e)
+        except Exception as e:
+            self._finish(job, exception=e)
+        else:
+            self._finish(job, result=result)
+        finally:
+            self._slots.release()
+
+    def _retry(self, job, error):
+        job.attempts += 1
+        if job.attempts > self.retries:
+            self._finish(job, exception=error)
+            return
+
+        self.retried += 1
+        delay = error.timeout if isinstance(error, RetryAfter) else 2 ** job.attempts
+        bucket = self._bucket(job.chat_id) or self._global
+        bucket.pause(time.monotonic(), delay)
+        logging.warning(f"Повтор запроса в чат {job.chat_id} через {delay} с: {error}")
+
+        # Возвращаем запрос в начало очереди его чата
+        queues = self._queues[job.priority]
+        queues.setdefault(job.chat_id, deque()).appendleft(job)
+        self._wakeup.set()
+
+    def _finish(self, job, result=None, exception=None):
+        latency = time.monotonic() - job.created
+        self.latency_total += latency
+        self.latency_max = max(self.latency_max, latency)
+        if exception is not None:
+            self.failed += 1
+            logging.error(f"Не удалось выполнить запрос в чат {job.chat_id}: {exception}")
+            if not job.future.done():
+                job.future.set_exception(exception)
+        else:
+            self.sent += 1
+            if not job.future.done():
+                job.future.set_result(result)
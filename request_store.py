@@ -0,0 +1,213 @@
+"""Хранилище заявок на вступление с индексом по user_id"""
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+
+
+@dataclass
+class JoinRequest:
+    """Одна заявка на вступление"""
+    user_id: int
+    username: str
+    ordinal: int        # Стабильный порядковый номер для отображения (#1, #2, ...)
+    created_at: float   # Время поступления (unix timestamp)
+
+
+class GroupRequests:
+    """Заявки одной группы в порядке поступления.
+
+    OrderedDict даёт O(1) вставку, поиск и удаление по user_id и при этом
+    хранит порядок вставки, поэтому самые старые заявки всегда в начале.
+    version увеличивается при каждом изменении (для инвалидации кэшей).
+    """
+
+    def __init__(self):
+        self._items = OrderedDict()
+        self._next_ordinal = 1
+        self.version = 0
+
+    def __len__(self):
+        return len(self._items)
+
+    def __contains__(self, user_id):
+        return user_id in self._items
+
+    def __iter__(self):
+        return iter(self._items.values())
+
+    def get(self, user_id):
+        return self._items.get(user_id)
+
+    def add(self, user_id, username, created_at):
+        entry = JoinRequest(user_id, username, self._next_ordinal, created_at)
+        self._next_ordinal += 1
+        self._items[user_id] = entry
+        self.version += 1
+        return entry
+
+    def restore(self, entry):
+        """Вернуть сохранённую заявку, сохранив её порядковый номер и место по времени поступления"""
+        items = self._items
+        items.pop(entry.user_id, None)
+        last = next(reversed(items.values()), None)
+        items[entry.user_id] = entry
+        if last is not None and last.created_at > entry.created_at:
+            # expire() и вытеснение смотрят только на начало списка: заявка встаёт перед более новыми
+            if self.oldest().created_at >= entry.created_at:
+                items.move_to_end(entry.user_id, last=False)
+            else:
+                for newer in [item for item in items.values() if item.created_at > entry.created_at]:
+                    items.move_to_end(newer.user_id)
+        self._next_ordinal = max(self._next_ordinal, entry.ordinal + 1)
+        self.version += 1
+
+    def pop(self, user_id):
+        entry = self._items.pop(user_id, None)
+        if entry:
+            self.version += 1
+        if not self._items:
+            # Список опустел - нумерация снова начинается с #1
+            self._next_ordinal = 1
+        return entry
+
+    def oldest(self):
+        """Самая старая заявка группы (или None)"""
+        return next(iter(self._items.values()), None)
+
+
+class RequestStore:
+    """Заявки всех групп с ограничением по времени жизни и размеру.
+
+    ttl - время жизни заявки в секундах (0 - без ограничения),
+    max_size - максимум заявок на группу (0 - без ограничения).
+    При переполнении вытесняются самые старые заявки.
+    Все изменения передаются в backend (см. storage.py), а on_change(group_id)
+    вызывается после каждого изменения (например, для обновления списков).
+    on_drop(group_id, entry, reason) вызывается для заявок, удалённых без
+    решения админа: reason - "expire" (истёк ttl) или "evict" (вытеснена).
+    """
+
+    def __init__(self, ttl=0, max_size=0, clock=time.time, backend=None, on_change=None, on_drop=None):
+        self.ttl = ttl
+        self.max_size = max_size
+        self.backend = backend
+        self.on_change = on_change
+        self.on_drop = on_drop
+        self._clock = clock
+        self._groups = {}
+
+    def restore(self, rows):
+        """Загрузить заявки из хранилища: rows - (group_id, JoinRequest) по времени поступления"""
+        for group_id, entry in rows:
+            self._group(group_id).restore(entry)
+
+    def _group(self, group_id):
+        group = self._groups.get(group_id)
+        if group is None:
+            group = self._groups[group_id] = GroupRequests()
+        return group
+
+    def add(self, group_id, user_id, username, created_at=None):
+        """Добавить заявку. Возвращает None, если заявка от пользователя уже есть."""
+        self.expire(group_id)
+        group = self._group(group_id)
+        if user_id in group:
+            if self.backend and self.backend.shared:
+                # Заявку могла забрать другая реплика (решение при недоступном владельце): строки
+                # в базе уже нет, а здесь она ещё в памяти. Повторная заявка возвращает строку
+                self.backend.save_request(group_id, group.get(user_id))
+            return None
+
+        entry = group.add(user_id, username, self._clock() if created_at is None else created_at)
+        if self.backend:
+            self.backend.save_request(group_id, entry)
+        if self.on_change:
+            self.on_change(group_id)
+
+        # Вытесняем самые старые заявки при переполнении
+        if self.max_size:
+            while len(group) > self.max_size:
+                evicted = self._pop(group_id, group, group.oldest().user_id)
+                if self.on_drop:
+                    self.on_drop(group_id, evicted, "evict")
+        return entry
+
+    def _pop(self, group_id, group, user_id):
+        entry = group.pop(user_id)
+        if entry:
+            if self.backend:
+                self.backend.delete_request(group_id, user_id)
+            if self.on_change:
+                self.on_change(group_id)
+        return entry
+
+    def get(self, group_id, user_id):
+        """Найти заявку пользователя в группе"""
+        self.expire(group_id)
+        group = self._groups.get(group_id)
+        return group.get(user_id) if group else None
+
+    def remove(self, group_id, user_id):
+        """Удалить заявку. Возвращает удалённую заявку или None."""
+        group = self._groups.get(group_id)
+        return self._pop(group_id, group, user_id) if group else None
+
+    async def claim(self, group_id, user_id):
+        """Забрать заявку для решения (принять или игнорировать).
+
+        Возвращает заявку и удаляет её; если заявки уже нет (её забрал
+        параллельный обработчик или другая реплика) - None. Локальное удаление
+        происходит до первого await, поэтому двойное нажатие в одной реплике
+        отсекается сразу; с общим хранилищем (backend.shared) победителя
+        между репликами определяет claim_request.
+        """
+        self.expire(group_id)
+        group = self._groups.get(group_id)
+        if not (self.backend and self.backend.shared):
+            return self._pop(group_id, group, user_id) if group else None
+
+        if group and group.pop(user_id) and self.on_change:
+            self.on_change(group_id)
+        return await self.backend.claim_request(group_id, user_id)
+
+    def release(self, group_id, entry):
+        """Вернуть забранную заявку, если решение выполнить не удалось"""
+        self._group(group_id).restore(entry)
+        if self.backend:
+            self.backend.save_request(group_id, entry)
+        if self.on_change:
+            self.on_change(group_id)
+
+    def list(self, group_id):
+        """Актуальные заявки группы в порядке поступления"""
+        self.expire(group_id)
+        group = self._groups.get(group_id)
+        return list(group) if group else []
+
+    def version(self, group_id):
+        """Номер версии заявок группы: меняется при любом изменении"""
+        group = self._groups.get(group_id)
+        return group.version if group else 0
+
+    def count(self, group_id):
+        group = self._groups.get(group_id)
+        return len(group) if group else 0
+
+    def groups(self):
+        return list(self._groups)
+
+    def expire(self, group_id, now=None):
+        """Удалить просроченные заявки группы. Возвращает список удалённых."""
+        group = self._groups.get(group_id)
+        if not self.ttl or not group:
+            return []
+
+        deadline = (self._clock() if now is None else now) - self.ttl
+        expired = []
+        # Заявки упорядочены по времени, поэтому проверяем только начало
+        while len(group) and group.oldest().created_at <= deadline:
+            expired.append(self._pop(group_id, group, group.oldest().user_id))
+        if self.on_drop:
+            for entry in expired:
+                self.on_drop(group_id, entry, "expire")
+        return expired
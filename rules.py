@@ -0,0 +1,240 @@
+"""Автомодерация заявок: правила групп, скомпилированные заранее, и пакетное выполнение решений"""
+import asyncio
+import logging
+import re
+import time
+from bisect import bisect_right
+from collections import deque
+
+APPROVE = "approve"
+DECLINE = "decline"
+QUEUE = "queue"     # Решение за админом (заявка попадает в /joinlist)
+ACTIONS = (APPROVE, DECLINE, QUEUE)
+
+
+def _action(value, name):
+    if value is None:
+        return None
+    if value not in ACTIONS:
+        raise ValueError(f"Правило {name}: неизвестное действие {value!r} (допустимо: {', '.join(ACTIONS)})")
+    return value
+
+
+def _patterns(values, name):
+    """Шаблоны или слова правила: пустое значение совпало бы с любым ником"""
+    values = list(values)
+    if any(not value for value in values):
+        raise ValueError(f"Правило {name}: пустое значение совпадает с любым ником")
+    return values
+
+
+def _trie_pattern(words):
+    """Регулярка из префиксного дерева слов: общие начала проверяются один раз"""
+    trie = {}
+    for word in words:
+        node = trie
+        for char in word.lower():
+            node = node.setdefault(char, {})
+        node[""] = {}
+
+    def build(node):
+        branches = [re.escape(char) + build(child) for char, child in sorted(node.items()) if char]
+        if not branches:
+            return ""
+        body = branches[0] if len(branches) == 1 else "(?:" + "|".join(branches) + ")"
+        if "" in node:
+            return f"(?:{body})?"
+        return body
+
+    return build(trie)
+
+
+def _combined(patterns, words=()):
+    """Один регулярный вызов вместо цикла по шаблонам; words - слова, которые ищутся через дерево"""
+    parts = [f"(?:{pattern})" for pattern in patterns]
+    if words:
+        parts.append(_trie_pattern(words))
+    if not parts:
+        return None
+    return re.compile("|".join(parts), re.IGNORECASE)
+
+
+class GroupRules:
+    """Правила одной группы, скомпилированные в множества, регулярку и таблицу диапазонов.
+
+    Порядок проверки (срабатывает первое подходящее правило): allow_ids,
+    deny_ids, deny_usernames и deny_words, no_username, id_ranges,
+    allow_usernames, default. Во время волны (больше rate.max заявок за
+    rate.window секунд) всё, что не отклонено, получает действие
+    rate.action - например, queue отключает автопринятие до конца волны.
+    Результат - (действие, правило) или (None, None), если ни одно правило
+    не сработало.
+    """
+
+    def __init__(self, allow_ids=(), deny_ids=(), allow_usernames=(), deny_usernames=(), deny_words=(),
+                 no_username=None, id_ranges=(), rate=None, default=None, clock=time.monotonic):
+        self.allow_ids = frozenset(int(user_id) for user_id in allow_ids)
+        self.deny_ids = frozenset(int(user_id) for user_id in deny_ids)
+        self.allow_re = _combined(_patterns(allow_usernames, "allow_usernames"))
+        # deny_words - подстроки ника без регулярных выражений (сотни слов стоят как одно)
+        self.deny_re = _combined(_patterns(deny_usernames, "deny_usernames"), _patterns(deny_words, "deny_words"))
+        self.no_username = _action(no_username, "no_username")
+        self.default = _action(default, "default")
+        self._clock = clock
+
+        # Диапазоны ID: начала по возрастанию для bisect, пересечения запрещены
+        ranges = sorted((int(r.get("min", 0)), int(r.get("max", 2 ** 63)), _action(r["action"], "id_ranges"))
+                        for r in id_ranges)
+        for (_, previous_max, _), (start, _, _) in zip(ranges, ranges[1:]):
+            if start <= previous_max:
+                raise ValueError("Правило id_ranges: диапазоны пересекаются")
+        self._range_starts = [start for start, _, _ in ranges]
+        self._ranges = ranges
+
+        rate = rate or {}
+        self.rate_max = int(rate.get("max", 0))
+        self.rate_window = float(rate.get("window", 60))
+        self.rate_action = _action(rate.get("action", QUEUE), "rate")
+        self._recent = deque()
+
+    def _rate_exceeded(self):
+        now = self._clock()
+        recent = self._recent
+        recent.append(now)
+        while recent[0] <= now - self.rate_window:
+            recent.popleft()
+        return len(recent) > self.rate_max
+
+    def evaluate(self, user_id, username):
+        """Решение по заявке; username - ник без @ или None"""
+        if user_id in self.allow_ids:
+            return APPROVE, "allow_ids"
+        if user_id in self.deny_ids:
+            return DECLINE, "deny_ids"
+        action, rule = self._match(user_id, username)
+        # Заявки считаются все, включая отклонённые: волна спама - тоже волна
+        if self.rate_max and self._rate_exceeded() and action != DECLINE:
+            return self.rate_action, "rate"
+        return action, rule
+
+    def _match(self, user_id, username):
+        if username:
+            if self.deny_re is not None and self.deny_re.search(username):
+                return DECLINE, "deny_usernames"
+        elif self.no_username:
+            return self.no_username, "no_username"
+        if self._ranges:
+            index = bisect_right(self._range_starts, user_id) - 1
+            if index >= 0 and user_id <= self._ranges[index][1]:
+                return self._ranges[index][2], "id_ranges"
+        if username and self.allow_re is not None and self.allow_re.search(username):
+            return APPROVE, "allow_usernames"
+        if self.default:
+            return self.default, "default"
+        return None, None
+
+
+def compile_rules(registry, clock=time.monotonic):
+    """Правила всех групп реестра (config.py): {group_id: GroupRules} для групп с extra["rules"].
+
+    Ошибки в правилах (неизвестное действие, неверная регулярка, пустой
+    шаблон) поднимаются здесь, при загрузке настроек, а не при первой заявке.
+    """
+    compiled = {}
+    for group_id, settings in registry.groups.items():
+        rules = settings.extra.get("rules")
+        if rules:
+            try:
+                compiled[group_id] = GroupRules(**rules, clock=clock)
+            except (TypeError, ValueError, re.error) as e:
+                raise ValueError(f"Ошибка в правилах группы {group_id}: {e}") from e
+    return compiled
+
+
+class AutoDecisions:
+    """Выполнение автоматических решений пачками.
+
+    add() только запоминает решение; через window секунд (или сразу при
+    накоплении batch_size решений) пачка группы выполняется через
+    executor (bulk.py) с его ограничением параллельности и паузами при
+    flood wait. Повторная заявка того же пользователя в пачке
+    схлопывается. Если решений группы, ждущих выполнения, уже max_pending
+    (выполнение не успевает за потоком заявок), новые не принимаются -
+    add() возвращает False, и что делать с заявкой, решает вызывающий.
+    После пачки вызывается on_done(group_id, выполненные, [(решение,
+    ошибка), ...]), где решение - (user_id, username, действие, правило).
+    """
+
+    def __init__(self, executor, approve, decline, on_done=None, window=1.0, batch_size=100, max_pending=10000):
+        self.executor = executor
+        self.approve = approve      # approve(chat_id=..., user_id=...)
+        self.decline = decline
+        self.on_done = on_done
+        self.window = window
+        self.batch_size = batch_size
+        self.max_pending = max_pending
+        self._pending = {}          # group_id -> {user_id: решение}
+        self._wakeups = {}
+        self._tasks = {}
+        self.approved = 0
+        self.declined = 0
+        self.failed = 0
+        self.dropped = 0
+
+    def add(self, group_id, user_id, username, action, rule):
+        pending = self._pending.setdefault(group_id, {})
+        if self.max_pending and len(pending) >= self.max_pending and user_id not in pending:
+            self.dropped += 1
+            return False
+        pending[user_id] = (user_id, username, action, rule)
+        if group_id not in self._tasks:
+            self._wakeups[group_id] = asyncio.Event()
+            self._tasks[group_id] = asyncio.create_task(self._run(group_id))
+        elif len(pending) >= self.batch_size:
+            self._wakeups[group_id].set()
+        return True
+
+    async def _run(self, group_id):
+        try:
+            while self._pending.get(group_id):
+                try:
+                    await asyncio.wait_for(self._wakeups[group_id].wait(), self.window)
+                except asyncio.TimeoutError:
+                    pass
+                self._wakeups[group_id].clear()
+                batch = list(self._pending.pop(group_id, {}).values())
+                if batch:
+                    await self._execute(group_id, batch)
+        except Exception:
+            logging.exception(f"Ошибка автомодерации в группе {group_id}")
+        finally:
+            # Между проверкой очереди и удалением задачи нет await - новое решение не потеряется
+            del self._tasks[group_id]
+            del self._wakeups[group_id]
+            self._pending.pop(group_id, None)
+
+    async def _execute(self, group_id, batch):
+        async def decide(decision):
+            user_id, _, action, _ = decision
+            method = self.approve if action == APPROVE else self.decline
+            await method(chat_id=group_id, user_id=user_id)
+
+        done, failed = await self.executor.run(batch, decide)
+        self.approved += sum(1 for decision in done if decision[2] == APPROVE)
+        self.declined += sum(1 for decision in done if decision[2] == DECLINE)
+        self.failed += len(failed)
+        if self.on_done:
+            await self.on_done(group_id, done, failed)
+
+    async def stop(self):
+        for task in list(self._tasks.values()):
+            task.cancel()
+
+    def stats(self):
+        return {
+            "pending": sum(len(pending) for pending in self._pending.values()),
+            "approved": self.approved,
+            "declined": self.declined,
+            "failed": self.failed,
+            "dropped": self.dropped,
+        }
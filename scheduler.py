@@ -0,0 +1,118 @@
+"""Планировщик отложенных действий на одной min-куче сроков"""
+import asyncio
+import heapq
+import itertools
+import logging
+import time
+
+
+class DeadlineScheduler:
+    """Отложенные действия с ключом (kind, ident) и одна задача-будильник.
+
+    Повторное планирование того же ключа заменяет срок, отмена удаляет его.
+    Устаревшие записи в куче не удаляются сразу, а пропускаются при
+    извлечении (сверкой с актуальной записью в словаре), поэтому обе
+    операции - O(log n). Сроки сохраняются в backend и после перезапуска
+    загружаются снова; просроченные срабатывают сразу при старте.
+    """
+
+    def __init__(self, backend=None, clock=time.time):
+        self.backend = backend
+        self._clock = clock
+        self._handlers = {}     # kind -> async callback(ident, payload)
+        self._entries = {}      # (kind, ident) -> (deadline, seq, payload)
+        self._heap = []         # (deadline, seq, kind, ident)
+        self._seq = itertools.count()
+        self._wakeup = asyncio.Event()
+        self._task = None
+        self._running = set()
+
+    def register(self, kind, callback):
+        """Назначить обработчик срабатывания для вида действий"""
+        self._handlers[kind] = callback
+
+    def __len__(self):
+        return len(self._entries)
+
+    def schedule(self, kind, ident, delay, payload=None):
+        """Запланировать (или перепланировать) действие через delay секунд"""
+        self._push(kind, ident, self._clock() + delay, payload)
+        if self.backend:
+            self.backend.save_deadline(kind, ident, self._entries[(kind, ident)][0], payload)
+
+    def _push(self, kind, ident, deadline, payload):
+        seq = next(self._seq)
+        self._entries[(kind, ident)] = (deadline, seq, payload)
+        heapq.heappush(self._heap, (deadline, seq, kind, ident))
+        if len(self._heap) > 2 * len(self._entries) + 64:
+            # Слишком много устаревших записей - пересобираем кучу из актуальных
+            self._heap = [(d, s, k, i) for (k, i), (d, s, _) in self._entries.items()]
+            heapq.heapify(self._heap)
+        self._wakeup.set()
+
+    def cancel(self, kind, ident):
+        """Отменить действие. Возвращает True, если оно было запланировано."""
+        if self._entries.pop((kind, ident), None) is None:
+            return False
+        if self.backend:
+            self.backend.delete_deadline(kind, ident)
+        return True
+
+    def restore(self, rows):
+        """Загрузить сохранённые сроки: rows - (kind, ident, deadline, payload)"""
+        for kind, ident, deadline, payload in rows:
+            self._push(kind, ident, deadline, payload)
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            self._task = None
+
+    def _pop_due(self, now):
+        """Извлечь одно наступившее действие или вернуть время до ближайшего"""
+        heap = self._heap
+        while heap:
+            deadline, seq, kind, ident = heap[0]
+            entry = self._entries.get((kind, ident))
+            if entry is None or entry[1] != seq:
+                # Запись отменена или перепланирована
+                heapq.heappop(heap)
+                continue
+            if deadline > now:
+                return None, deadline - now
+            heapq.heappop(heap)
+            del self._entries[(kind, ident)]
+            return (kind, ident, entry[2]), 0.0
+        return None, None
+
+    async def _run(self):
+        while True:
+            due, wait = self._pop_due(self._clock())
+            if due is None:
+                self._wakeup.clear()
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), wait)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+
+            kind, ident, payload = due
+            if self.backend:
+                self.backend.delete_deadline(kind, ident)
+            task = asyncio.create_task(self._fire(kind, ident, payload))
+            self._running.add(task)
+            task.add_done_callback(self._running.discard)
+
+    async def _fire(self, kind, ident, payload):
+        handler = self._handlers.get(kind)
+        if handler is None:
+            logging.warning(f"Нет обработчика для отложенного действия {kind}")
+            return
+        try:
+            await handler(ident, payload)
+        except Exception as e:
+            logging.error(f"Ошибка отложенного действия {kind}:{ident}: {e}")
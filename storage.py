@@ -0,0 +1,299 @@
+"""Постоянное хранилище состояния бота (заявки, активные списки, отложенные действия)"""
+import asyncio
+import json
+import logging
+import sqlite3
+from concurrent.futures import ThreadPoolExecutor
+
+from request_store import JoinRequest
+
+
+class StateBackend:
+    """Интерфейс хранилища состояния. Базовая реализация ничего не сохраняет.
+
+    Хранит заявки (request_store.py), активные списки и сроки отложенных
+    действий (scheduler.py). shared=True - хранилище общее для нескольких
+    реплик, и решение по заявке нужно закреплять через claim_request.
+    """
+    shared = False
+
+    def load_requests(self):
+        """Все сохранённые заявки: список (group_id, JoinRequest) по времени поступления"""
+        return []
+
+    def load_list_messages(self):
+        """Сохранённые активные списки: {group_id: message_id}"""
+        return {}
+
+    def load_deadlines(self):
+        """Сохранённые сроки отложенных действий: список (kind, ident, deadline, payload)"""
+        return []
+
+    def save_request(self, group_id, entry):
+        pass
+
+    def delete_request(self, group_id, user_id):
+        pass
+
+    async def claim_request(self, group_id, user_id):
+        """Атомарно удалить заявку, если она ещё есть (compare-and-delete).
+
+        Возвращает удалённую JoinRequest или None, если заявку уже забрал
+        кто-то другой. Из нескольких одновременных вызовов успешен ровно один.
+        """
+        return None
+
+    def save_list_message(self, group_id, message_id):
+        pass
+
+    def delete_list_message(self, group_id):
+        pass
+
+    def save_deadline(self, kind, ident, deadline, payload):
+        pass
+
+    def delete_deadline(self, kind, ident):
+        pass
+
+    async def start(self):
+        pass
+
+    async def flush(self):
+        pass
+
+    async def compact(self):
+        pass
+
+    async def close(self):
+        pass
+
+
+class MemoryBackend(StateBackend):
+    """Состояние только в памяти процесса (теряется при перезапуске)"""
+
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS join_requests (
+    group_id   INTEGER NOT NULL,
+    user_id    INTEGER NOT NULL,
+    username   TEXT    NOT NULL,
+    ordinal    INTEGER NOT NULL,
+    created_at REAL    NOT NULL,
+    PRIMARY KEY (group_id, user_id)
+) WITHOUT ROWID;
+
+CREATE TABLE IF NOT EXISTS list_messages (
+    group_id   INTEGER PRIMARY KEY,
+    message_id INTEGER NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS deadlines (
+    kind     TEXT    NOT NULL,
+    ident    INTEGER NOT NULL,
+    deadline REAL    NOT NULL,
+    payload  TEXT,
+    PRIMARY KEY (kind, ident)
+) WITHOUT ROWID;
+"""
+
+SQL_SAVE_REQUEST = "INSERT OR REPLACE INTO join_requests VALUES (?, ?, ?, ?, ?)"
+SQL_DELETE_REQUEST = "DELETE FROM join_requests WHERE group_id = ? AND user_id = ?"
+SQL_SELECT_REQUEST = ("SELECT user_id, username, ordinal, created_at FROM join_requests "
+                      "WHERE group_id = ? AND user_id = ?")
+SQL_SAVE_LIST = "INSERT OR REPLACE INTO list_messages VALUES (?, ?)"
+SQL_DELETE_LIST = "DELETE FROM list_messages WHERE group_id = ?"
+SQL_SAVE_DEADLINE = "INSERT OR REPLACE INTO deadlines VALUES (?, ?, ?, ?)"
+SQL_DELETE_DEADLINE = "DELETE FROM deadlines WHERE kind = ? AND ident = ?"
+
+
+class SQLiteBackend(StateBackend):
+    """SQLite в режиме WAL с групповой фиксацией.
+
+    Обработчики только ставят операции в очередь (без ожидания диска),
+    а фоновая задача раз в flush_interval секунд (или при накоплении
+    batch_size операций) записывает их одной транзакцией в отдельном потоке.
+    С group_commit=False каждая операция фиксируется сразу.
+
+    С shared=True один файл базы используют несколько реплик на одной
+    машине (или на общем томе): claim_request выполняется отдельной
+    транзакцией BEGIN IMMEDIATE, которая сериализуется между процессами.
+    """
+
+    def __init__(self, path, flush_interval=0.05, batch_size=500, group_commit=True, shared=False, retry_delay=1.0):
+        self.path = path
+        self.flush_interval = flush_interval
+        self.retry_delay = retry_delay
+        self.batch_size = batch_size
+        self.group_commit = group_commit
+        self.shared = shared
+
+        # timeout - сколько ждать, пока запись держит другой процесс
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None, timeout=30)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(SCHEMA)
+
+        # Один поток гарантирует последовательную запись в соединение
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="sqlite")
+        self._pending = []
+        self._dirty = asyncio.Event()
+        self._full = asyncio.Event()
+        self._task = None
+
+    def load_requests(self):
+        rows = self._conn.execute(
+            "SELECT group_id, user_id, username, ordinal, created_at "
+            "FROM join_requests ORDER BY created_at, ordinal"
+        )
+        return [(group_id, JoinRequest(user_id, username, ordinal, created_at))
+                for group_id, user_id, username, ordinal, created_at in rows]
+
+    def load_list_messages(self):
+        return dict(self._conn.execute("SELECT group_id, message_id FROM list_messages"))
+
+    def load_deadlines(self):
+        rows = self._conn.execute("SELECT kind, ident, deadline, payload FROM deadlines")
+        return [(kind, ident, deadline, json.loads(payload)) for kind, ident, deadline, payload in rows]
+
+    def save_request(self, group_id, entry):
+        self._enqueue(SQL_SAVE_REQUEST, (group_id, entry.user_id, entry.username,
+                                         entry.ordinal, entry.created_at))
+
+    def delete_request(self, group_id, user_id):
+        self._enqueue(SQL_DELETE_REQUEST, (group_id, user_id))
+
+    async def claim_request(self, group_id, user_id):
+        # Сначала записываем накопленные операции: поток записи выполняет задания
+        # по очереди, поэтому claim увидит все сохранённые до него заявки
+        await self.flush()
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, self._claim, group_id, user_id)
+
+    def _claim(self, group_id, user_id):
+        conn = self._conn
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            row = conn.execute(SQL_SELECT_REQUEST, (group_id, user_id)).fetchone()
+            if row:
+                conn.execute(SQL_DELETE_REQUEST, (group_id, user_id))
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        return JoinRequest(*row) if row else None
+
+    def save_list_message(self, group_id, message_id):
+        self._enqueue(SQL_SAVE_LIST, (group_id, message_id))
+
+    def delete_list_message(self, group_id):
+        self._enqueue(SQL_DELETE_LIST, (group_id,))
+
+    def save_deadline(self, kind, ident, deadline, payload):
+        self._enqueue(SQL_SAVE_DEADLINE, (kind, ident, deadline, json.dumps(payload)))
+
+    def delete_deadline(self, kind, ident):
+        self._enqueue(SQL_DELETE_DEADLINE, (kind, ident))
+
+    def _enqueue(self, sql, params):
+        if not self.group_commit:
+            self._write([(sql, params)])
+            return
+
+        self._pending.append((sql, params))
+        self._dirty.set()
+        if len(self._pending) >= self.batch_size:
+            self._full.set()
+
+    def _write(self, ops):
+        """Записать операции одной транзакцией (выполняется в потоке записи)"""
+        conn = self._conn
+        # IMMEDIATE сразу берёт блокировку записи: без него параллельная запись
+        # другой реплики может прервать транзакцию ошибкой вместо ожидания
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            # Подряд идущие одинаковые запросы отправляем через executemany
+            start = 0
+            while start < len(ops):
+                sql = ops[start][0]
+                end = start
+                while end < len(ops) and ops[end][0] == sql:
+                    end += 1
+                conn.executemany(sql, [params for _, params in ops[start:end]])
+                start = end
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
+    async def start(self):
+        if self.group_commit and self._task is None:
+            self._task = asyncio.create_task(self._flush_loop())
+
+    async def _flush_loop(self):
+        while True:
+            await self._dirty.wait()
+            try:
+                # Копим операции flush_interval секунд или до заполнения пакета
+                await asyncio.wait_for(self._full.wait(), self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            try:
+                await self.flush()
+            except Exception as e:
+                # Операции вернулись в очередь; повторяем после паузы, а не каждые flush_interval
+                logging.error(f"Ошибка записи состояния в SQLite, повтор через {self.retry_delay} с: {e}")
+                await asyncio.sleep(self.retry_delay)
+
+    async def flush(self):
+        """Записать все накопленные операции.
+
+        Если транзакция не прошла (например, база занята другой репликой
+        дольше timeout), операции возвращаются в начало очереди и будут
+        записаны следующей попыткой.
+        """
+        if not self._pending:
+            return
+        ops, self._pending = self._pending, []
+        self._dirty.clear()
+        self._full.clear()
+        loop = asyncio.get_running_loop()
+        try:
+            await loop.run_in_executor(self._executor, self._write, ops)
+        except BaseException:
+            # Перед ними - в том же порядке, после них - то, что успело накопиться за время записи
+            self._pending[:0] = ops
+            self._dirty.set()
+            raise
+
+    def _compact(self):
+        self._conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+        self._conn.execute("VACUUM")
+        self._conn.execute("PRAGMA optimize")
+
+    async def compact(self):
+        """Сбросить WAL в основной файл и освободить место (VACUUM)"""
+        await self.flush()
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(self._executor, self._compact)
+
+    async def close(self):
+        if self._task:
+            self._task.cancel()
+            self._task = None
+        await self.flush()
+        self._executor.shutdown(wait=True)
+        self._conn.close()
+
+
+def create_backend(kind, path, shared=False):
+    """Создать хранилище по имени из настроек (sqlite или memory).
+
+    shared=True - хранилище для нескольких реплик (memory для этого не подходит).
+    """
+    if kind == "memory":
+        if shared:
+            raise ValueError("Хранилище memory нельзя разделить между репликами, используйте sqlite")
+        return MemoryBackend()
+    if kind == "sqlite":
+        return SQLiteBackend(path, shared=shared)
+    raise ValueError(f"Неизвестный тип хранилища: {kind}")
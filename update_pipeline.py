@@ -0,0 +1,199 @@
+"""Обработка входящих обновлений: по порядку внутри чата, параллельно между чатами"""
+import asyncio
+import logging
+from collections import deque
+
+from aiogram import Bot, Dispatcher
+
+from logs import set_context
+
+
+def chat_key(update):
+    """Чат, к которому относится обновление (None - не привязано к чату)"""
+    for event in (update.message, update.edited_message, update.channel_post,
+                  update.chat_join_request, update.chat_member, update.my_chat_member):
+        if event:
+            return event.chat.id
+    if update.callback_query:
+        query = update.callback_query
+        return query.message.chat.id if query.message else query.from_user.id
+    return None
+
+
+def user_key(update):
+    """Пользователь, от которого пришло обновление (или None)"""
+    for event in (update.message, update.edited_message, update.callback_query,
+                  update.chat_join_request, update.chat_member, update.my_chat_member):
+        if event and event.from_user:
+            return event.from_user.id
+    return None
+
+
+class _ChatQueue:
+    def __init__(self):
+        self.items = deque()    # (update, future)
+        self.space = asyncio.Event()
+
+
+class UpdatePipeline:
+    """Очереди обновлений по чатам и общий пул из workers обработчиков.
+
+    Обновления одного чата обрабатываются строго по одному и в порядке
+    поступления, поэтому обработчики группы не гоняются друг с другом за
+    заявки и сообщения со списком между await. Разные чаты обрабатываются
+    параллельно и по кругу: медленная или заваленная группа занимает не
+    больше одного обработчика.
+
+    Притормаживается приём только того чата, чья очередь переполнена:
+    в webhook submit ждёт, пока в очереди чата станет не больше max_depth
+    обновлений (Telegram придержит следующие запросы, остальные чаты
+    доставляются по другим соединениям). getUpdates отдаёт обновления
+    всех чатов одной пачкой, поэтому poll обновления переполненного чата
+    не ждёт, а держит в его очереди; следующую пачку он не запрашивает,
+    только пока во всех очередях вместе больше max_total обновлений.
+    """
+
+    def __init__(self, dispatcher, workers=32, max_depth=100, max_total=0):
+        self.dispatcher = dispatcher
+        self.workers = workers
+        self.max_depth = max_depth
+        self.max_total = max_total or workers * max_depth
+        self._size = 0                  # Обновлений во всех очередях (вместе с обрабатываемыми)
+        self._room = asyncio.Event()    # Установлено, пока _size не больше max_total
+        self._room.set()
+        self._chats = {}                # chat_id -> _ChatQueue
+        self._ready = asyncio.Queue()   # чаты с обновлениями, ждущие обработчика
+        self._tasks = []
+        self._poll_task = None
+
+        # Счётчики для мониторинга
+        self.busy = 0
+        self.processed = 0
+        self.failed = 0
+        self.throttled = 0
+        self.paused = 0
+
+    def start(self):
+        if not self._tasks:
+            self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+
+    async def stop(self):
+        if self._poll_task:
+            self._poll_task.cancel()
+            self._poll_task = None
+        for task in self._tasks:
+            task.cancel()
+        self._tasks = []
+
+    def depth(self):
+        """Обновлений в очереди (без тех, что уже обрабатываются)"""
+        # Обновление, которое сейчас обрабатывается, остаётся в начале очереди своего чата
+        return self._size - self.busy
+
+    def stats(self):
+        return {
+            "queued": self.depth(),
+            "chats": len(self._chats),
+            "busy": self.busy,
+            "workers": self.workers,
+            "processed": self.processed,
+            "failed": self.failed,
+            "throttled": self.throttled,
+            "paused": self.paused,
+        }
+
+    def put(self, update):
+        """Поставить обновление в очередь его чата без ожидания. Возвращает (future с результатом, очередь чата)."""
+        key = chat_key(update)
+        chat = self._chats.get(key)
+        if chat is None:
+            chat = self._chats[key] = _ChatQueue()
+        future = asyncio.get_running_loop().create_future()
+        chat.items.append((update, future))
+        self._size += 1
+        if self._size > self.max_total:
+            self._room.clear()
+        if len(chat.items) == 1:
+            self._ready.put_nowait(key)
+        if len(chat.items) > self.max_depth:
+            self.throttled += 1
+        return future, chat
+
+    async def submit(self, update):
+        """Поставить обновление в очередь его чата. Возвращает future с результатом (True - без ошибок).
+
+        Место в очереди занимается сразу, поэтому порядок не зависит от
+        ожидания; ждёт submit только при переполненной очереди этого чата.
+        """
+        future, chat = self.put(update)
+        while len(chat.items) > self.max_depth:
+            chat.space.clear()
+            await chat.space.wait()
+        return future
+
+    async def process(self, update):
+        """Обработать обновление в общем порядке и дождаться результата"""
+        return await (await self.submit(update))
+
+    async def _worker(self):
+        Bot.set_current(self.dispatcher.bot)
+        Dispatcher.set_current(self.dispatcher)
+        while True:
+            key = await self._ready.get()
+            chat = self._chats[key]
+            update, future = chat.items[0]
+            # Все записи лога при обработке получат поля обновления
+            set_context(update=update.update_id, chat=key, user=user_key(update))
+            self.busy += 1
+            try:
+                # Как в polling aiogram: через updates_handler, чтобы работали middleware уровня update
+                await self.dispatcher.process_updates([update])
+                ok = True
+            except Exception as e:
+                logging.error(f"Ошибка обработки обновления {update.update_id}: {e}")
+                ok = False
+            finally:
+                self.busy -= 1
+
+            # Обновление снимается с очереди только после обработки: пока оно
+            # в начале очереди, второй обработчик этот чат не возьмёт
+            chat.items.popleft()
+            self._size -= 1
+            if self._size <= self.max_total:
+                self._room.set()
+            self.processed += 1
+            self.failed += not ok
+            if not future.done():
+                future.set_result(ok)
+            if len(chat.items) <= self.max_depth:
+                chat.space.set()
+            if chat.items:
+                # В конец очереди готовых - остальные чаты не ждут, пока этот разберётся
+                self._ready.put_nowait(key)
+            else:
+                del self._chats[key]
+
+    async def poll(self, allowed_updates=None, timeout=20, limit=100, error_sleep=5):
+        """Long polling через getUpdates; следующая пачка запрашивается, когда в очередях есть место"""
+        self._poll_task = asyncio.current_task()
+        bot = self.dispatcher.bot
+        offset = None
+        logging.info("Запущен polling")
+        while True:
+            try:
+                updates = await bot.get_updates(offset=offset, limit=limit, timeout=timeout,
+                                                allowed_updates=allowed_updates)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logging.error(f"Ошибка получения обновлений: {e}")
+                await asyncio.sleep(error_sleep)
+                continue
+            for update in updates:
+                self.put(update)
+            if updates:
+                offset = updates[-1].update_id + 1
+            if not self._room.is_set():
+                # Ждём общего места, а не очереди одного чата: заваленная группа не держит остальные
+                self.paused += 1
+                await self._room.wait()
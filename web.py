@@ -0,0 +1,513 @@
+"""HTTP-сервер бота: страница статуса, пинги и приём webhook от Telegram"""
+import asyncio
+import gzip
+import hashlib
+import hmac
+import json
+import logging
+import time
+from datetime import datetime
+from email.utils import formatdate, parsedate_to_datetime
+
+from aiohttp import web
+from aiogram import Bot, Dispatcher, types
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# Страница с анимацией Рик и Морти
+HOME_PAGE = """
+    <!DOCTYPE html>
+    <html lang="ru">
+    <head>
+        <meta charset="UTF-8">
+        <meta name="viewport" content="width=device-width, initial-scale=1.0">
+        <title>Rick & Morty Portal Bot</title>
+        <style>
+            * {
+                margin: 0;
+                padding: 0;
+                box-sizing: border-box;
+            }
+            
+            body {
+                font-family: 'Arial', sans-serif;
+                background: linear-gradient(45deg, #1a1a2e, #16213e, #0f3460);
+                background-size: 600% 600%;
+                animation: gradientShift 8s ease infinite;
+                height: 100vh;
+                display: flex;
+                justify-content: center;
+                align-items: center;
+                overflow: hidden;
+            }
+            
+            @keyframes gradientShift {
+                0% { background-position: 0% 50%; }
+                50% { background-position: 100% 50%; }
+                100% { background-position: 0% 50%; }
+            }
+            
+            .container {
+                text-align: center;
+                z-index: 10;
+            }
+            
+            .portal {
+                width: 200px;
+                height: 200px;
+                border-radius: 50%;
+                background: radial-gradient(circle, #00ff41, #00b8ff, #9400ff);
+                animation: portalSpin 3s linear infinite, portalPulse 2s ease-in-out infinite alternate;
+                margin: 0 auto 30px;
+                position: relative;
+                box-shadow: 0 0 50px #00ff41, inset 0 0 50px #00b8ff;
+            }
+            
+            @keyframes portalSpin {
+                from { transform: rotate(0deg); }
+                to { transform: rotate(360deg); }
+            }
+            
+            @keyframes portalPulse {
+                from { transform: scale(1); box-shadow: 0 0 50px #00ff41, inset 0 0 50px #00b8ff; }
+                to { transform: scale(1.1); box-shadow: 0 0 80px #00ff41, inset 0 0 80px #00b8ff; }
+            }
+            
+            .characters {
+                position: absolute;
+                width: 100%;
+                height: 100%;
+                top: 0;
+                left: 0;
+            }
+            
+            .rick, .morty {
+                position: absolute;
+                width: 60px;
+                height: 80px;
+                background-size: contain;
+                background-repeat: no-repeat;
+                animation: jump 4s ease-in-out infinite;
+            }
+            
+            .rick {
+                background: linear-gradient(to bottom, #87ceeb 30%, #ffffff 30% 60%, #1e90ff 60%);
+                left: -80px;
+                top: 50%;
+                transform: translateY(-50%);
+                animation-delay: 0s;
+            }
+            
+            .morty {
+                background: linear-gradient(to bottom, #ffd700 30%, #ffffff 30% 60%, #1e90ff 60%);
+                right: -80px;
+                top: 50%;
+                transform: translateY(-50%);
+                animation-delay: 2s;
+            }
+            
+            @keyframes jump {
+                0%, 100% { transform: translateX(0) translateY(-50%) scale(1); }
+                25% { transform: translateX(150px) translateY(-80%) scale(1.2); }
+                50% { transform: translateX(300px) translateY(-50%) scale(1); }
+                75% { transform: translateX(150px) translateY(-80%) scale(1.2); }
+            }
+            
+            .title {
+                color: #00ff41;
+                font-size: 2.5em;
+                margin-bottom: 20px;
+                text-shadow: 0 0 20px #00ff41;
+                animation: textGlow 3s ease-in-out infinite alternate;
+            }
+            
+            @keyframes textGlow {
+                from { text-shadow: 0 0 20px #00ff41; }
+                to { text-shadow: 0 0 40px #00ff41, 0 0 60px #00ff41; }
+            }
+            
+            .status {
+                color: #ffffff;
+                font-size: 1.2em;
+                margin-top: 20px;
+                animation: fadeInOut 2s ease-in-out infinite;
+            }
+            
+            @keyframes fadeInOut {
+                0%, 100% { opacity: 0.7; }
+                50% { opacity: 1; }
+            }
+            
+            .particles {
+                position: absolute;
+                width: 100%;
+                height: 100%;
+                top: 0;
+                left: 0;
+                pointer-events: none;
+            }
+            
+            .particle {
+                position: absolute;
+                width: 4px;
+                height: 4px;
+                background: #00ff41;
+                border-radius: 50%;
+                animation: float 6s linear infinite;
+            }
+            
+            @keyframes float {
+                0% { 
+                    transform: translateY(100vh) scale(0); 
+                    opacity: 0;
+                }
+                10% {
+                    opacity: 1;
+                }
+                90% {
+                    opacity: 1;
+                }
+                100% { 
+                    transform: translateY(-100vh) scale(1); 
+                    opacity: 0;
+                }
+            }
+        </style>
+    </head>
+    <body>
+        <div class="particles" id="particles"></div>
+        
+        <div class="container">
+            <div class="portal">
+                <div class="characters">
+                    <div class="rick"></div>
+                    <div class="morty"></div>
+                </div>
+            </div>
+            <h1 class="title">RICK & MORTY BOT</h1>
+            <div class="status">✅ Портал активен! Бот работает...</div>
+        </div>
+        
+        <script>
+            // Создание частиц
+            function createParticle() {
+                const particle = document.createElement('div');
+                particle.className = 'particle';
+                particle.style.left = Math.random() * 100 + '%';
+                particle.style.animationDelay = Math.random() * 6 + 's';
+                particle.style.animationDuration = (Math.random() * 4 + 4) + 's';
+                
+                // Случайные цвета для частиц
+                const colors = ['#00ff41', '#00b8ff', '#9400ff', '#ffd700'];
+                particle.style.background = colors[Math.floor(Math.random() * colors.length)];
+                
+                document.getElementById('particles').appendChild(particle);
+                
+                // Удаляем частицу после анимации
+                setTimeout(() => {
+                    particle.remove();
+                }, 8000);
+            }
+            
+            // Создаем частицы каждые 200мс
+            setInterval(createParticle, 200);
+            
+            // Эффект при клике
+            document.addEventListener('click', (e) => {
+                for (let i = 0; i < 10; i++) {
+                    setTimeout(() => {
+                        const spark = document.createElement('div');
+                        spark.style.position = 'absolute';
+                        spark.style.left = e.clientX + 'px';
+                        spark.style.top = e.clientY + 'px';
+                        spark.style.width = '6px';
+                        spark.style.height = '6px';
+                        spark.style.background = '#00ff41';
+                        spark.style.borderRadius = '50%';
+                        spark.style.pointerEvents = 'none';
+                        spark.style.zIndex = '1000';
+                        
+                        const angle = (Math.PI * 2 * i) / 10;
+                        const velocity = 100;
+                        const vx = Math.cos(angle) * velocity;
+                        const vy = Math.sin(angle) * velocity;
+                        
+                        let opacity = 1;
+                        let x = 0;
+                        let y = 0;
+                        
+                        document.body.appendChild(spark);
+                        
+                        const animate = () => {
+                            x += vx * 0.02;
+                            y += vy * 0.02;
+                            opacity -= 0.02;
+                            
+                            spark.style.transform = `translate(${x}px, ${y}px)`;
+                            spark.style.opacity = opacity;
+                            
+                            if (opacity > 0) {
+                                requestAnimationFrame(animate);
+                            } else {
+                                spark.remove();
+                            }
+                        };
+                        
+                        animate();
+                    }, i * 20);
+                }
+            });
+        </script>
+    </body>
+    </html>
+    """
+
+SECRET_HEADER = "X-Telegram-Bot-Api-Secret-Token"
+
+
+def derive_webhook_secret(bot_token):
+    """Секрет webhook из токена бота (если WEBHOOK_SECRET не задан): одинаковый у всех реплик.
+    Telegram допускает в нём только A-Z, a-z, 0-9, _ и -, поэтому hex."""
+    return hashlib.sha256(f"webhook:{bot_token}".encode()).hexdigest()
+
+HEALTH_BODY = b'{"health": "ok"}'
+
+
+class StaticPage:
+    """Статическая страница, подготовленная один раз при запуске.
+
+    Тело хранится сразу в сжатом виде (gzip и, если установлен пакет
+    brotli, br), с ETag и Last-Modified, поэтому на запрос остаётся только
+    выбрать готовые байты или ответить 304.
+    """
+
+    def __init__(self, html, content_type="text/html", max_age=86400):
+        # Отступы шаблона не нужны браузеру - убираем их до сжатия
+        body = "\n".join(line.strip() for line in html.splitlines() if line.strip()).encode()
+        self.content_type = content_type
+        self.bodies = {"identity": body, "gzip": gzip.compress(body, 9)}
+        if brotli is not None:
+            self.bodies["br"] = brotli.compress(body)
+        self.etag = '"' + hashlib.sha1(body).hexdigest()[:16] + '"'
+        self.modified = int(time.time())
+        self.headers = {
+            "ETag": self.etag,
+            "Last-Modified": formatdate(self.modified, usegmt=True),
+            "Cache-Control": f"public, max-age={max_age}",
+            "Vary": "Accept-Encoding",
+        }
+
+    def not_modified(self, request):
+        if_none_match = request.headers.get("If-None-Match")
+        if if_none_match is not None:
+            return if_none_match.strip() == "*" or self.etag in if_none_match
+        if_modified_since = request.headers.get("If-Modified-Since")
+        if if_modified_since:
+            try:
+                return parsedate_to_datetime(if_modified_since).timestamp() >= self.modified
+            except (TypeError, ValueError):
+                return False
+        return False
+
+    async def __call__(self, request):
+        if self.not_modified(request):
+            return web.Response(status=304, headers=self.headers)
+
+        accept = request.headers.get("Accept-Encoding", "")
+        encoding = "identity"
+        if "br" in accept and "br" in self.bodies:
+            encoding = "br"
+        elif "gzip" in accept:
+            encoding = "gzip"
+
+        headers = dict(self.headers)
+        if encoding != "identity":
+            headers["Content-Encoding"] = encoding
+        return web.Response(body=self.bodies[encoding], content_type=self.content_type, headers=headers)
+
+
+class StatusSnapshot:
+    """JSON для /status, собираемый фоновой задачей раз в interval секунд.
+
+    Обработчик запроса только отдаёт последние готовые байты: ссылка на них
+    заменяется целиком, так что никаких блокировок не нужно.
+    """
+
+    def __init__(self, provider=None, interval=1.0):
+        self.provider = provider    # provider() -> dict с живыми полями
+        self.interval = interval
+        self.started = time.time()
+        self.body = b""
+        self._task = None
+        self.refresh()
+
+    def refresh(self):
+        data = {"status": "active", "timestamp": datetime.now().isoformat(),
+                "uptime": round(time.time() - self.started)}
+        if self.provider is not None:
+            try:
+                data.update(self.provider())
+            except Exception as e:
+                logging.warning(f"Ошибка сбора статуса: {e}")
+        self.body = json.dumps(data, ensure_ascii=False).encode()
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            self.refresh()
+
+    async def start(self, app):
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self, app):
+        if self._task:
+            self._task.cancel()
+
+    async def __call__(self, request):
+        return web.Response(body=self.body, content_type="application/json",
+                            headers={"Cache-Control": "no-cache"})
+
+
+LOCAL_ADDRESSES = frozenset({"127.0.0.1", "::1"})
+
+
+def private(handler, token=None):
+    """Закрыть служебный маршрут: с token - только с заголовком Authorization: Bearer <token>,
+    без него - только запросы с этой же машины. Порт открыт наружу для пингов и статуса,
+    а /stats и /metrics отдают ID и ники админов."""
+    async def guarded(request):
+        if token:
+            allowed = hmac.compare_digest(request.headers.get("Authorization", ""), f"Bearer {token}")
+        else:
+            allowed = request.remote in LOCAL_ADDRESSES
+        if not allowed:
+            return web.Response(status=403)
+        return await handler(request)
+    return guarded
+
+
+async def health(request):
+    """Проверка здоровья"""
+    return web.Response(body=HEALTH_BODY, content_type="application/json")
+
+
+async def ping(request):
+    """Простой пинг"""
+    return web.Response(text="pong")
+
+
+class WebhookHandler:
+    """Приём обновлений от Telegram.
+
+    Секретный токен обязателен и сверяется с заголовком запроса: без него
+    любой, кто дотянется до порта, мог бы прислать нажатие кнопки от
+    имени админа или заголовок пересылки между репликами. Затем Telegram
+    сразу получает 200, а обновление обрабатывается отдельной задачей -
+    медленный обработчик не задерживает доставку следующих обновлений.
+    С pipeline (см. update_pipeline.py) обновление ставится в очередь
+    своего чата, и ответ задерживается только при её переполнении.
+    С cluster (см. cluster.py) обновления чужих групп пересылаются
+    реплике-владельцу.
+    """
+
+    def __init__(self, dispatcher, secret, cluster=None, pipeline=None):
+        if not secret:
+            raise ValueError("Webhook без секрета принимает поддельные обновления")
+        self.dispatcher = dispatcher
+        self.secret = secret
+        self.cluster = cluster
+        self.pipeline = pipeline
+        self._tasks = set()
+
+    async def __call__(self, request):
+        if not hmac.compare_digest(request.headers.get(SECRET_HEADER, ""), self.secret):
+            return web.Response(status=403)
+
+        try:
+            raw = await request.json()
+            update = types.Update(**raw)
+        except Exception as e:
+            logging.warning(f"Некорректное обновление webhook: {e}")
+            return web.Response(status=400)
+
+        owner = self.cluster.route(raw, request.headers) if self.cluster else None
+        if owner is None and self.pipeline is not None:
+            # Ждём только места в очереди чата - так Telegram притормаживает доставку
+            await self.pipeline.submit(update)
+            return web.Response()
+        if owner is None:
+            task = asyncio.create_task(self.process(update))
+        else:
+            task = asyncio.create_task(self.forward(raw, update, owner))
+        # Держим ссылку на задачу, чтобы её не собрал сборщик мусора
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        return web.Response()
+
+    async def forward(self, raw, update, owner):
+        """Переслать обновление владельцу группы; если он недоступен - обработать здесь"""
+        if not await self.cluster.forward(raw, owner):
+            await self.process(update)
+
+    async def process(self, update):
+        if self.pipeline is not None:
+            await self.pipeline.submit(update)
+            return
+        Bot.set_current(self.dispatcher.bot)
+        Dispatcher.set_current(self.dispatcher)
+        try:
+            # Как в polling: через updates_handler, чтобы работали middleware уровня update
+            await self.dispatcher.process_updates([update])
+        except Exception as e:
+            logging.error(f"Ошибка обработки обновления {update.update_id}: {e}")
+
+
+# Главная страница готовится один раз при импорте модуля
+home = StaticPage(HOME_PAGE)
+
+
+def create_app(dispatcher=None, webhook_path=None, secret=None, status_provider=None, metrics_registry=None,
+               cluster=None, pipeline=None, stats_provider=None, private_token=None):
+    """aiohttp-приложение: служебные страницы и, если задан webhook_path, приём обновлений.
+
+    status_provider() возвращает живые поля для /status (заявки, очередь и т.п.),
+    metrics_registry - метрики для /metrics (см. metrics.py),
+    cluster - распределение групп между репликами (см. cluster.py),
+    pipeline - очереди обновлений по чатам (см. update_pipeline.py),
+    stats_provider() - статистика модерации для /stats (см. audit.py),
+    private_token - токен доступа к /metrics и /stats (без него - только с localhost).
+    """
+    status = StatusSnapshot(status_provider)
+    app = web.Application()
+    app.on_startup.append(status.start)
+    app.on_cleanup.append(status.stop)
+    app.router.add_get("/", home)
+    app.router.add_get("/status", status)
+    app.router.add_get("/health", health)
+    app.router.add_get("/ping", ping)
+    if metrics_registry is not None:
+        async def metrics(request):
+            return web.Response(body=metrics_registry.render().encode(), headers={
+                "Content-Type": "text/plain; version=0.0.4; charset=utf-8",
+                "Cache-Control": "no-cache",
+            })
+        app.router.add_get("/metrics", private(metrics, private_token))
+    if stats_provider is not None:
+        async def stats(request):
+            return web.Response(body=json.dumps(stats_provider(), ensure_ascii=False).encode(),
+                                content_type="application/json", headers={"Cache-Control": "no-cache"})
+        app.router.add_get("/stats", private(stats, private_token))
+    if webhook_path:
+        app.router.add_post(webhook_path, WebhookHandler(dispatcher, secret, cluster, pipeline))
+    return app
+
+
+async def start_server(app, port):
+    """Запустить приложение на текущем цикле событий. Возвращает runner для остановки."""
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    await web.TCPSite(runner, "0.0.0.0", port).start()
+    return runner